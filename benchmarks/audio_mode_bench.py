@@ -0,0 +1,97 @@
+"""CPU cost per stream of the "transcode" and "passthrough" audio modes.
+
+Each mode's audio source is drained as fast as possible, the way discord.py's
+voice player reads it (one 20ms frame per ``read()``), and the CPU time spent
+by both this process and the ffmpeg child is reported per minute of audio:
+
+* transcode: an mp3 decoded to PCM by ``FFmpegPCMAudio`` and encoded back to
+  Opus by discord.py's encoder, which is what playback did before.
+* passthrough: an Opus file whose packets ``FFmpegOpusAudio`` copies as-is.
+
+Needs ffmpeg on PATH and libopus loadable by discord.py (both are installed in
+the Docker image).
+
+    python -m benchmarks.audio_mode_bench [--seconds 120] [--streams 4]
+"""
+
+import argparse
+import os
+import resource
+import subprocess
+import tempfile
+import time
+
+import discord
+
+
+def make_fixture(directory, seconds, codec, ext):
+    path = os.path.join(directory, f"fixture.{ext}")
+    subprocess.run(
+        [
+            "ffmpeg", "-loglevel", "error", "-y",
+            "-f", "lavfi", "-i", f"sine=frequency=440:duration={seconds}",
+            "-ac", "2", "-ar", "48000", "-c:a", codec, path,
+        ],
+        check=True,
+    )
+    return path
+
+
+def drain_transcode(path):
+    encoder = discord.opus.Encoder()
+    source = discord.FFmpegPCMAudio(path)
+    try:
+        while data := source.read():
+            encoder.encode(data, encoder.SAMPLES_PER_FRAME)
+    finally:
+        source.cleanup()
+
+
+def drain_passthrough(path):
+    source = discord.FFmpegOpusAudio(path, codec="copy")
+    try:
+        while source.read():
+            pass
+    finally:
+        source.cleanup()
+
+
+def cpu_seconds():
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+def measure(drain, path, streams):
+    cpu_before, wall_before = cpu_seconds(), time.perf_counter()
+    for _ in range(streams):
+        drain(path)
+    return cpu_seconds() - cpu_before, time.perf_counter() - wall_before
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=int, default=120)
+    parser.add_argument("--streams", type=int, default=4)
+    args = parser.parse_args()
+
+    if not discord.opus.is_loaded():
+        discord.opus._load_default()
+
+    with tempfile.TemporaryDirectory(prefix="dz-bench-") as directory:
+        mp3 = make_fixture(directory, args.seconds, "libmp3lame", "mp3")
+        opus = make_fixture(directory, args.seconds, "libopus", "opus")
+        minutes = args.seconds * args.streams / 60
+        for name, drain, path in (
+            ("transcode", drain_transcode, mp3),
+            ("passthrough", drain_passthrough, opus),
+        ):
+            cpu, wall = measure(drain, path, args.streams)
+            print(
+                f"{name:>11}: {cpu / minutes:6.2f} CPU-s per audio minute "
+                f"({cpu:.2f}s CPU, {wall:.2f}s wall for {args.streams} streams)"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Memory and set-up time of N idle guild states: per-guild vs shared clients.
+
+Builds ``--guilds`` idle :class:`GuildMusicState` objects (nothing queued,
+never connected) twice and reports what they allocate, as traced by
+``tracemalloc``, and how long they took to build:
+
+* per-guild: every guild builds its own ``SpotifyAPI``, ``YouTubeAPI`` and
+  ``GeniusAPI`` (``YouTubeAPI`` re-running ``os.makedirs`` each time), which
+  is what ``Downloader`` did before.
+* shared: every guild uses the clients of one :class:`MusicServices`.
+
+    python -m benchmarks.guild_state_memory_bench [--guilds 5000]
+"""
+
+import argparse
+import gc
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+from cogs.api.genius import GeniusAPI
+from cogs.api.spotify import SpotifyAPI
+from cogs.api.youtube import YouTubeAPI
+from cogs.utils.music.guild_state import GuildMusicState
+from cogs.utils.music.services import MusicServices
+
+CONFIG = {
+    "secrets": {
+        "spotifyClientId": "id",
+        "spotifyClientSecret": "secret",
+        "geniusApiKey": "key",
+    }
+}
+
+
+def per_guild_services(shared):
+    """The previous behaviour: a fresh set of API clients for one guild."""
+    return SimpleNamespace(
+        **{
+            **vars(shared),
+            "spotify": SpotifyAPI(CONFIG),
+            "youtube": YouTubeAPI(
+                CONFIG, cache=shared.audio_cache, resolve_cache=shared.resolve_cache
+            ),
+            "genius": GeniusAPI(CONFIG),
+        }
+    )
+
+
+def measure(guilds, make_services):
+    cog = SimpleNamespace(bot=SimpleNamespace(), config=CONFIG)
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    states = [
+        GuildMusicState(cog, SimpleNamespace(id=guild_id), make_services())
+        for guild_id in range(guilds)
+    ]
+    elapsed = time.perf_counter() - started
+    allocated, _peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del states
+    return allocated, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--guilds", type=int, default=5000)
+    args = parser.parse_args()
+
+    shared = MusicServices(CONFIG)
+    try:
+        for name, make_services in (
+            ("per-guild", lambda: per_guild_services(shared)),
+            ("shared", lambda: shared),
+        ):
+            allocated, elapsed = measure(args.guilds, make_services)
+            print(
+                f"{name:>9}: {allocated / args.guilds / 1024:6.2f} KiB per guild "
+                f"({allocated / 1024 / 1024:.1f} MiB, built in {elapsed:.2f}s "
+                f"for {args.guilds} guilds)"
+            )
+    finally:
+        shared.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Latency and memory of the global voice-time leaderboard query.
+
+Seeds a SQLite ``users`` table with ``--users`` rows, then times three ways
+of getting the top 5 (bot user excluded):
+
+* full load: every row materialized as Python floats, then filtered and
+  sorted in Python. This is what ``leaderboard`` did before.
+* top-N, no index: :meth:`Database.get_top_user_hours` without the index on
+  ``users.total_duration_seconds`` (a full scan plus a sort in SQLite).
+* top-N, indexed: the same query reading the end of the index.
+
+Memory is the peak Python allocation of one run, as traced by
+``tracemalloc`` (SQLite's own buffers aren't included).
+
+    python -m benchmarks.leaderboard_query_bench [--users 1000000] [--repeat 5]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from cogs.database import Database
+from cogs.db.base import Base
+from cogs.db.entities.user import User
+
+BOT_USER_ID = 1
+INDEX_NAME = "ix_users_total_duration_seconds"
+
+
+def legacy_top(db, limit=5):
+    with db._session() as session:
+        users = session.query(User.id, User.total_duration_seconds).all()
+        user_hours = [(uid, secs / 3600) for uid, secs in users]
+    user_hours = [uh for uh in user_hours if uh[0] != BOT_USER_ID]
+    return sorted(user_hours, key=lambda x: x[1], reverse=True)[:limit]
+
+
+def seed(db, users, chunk=50_000):
+    rng = random.Random(0)
+    with db.engine.begin() as conn:
+        conn.exec_driver_sql(f"DROP INDEX {INDEX_NAME}")
+        for first in range(0, users, chunk):
+            conn.execute(
+                insert(User),
+                [
+                    {"id": user_id, "total_duration_seconds": rng.randrange(10**7)}
+                    for user_id in range(first + 1, min(first + chunk, users) + 1)
+                ],
+            )
+
+
+def measure(query, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = query()
+        timings.append(time.perf_counter() - started)
+    tracemalloc.start()
+    query()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return statistics.median(timings), peak, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="dz-bench-") as directory:
+        engine = create_engine(f"sqlite:///{os.path.join(directory, 'bench.db')}")
+        Base.metadata.create_all(engine)
+        db = Database(SimpleNamespace(), db_url="sqlite://")
+        db.engine = engine
+        db.Session = sessionmaker(bind=engine, expire_on_commit=False)
+
+        started = time.perf_counter()
+        seed(db, args.users)
+        print(f"seeded {args.users} users in {time.perf_counter() - started:.1f}s")
+
+        def top_n():
+            return db._get_top_user_hours(5, (BOT_USER_ID,))
+
+        results = [
+            ("full load", *measure(lambda: legacy_top(db), args.repeat)),
+            ("top-N, no index", *measure(top_n, args.repeat)),
+        ]
+        db._create_missing_indexes()
+        results.append(("top-N, indexed", *measure(top_n, args.repeat)))
+        engine.dispose()
+
+    # Compare hours, not IDs: users tied on hours may come back in any order.
+    expected = [hours for _, hours in results[0][3]]
+    for name, latency, peak, result in results:
+        assert [hours for _, hours in result] == expected, f"{name}: differs"
+        print(
+            f"{name:>16}: {latency * 1000:9.2f} ms, "
+            f"peak {peak / 1024 / 1024:8.2f} MiB"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""Time to extract lyrics from a Genius song page: BeautifulSoup vs targeted parser.
+
+Each page is parsed ``--repeat`` times with:
+
+* soup: a BeautifulSoup ``html.parser`` tree of the whole page, scripts
+  stripped, then ``get_text`` on every lyrics container. This is what
+  ``GeniusAPI.format_lyrics`` did before, on the event loop.
+* targeted: :func:`cogs.api.genius.extract_lyrics_text`, which only looks at
+  the lyrics containers.
+
+Pass saved Genius pages with ``--page`` (repeatable). Without one, a synthetic
+page with the same shape is used: a large head, the lyrics containers, and
+the big preloaded-state ``<script>`` blobs that make up most of a real page.
+Both paths must produce the same lyrics. Needs beautifulsoup4 from
+requirements-dev.txt.
+
+    python -m benchmarks.lyrics_parse_bench [--page saved.html] [--repeat 50]
+"""
+
+import argparse
+import html
+import json
+import re
+import time
+
+from bs4 import BeautifulSoup
+
+from cogs.api.genius import GeniusAPI
+
+CONFIG = {"secrets": {}}
+
+
+def legacy_format_lyrics(page_text):
+    """What format_lyrics returned when it built a BeautifulSoup tree."""
+    soup = BeautifulSoup(page_text, "html.parser")
+    for script in soup("script"):
+        script.extract()
+    lyrics = ""
+    for div in soup.find_all("div", {"data-lyrics-container": "true"}):
+        lyrics += div.get_text(separator="\n") + "\n\n"
+    lyrics = html.unescape(lyrics)
+    lyrics = re.sub(r"([&\(])\n", r"\1", lyrics)
+    lyrics = re.sub(r"\n(\))", r"\1", lyrics)
+    lyrics = re.sub(r"(\])", r"\1\n", lyrics)
+    lyrics = re.sub(r"(\[)", r"\n\1", lyrics)
+    return lyrics
+
+
+def make_page(verses=12, lines=8, state_kb=400):
+    head = "".join(
+        f'<meta property="og:tag{i}" content="value {i}"><link rel="preload" href="/x{i}.js">'
+        for i in range(200)
+    )
+    nav = "".join(
+        f'<div class="Nav__Item"><a href="/artists/{i}">Artist {i}</a></div>'
+        for i in range(300)
+    )
+    containers = []
+    for verse in range(verses):
+        body = "<br/>".join(
+            f'<a href="/annotation/{verse}-{line}" class="ReferentFragment">'
+            f"<span>Line {line} of verse {verse} &amp; more (ooh)</span></a>"
+            for line in range(lines)
+        )
+        containers.append(
+            f'<div data-lyrics-container="true" class="Lyrics__Container">'
+            f"[Verse {verse}]<br/>{body}<br/><i>(yeah)</i></div>"
+            f'<div class="RightSidebar"><div class="Ad">ad slot {verse}</div></div>'
+        )
+    state = json.dumps({"songPage": {"lyricsData": "x" * (state_kb * 1024)}})
+    return (
+        f"<!DOCTYPE html><html><head>{head}</head><body>{nav}"
+        f'<main>{"".join(containers)}</main>'
+        f"<script>window.__PRELOADED_STATE__ = JSON.parse({state!r});</script>"
+        f"<footer>{nav}</footer></body></html>"
+    )
+
+
+def measure(parse, page_text, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = parse(page_text)
+    return (time.perf_counter() - started) / repeat, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--page", action="append", default=[])
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    pages = []
+    for path in args.page:
+        with open(path, encoding="utf-8") as file:
+            pages.append((path, file.read()))
+    if not pages:
+        pages.append(("synthetic", make_page()))
+
+    genius = GeniusAPI(CONFIG)
+    for name, page_text in pages:
+        soup, expected = measure(legacy_format_lyrics, page_text, args.repeat)
+        targeted, actual = measure(genius.format_lyrics, page_text, args.repeat)
+        assert actual == expected, f"{name}: extracted lyrics differ"
+        print(
+            f"{name} ({len(page_text) / 1024:.0f} KiB): soup {soup * 1000:7.2f} ms, "
+            f"targeted {targeted * 1000:7.2f} ms ({soup / targeted:.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Per-song latency of the download pipeline against a stubbed extractor.
+
+Compares the old probe-then-download path (a ``resolve`` to check the
+duration gate followed by ``download``, each running a full ``extract_info``)
+with the single-pass ``resolve_and_download``. The stub sleeps for a fixed extraction and media
+fetch time so the numbers reflect how many round trips each path makes, not
+network jitter.
+
+    python -m benchmarks.resolve_download_bench [--songs 20] [--extract-ms 400]
+"""
+
+import argparse
+import os
+import statistics
+import tempfile
+import time
+from unittest.mock import patch
+
+os.environ.setdefault("DZ_DOWNLOAD_DIR", tempfile.mkdtemp(prefix="dz-bench-"))
+
+from cogs.api import youtube  # noqa: E402
+
+
+class StubYoutubeDL:
+    extract_seconds = 0.4
+    fetch_seconds = 0.1
+
+    def __init__(self, opts):
+        self.opts = opts
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def extract_info(self, url, download=False):
+        time.sleep(self.extract_seconds)
+        info = {"title": url, "duration": 200, "original_url": url}
+        if download:
+            time.sleep(self.fetch_seconds)
+        if url.startswith("ytsearch:"):
+            return {"entries": [info]}
+        return info
+
+    def process_ie_result(self, info, download=True):
+        if download:
+            time.sleep(self.fetch_seconds)
+        return info
+
+
+def old_pipeline(api, query):
+    if not api.is_info_playable(api.resolve(query)):
+        return None
+    return api.download(query)
+
+
+def new_pipeline(api, query):
+    return api.resolve_and_download(query)
+
+
+def run(pipeline, api, songs):
+    timings = []
+    for i in range(songs):
+        start = time.perf_counter()
+        pipeline(api, f"artist {i} - title {i}")
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--songs", type=int, default=20)
+    parser.add_argument("--extract-ms", type=float, default=400)
+    parser.add_argument("--fetch-ms", type=float, default=100)
+    args = parser.parse_args()
+
+    StubYoutubeDL.extract_seconds = args.extract_ms / 1000
+    StubYoutubeDL.fetch_seconds = args.fetch_ms / 1000
+    api = youtube.YouTubeAPI({"max_duration": "1200"})
+
+    with patch.object(youtube.yt_dlp, "YoutubeDL", StubYoutubeDL):
+        for name, pipeline in (("probe+download", old_pipeline), ("resolve-once", new_pipeline)):
+            timings = run(pipeline, api, args.songs)
+            print(
+                f"{name:>15}: mean {statistics.mean(timings) * 1000:7.1f} ms/song, "
+                f"p95 {sorted(timings)[int(len(timings) * 0.95) - 1] * 1000:7.1f} ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""Latency of most_played / most_requested against a large play history.
+
+Seeds a SQLite ``songs`` table with ``--songs`` plays of ``--urls`` songs by
+``--users`` requesters (a few songs and users account for most plays), then
+times the top 5 for both commands:
+
+* group by: ``GROUP BY ... ORDER BY count(*)`` over the whole ``songs``
+  table, which is what ``Database`` ran on every command before. Timed
+  without and with the new indexes on ``songs``.
+* counters: reading the top of the ``song_play_counts`` /
+  ``song_request_counts`` counters, which are kept up to date as plays are
+  written.
+
+Both must return the same counts. Also reports how long building the
+counters from an existing history takes (a one-off on upgrade).
+
+    python -m benchmarks.song_stats_query_bench [--songs 2000000] [--repeat 5]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+from types import SimpleNamespace
+
+from sqlalchemy import create_engine, func, insert
+from sqlalchemy.orm import sessionmaker
+
+from cogs.database import Database
+from cogs.db.base import Base
+from cogs.db.entities.song import Song
+
+SONG_INDEXES = ("ix_songs_original_url", "ix_songs_requested_by_user_id")
+
+
+def legacy_most_played(db):
+    with db._session() as session:
+        rows = (
+            session.query(
+                Song.original_url, Song.title, func.count(Song.id).label("total_plays")
+            )
+            .group_by(Song.original_url, Song.title)
+            .order_by(func.count(Song.id).desc())
+            .limit(5)
+            .all()
+        )
+        return [(r.original_url, r.title, r.total_plays) for r in rows]
+
+
+def legacy_most_requested(db):
+    with db._session() as session:
+        rows = (
+            session.query(
+                Song.requested_by_user_id, func.count(Song.id).label("total_requests")
+            )
+            .group_by(Song.requested_by_user_id)
+            .order_by(func.count(Song.id).desc())
+            .limit(5)
+            .all()
+        )
+        return [(r.requested_by_user_id, r.total_requests) for r in rows]
+
+
+def seed(db, songs, urls, users, chunk=100_000):
+    rng = random.Random(0)
+    with db.engine.begin() as conn:
+        for name in SONG_INDEXES:
+            conn.exec_driver_sql(f"DROP INDEX {name}")
+        for first in range(0, songs, chunk):
+            conn.execute(
+                insert(Song),
+                [
+                    {
+                        "title": f"Song {url}",
+                        "original_url": f"https://youtu.be/{url}",
+                        "artist": "Artist",
+                        "requested_by_user_id": int(rng.paretovariate(1.2)) % users,
+                    }
+                    for url in (
+                        int(rng.paretovariate(1.1)) % urls
+                        for _ in range(min(chunk, songs - first))
+                    )
+                ],
+            )
+
+
+def measure(query, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = query()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings), result
+
+
+def counts(result):
+    return [row[-1] for row in result]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--songs", type=int, default=2_000_000)
+    parser.add_argument("--urls", type=int, default=50_000)
+    parser.add_argument("--users", type=int, default=5_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="dz-bench-") as directory:
+        engine = create_engine(f"sqlite:///{os.path.join(directory, 'bench.db')}")
+        Base.metadata.create_all(engine)
+        db = Database(SimpleNamespace(), db_url="sqlite://")
+        db.engine = engine
+        db.Session = sessionmaker(bind=engine, expire_on_commit=False)
+
+        started = time.perf_counter()
+        seed(db, args.songs, args.urls, args.users)
+        print(f"seeded {args.songs} plays in {time.perf_counter() - started:.1f}s")
+
+        def run(played, requested):
+            return (
+                measure(lambda: played(db), args.repeat),
+                measure(lambda: requested(db), args.repeat),
+            )
+
+        runs = {"group by": run(legacy_most_played, legacy_most_requested)}
+        db._create_missing_indexes()
+        runs["group by, indexed"] = run(legacy_most_played, legacy_most_requested)
+        started = time.perf_counter()
+        db._backfill_song_counts()
+        print(f"built counters in {time.perf_counter() - started:.1f}s")
+        runs["counters"] = run(
+            Database._get_most_played_songs, Database._get_most_song_requests
+        )
+        engine.dispose()
+
+    (_, played_before), (_, requested_before) = runs["group by"]
+    for name, ((played_s, played), (requested_s, requested)) in runs.items():
+        assert counts(played) == counts(played_before), f"{name}: most_played differs"
+        assert counts(requested) == counts(requested_before), (
+            f"{name}: most_requested differs"
+        )
+        print(
+            f"{name:>17}: most_played {played_s * 1000:9.2f} ms, "
+            f"most_requested {requested_s * 1000:9.2f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
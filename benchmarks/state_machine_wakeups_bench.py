@@ -0,0 +1,114 @@
+"""Event-loop wakeups per guild per minute: polling vs event-driven state machine.
+
+Runs a batch of guilds in each typical steady state - a song playing, stopped
+and waiting out the idle timeout, and paused - against fake players, once with
+the old behaviour (a step every two seconds, no matter what) and once with the
+event-driven :class:`StateMachine`. Time is compressed by
+``--speed`` so a simulated minute takes ``60 / speed`` seconds; no events
+(track ends, queue changes) happen during the window, which is the common case
+for a guild listening through a song.
+
+    python -m benchmarks.state_machine_wakeups_bench [--guilds 50] [--speed 20]
+"""
+
+import argparse
+import asyncio
+import time
+from types import SimpleNamespace
+
+from cogs.utils.music import state_machine
+from cogs.utils.music.state_machine import State, StateMachine
+
+
+class PollingStateMachine(StateMachine):
+    """The previous ``tasks.loop`` behaviour: a full step on every tick."""
+
+    def _next_timeout(self):
+        return state_machine.PROGRESS_REFRESH_SECONDS
+
+    async def _refresh_progress(self):
+        await self.state.playlist.update_curr_song_message()
+
+
+class FakeVoiceClient:
+    def __init__(self, playing):
+        self.playing = playing
+        self.channel = SimpleNamespace(members=[SimpleNamespace(bot=False)])
+
+    def is_connected(self):
+        return True
+
+    def is_playing(self):
+        return self.playing
+
+
+class FakePlayer:
+    def __init__(self, playing, idle_timeout):
+        self.voice_client = FakeVoiceClient(playing)
+        self.end_timestamp = None
+        self.idle_timeout = idle_timeout
+
+    def idle(self):
+        return not self.voice_client.is_playing()
+
+    def pause(self):
+        pass
+
+    async def handle_idle(self):
+        if self.idle() and self.end_timestamp is None:
+            self.end_timestamp = time.time()
+
+
+class FakePlaylist:
+    def empty(self):
+        return True
+
+    async def update_curr_song_message(self):
+        pass
+
+
+async def _ready():
+    pass
+
+
+def make_guild(machine_cls, scenario, idle_timeout):
+    state = SimpleNamespace(
+        bot=SimpleNamespace(wait_until_ready=_ready),
+        player=FakePlayer(scenario == State.PLAYING, idle_timeout),
+        playlist=FakePlaylist(),
+        downloader=SimpleNamespace(busy=lambda: False),
+    )
+    sm = machine_cls(state)
+    sm.set_state(scenario)
+    return sm
+
+
+async def run(machine_cls, scenario, guilds, speed):
+    # Idle timeout stays at its real 5 minutes, i.e. past the simulated minute.
+    machines = [make_guild(machine_cls, scenario, 300 / speed) for _ in range(guilds)]
+    for sm in machines:
+        sm.start()
+    await asyncio.sleep(60 / speed)
+    for sm in machines:
+        await sm.stop()
+    return sum(sm.wakeups for sm in machines) / guilds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--guilds", type=int, default=50)
+    parser.add_argument("--speed", type=float, default=20)
+    args = parser.parse_args()
+
+    state_machine.PROGRESS_REFRESH_SECONDS = 2 / args.speed
+    for scenario in (State.PLAYING, State.STOPPED, State.PAUSED):
+        polling = asyncio.run(run(PollingStateMachine, scenario, args.guilds, args.speed))
+        event = asyncio.run(run(StateMachine, scenario, args.guilds, args.speed))
+        print(
+            f"{scenario.value:>8}: polling {polling:6.1f} wakeups/guild/min, "
+            f"event-driven {event:6.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
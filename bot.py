@@ -6,6 +6,7 @@ import os
 import random
 from typing import List
 
+import aiohttp
 import discord
 from discord.ext import commands
 
@@ -17,6 +18,7 @@ from cogs.utils.http import close_session
 class Khaled(commands.AutoShardedBot):
 
     def __init__(self, *args, initial_extensions: List[str], **kwargs):
+        kwargs.setdefault("http_trace", self._http_trace())
         super().__init__(*args, **kwargs)
         self.initial_extensions = initial_extensions
         self.online_users = {}
@@ -33,6 +35,22 @@ class Khaled(commands.AutoShardedBot):
 
         self.logger = logging.getLogger("discord")
 
+    def _http_trace(self):
+        # discord.py handles rate limits internally; this is the only place
+        # the response headers are visible, so let the music cog pace its
+        # embed edits from them.
+        trace = aiohttp.TraceConfig()
+        trace.on_request_end.append(self._on_http_request_end)
+        return trace
+
+    async def _on_http_request_end(self, session, trace_ctx, params):
+        music = self.get_cog("Music")
+        if music is not None:
+            response = params.response
+            music.services.embed_updater.observe(
+                params.method, params.url.path, response.status, response.headers
+            )
+
     async def setup_hook(self):
         for extension in self.initial_extensions:
             try:
@@ -62,6 +80,11 @@ class Khaled(commands.AutoShardedBot):
         )
         await self.update_online_users()
 
+        # Pick up the music sessions that were running before a restart.
+        music = self.get_cog("Music")
+        if music is not None:
+            await music.session_store.restore()
+
         # Notify after a restart triggered by the `restart` command.
         db = self.get_cog("Database")
         if db is None:
@@ -111,14 +134,36 @@ class Khaled(commands.AutoShardedBot):
         # reconnect), so this must not reset the join time of a member who
         # was already being tracked - that would discard their accrued
         # duration since their real join.
-        for guild in self.guilds:
-            for voice_channel in guild.voice_channels + guild.stage_channels:
-                for member in voice_channel.members:
-                    if not member.bot:
-                        self.online_users.setdefault(
-                            (guild.id, member.id),
-                            datetime.datetime.now(datetime.timezone.utc),
-                        )
+        now = datetime.datetime.now(datetime.timezone.utc)
+        connected = self._connected_voice_users()
+        resumed = {}
+        db = self.get_cog("Database")
+        if db is not None:
+            # Carry on the sessions the previous process journaled, so a
+            # crash or restart doesn't reset everyone's clock.
+            try:
+                resumed = await db.resume_voice_sessions(connected)
+            except Exception:
+                self.logger.exception("Failed to resume journaled voice sessions")
+        # Re-read after the await: members may have come or gone meanwhile.
+        current = self._connected_voice_users()
+        for key in current:
+            self.online_users.setdefault(key, resumed.get(key, now))
+        if db is None:
+            return
+        for key in connected - current:
+            if key not in self.online_users:
+                # Left before they were tracked; close the journaled session.
+                await db.end_voice_session(*key, resumed.get(key, now))
+
+    def _connected_voice_users(self):
+        return {
+            (guild.id, member.id)
+            for guild in self.guilds
+            for voice_channel in guild.voice_channels + guild.stage_channels
+            for member in voice_channel.members
+            if not member.bot
+        }
 
     async def on_voice_state_update(self, member, before, after):
         # Keyed by (guild_id, member_id): the same user can be connected to
@@ -129,19 +174,23 @@ class Khaled(commands.AutoShardedBot):
             join_time = self.online_users.pop((member.guild.id, member.id), None)
             db = self.get_cog("Database")
             if join_time is not None and db is not None:
-                await db.flush_user_duration(member.id, join_time)
+                await db.end_voice_session(member.guild.id, member.id, join_time)
 
         elif not before.channel and after.channel:  # User connected
             if not member.bot:
-                self.online_users[(member.guild.id, member.id)] = (
-                    datetime.datetime.now(datetime.timezone.utc)
-                )
-
+                join_time = datetime.datetime.now(datetime.timezone.utc)
+                self.online_users[(member.guild.id, member.id)] = join_time
+                db = self.get_cog("Database")
+                if db is not None:
+                    await db.open_voice_session(member.guild.id, member.id, join_time)
+
+        music = self.get_cog("Music")
+        if music is None:
+            return
         # The bot itself was disconnected/kicked from a voice channel.
         if member.id == self.user.id and before.channel and not after.channel:
-            music = self.get_cog("Music")
-            if music is not None:
-                await music.handle_forced_disconnect(before.channel.guild)
+            await music.handle_forced_disconnect(before.channel.guild)
+        music.handle_voice_state_update(member.guild)
 
     async def fetch_message_by_id(self, channel_id, message_id):
         try:
@@ -1,68 +1,153 @@
+"""Genius lyrics search and extraction.
+
+Lyrics used to be pulled out of the song page by building a BeautifulSoup tree
+of the whole page (several hundred KB, mostly scripts and JSON) with the
+pure-Python ``html.parser``, on the event loop. :class:`_LyricsExtractor` now
+starts at the first ``data-lyrics-container`` div, keeps only the text inside
+those divs and stops after the last one. ``format_lyrics`` runs in a worker
+thread.
+
+    python -m benchmarks.lyrics_parse_bench
+"""
+
+import asyncio
 import html
 import logging
 import re
-
-from bs4 import BeautifulSoup
+from html.parser import HTMLParser
 
 from cogs.utils.endpoints import GENIUS_BASE_URL
 from cogs.utils.http import get_session, get_text
+from cogs.utils.music.lyrics_cache import MISSING
 
 logger = logging.getLogger("discord")
 
+LYRICS_CONTAINER = ("data-lyrics-container", "true")
+_CONTAINER_MARKER = 'data-lyrics-container="true"'
+# Text inside these never shows up in the lyrics.
+_SKIPPED_TAGS = frozenset(("script", "style", "template"))
+
+_JOIN_AFTER_OPENER = re.compile(r"([&\(])\n")
+_JOIN_BEFORE_CLOSER = re.compile(r"\n(\))")
+_BREAK_AFTER_SECTION = re.compile(r"(\])")
+_BREAK_BEFORE_SECTION = re.compile(r"(\[)")
+
+
+class _Done(Exception):
+    pass
+
+
+class _LyricsExtractor(HTMLParser):
+    """Collects the text of each lyrics container, one list of strings per div."""
+
+    def __init__(self, expected):
+        super().__init__(convert_charrefs=True)
+        # How many containers the page has, so parsing can stop after the last.
+        self.expected = expected
+        self.containers = []
+        self._depth = 0
+        self._skipping = 0
+
+    def handle_starttag(self, tag, attrs):
+        if self._depth:
+            if tag == "div":
+                self._depth += 1
+            elif tag in _SKIPPED_TAGS:
+                self._skipping += 1
+        elif tag == "div" and LYRICS_CONTAINER in attrs:
+            self._depth = 1
+            self.containers.append([])
+
+    def handle_endtag(self, tag):
+        if not self._depth:
+            return
+        if tag in _SKIPPED_TAGS:
+            self._skipping = max(self._skipping - 1, 0)
+        elif tag == "div":
+            self._depth -= 1
+            if not self._depth and len(self.containers) >= self.expected:
+                raise _Done
+
+    def handle_data(self, data):
+        if self._depth and not self._skipping:
+            self.containers[-1].append(data)
+
+
+def extract_lyrics_text(page_text):
+    """The text of each ``data-lyrics-container`` div in ``page_text``."""
+    first = page_text.find(_CONTAINER_MARKER)
+    if first == -1:
+        return []
+    extractor = _LyricsExtractor(page_text.count(_CONTAINER_MARKER))
+    try:
+        extractor.feed(page_text[page_text.rfind("<div", 0, first) :])
+        extractor.close()
+    except _Done:
+        pass
+    return ["\n".join(strings) for strings in extractor.containers]
+
 
 class GeniusAPI:
-    def __init__(self, config):
+    def __init__(self, config, cache=None):
         self.base_url = GENIUS_BASE_URL
         self.headers = {
             "Authorization": f"Bearer {config['secrets'].get('geniusApiKey')}"
         }
+        # Optional shared LyricsCache; without one every lookup hits Genius.
+        self.cache = cache
 
     async def fetch_lyrics(self, song_name):
         if "/playlist/" in song_name or "list=" in song_name:
             return None
 
         query = song_name.split("(")[0]
+        # Lyrics are optional, so no failure here may reach the download that
+        # asked for them - including the cache's (e.g. a locked sqlite file).
         try:
-            session = get_session()
-            async with session.get(
-                f"{self.base_url}/search",
-                params={"q": query},
-                headers=self.headers,
-            ) as response:
-                if response.status != 200:
-                    logger.warning("Genius search returned %s", response.status)
-                    return None
-                data = await response.json()
-
-            hits = data.get("response", {}).get("hits", [])
-            if not hits:
-                return None
-
-            song_url = hits[0]["result"]["url"]
-            page_text = await get_text(song_url)
-            return self.format_lyrics(BeautifulSoup(page_text, "html.parser"))
+            if self.cache is not None:
+                cached = await asyncio.to_thread(self.cache.get, query)
+                if cached is not MISSING:
+                    return cached
+            lyrics = await self._fetch(query)
+            if self.cache is not None:
+                await asyncio.to_thread(self.cache.put, query, lyrics)
         except Exception:
+            # Not cached: a transient failure shouldn't hide lyrics for a day.
             logger.exception("Failed to fetch lyrics for %s", song_name)
             return None
+        return lyrics
+
+    async def _fetch(self, query):
+        """The lyrics for ``query``, or None if Genius has none; raises on errors."""
+        session = get_session()
+        async with session.get(
+            f"{self.base_url}/search",
+            params={"q": query},
+            headers=self.headers,
+        ) as response:
+            response.raise_for_status()
+            data = await response.json()
 
-    def format_lyrics(self, html_content):
-        for h in html_content("script"):
-            h.extract()
+        hits = data.get("response", {}).get("hits", [])
+        if not hits:
+            return None
 
-        lyrics = ""
-        lyrics_divs = html_content.find_all("div", {"data-lyrics-container": "true"})
-        if not lyrics_divs:
+        song_url = hits[0]["result"]["url"]
+        page_text = await get_text(song_url)
+        return await asyncio.to_thread(self.format_lyrics, page_text)
+
+    def format_lyrics(self, page_text):
+        containers = extract_lyrics_text(page_text)
+        if not containers:
             # Genius changed its markup if this ever happens; surface it in logs
             # rather than silently returning empty lyrics.
             logger.warning("No lyrics containers found; Genius markup may have changed.")
             return None
 
-        for div in lyrics_divs:
-            lyrics += div.get_text(separator="\n") + "\n\n"
-
+        lyrics = "".join(text + "\n\n" for text in containers)
         lyrics = html.unescape(lyrics)
-        lyrics = re.sub(r"([&\(])\n", r"\1", lyrics)
-        lyrics = re.sub(r"\n(\))", r"\1", lyrics)
-        lyrics = re.sub(r"(\])", r"\1\n", lyrics)
-        lyrics = re.sub(r"(\[)", r"\n\1", lyrics)
+        lyrics = _JOIN_AFTER_OPENER.sub(r"\1", lyrics)
+        lyrics = _JOIN_BEFORE_CLOSER.sub(r"\1", lyrics)
+        lyrics = _BREAK_AFTER_SECTION.sub(r"\1\n", lyrics)
+        lyrics = _BREAK_BEFORE_SECTION.sub(r"\n\1", lyrics)
         return lyrics
@@ -1,17 +1,62 @@
+"""Async Spotify Web API client.
+
+Spotify used to be reached through ``spotipy``, which is blocking, so every
+call went through ``asyncio.to_thread`` - and every guild's downloader built
+its own client with its own client-credentials token. One :class:`SpotifyAPI`
+is now shared by the whole process (the ``Music`` cog owns it) and talks to
+the Web API directly over the shared aiohttp session:
+
+* One access token is cached and refreshed shortly before it expires, by
+  whichever request notices first; concurrent requests wait for it rather
+  than each fetching their own.
+* Track, album and playlist responses are cached for ``cache_ttl`` seconds,
+  so re-queuing the same playlist doesn't page through it again.
+"""
+
 import asyncio
+import base64
+import logging
+import time
+from collections import OrderedDict, deque
+from urllib.parse import urlencode
+
+from cogs.utils.endpoints import SPOTIFY_API_URL, SPOTIFY_TOKEN_URL
+from cogs.utils.http import get_session
+
+logger = logging.getLogger("discord")
+
+# The most tracks Spotify returns per page for each endpoint.
+PLAYLIST_PAGE_SIZE = 100
+ALBUM_PAGE_SIZE = 50
+# Pages of a long playlist/album fetched at once after the first one.
+PAGE_CONCURRENCY = 4
+# Refresh the token this many seconds before Spotify says it expires.
+TOKEN_REFRESH_MARGIN = 60
+DEFAULT_CACHE_TTL = 3600
+_MAX_CACHED_RESPONSES = 1024
+# Attempts per request when Spotify answers 401 (token revoked) or 429.
+_MAX_ATTEMPTS = 3
+# Only what _format_track reads from a playlist item.
+_PLAYLIST_FIELDS = "items(track(name,artists(name))),total"
 
-import spotipy
-from spotipy.oauth2 import SpotifyClientCredentials
+
+class SpotifyError(Exception):
+    pass
 
 
 class SpotifyAPI:
-    def __init__(self, config):
-        self.spotify = spotipy.Spotify(
-            auth_manager=SpotifyClientCredentials(
-                client_id=config["secrets"].get("spotifyClientId"),
-                client_secret=config["secrets"].get("spotifyClientSecret"),
-            )
-        )
+    def __init__(self, config, cache_ttl=DEFAULT_CACHE_TTL):
+        self.client_id = config["secrets"].get("spotifyClientId")
+        self.client_secret = config["secrets"].get("spotifyClientSecret")
+        self.cache_ttl = cache_ttl
+        self._token = None
+        self._token_expires_at = 0.0
+        self._token_lock = asyncio.Lock()
+        # request key -> (expires_at, response), least recently used first.
+        self._cache: OrderedDict = OrderedDict()
+        self.requests = 0
+        self.cache_hits = 0
+        self.token_refreshes = 0
 
     def _format_track(self, track):
         # Local files embedded in a playlist/album can report an empty
@@ -21,38 +66,124 @@ class SpotifyAPI:
         artist = artists[0]["name"] if artists else "Unknown Artist"
         return f"{artist} - {track['name']}"
 
+    def _basic_credentials(self):
+        raw = f"{self.client_id}:{self.client_secret}".encode()
+        return base64.b64encode(raw).decode()
+
+    def _token_valid(self):
+        return (
+            self._token is not None
+            and time.monotonic() < self._token_expires_at - TOKEN_REFRESH_MARGIN
+        )
+
+    async def _access_token(self):
+        if self._token_valid():
+            return self._token
+        async with self._token_lock:
+            if self._token_valid():
+                return self._token
+            if not self.client_id or not self.client_secret:
+                raise SpotifyError("Spotify credentials are not configured.")
+            async with get_session().post(
+                SPOTIFY_TOKEN_URL,
+                data={"grant_type": "client_credentials"},
+                headers={"Authorization": f"Basic {self._basic_credentials()}"},
+            ) as response:
+                response.raise_for_status()
+                data = await response.json()
+            self._token = data["access_token"]
+            self._token_expires_at = time.monotonic() + data.get("expires_in", 3600)
+            self.token_refreshes += 1
+            return self._token
+
+    async def _get(self, path, **params):
+        key = f"{path}?{urlencode(sorted(params.items()))}"
+        cached = self._cache.get(key)
+        if cached is not None and cached[0] > time.monotonic():
+            self._cache.move_to_end(key)
+            self.cache_hits += 1
+            return cached[1]
+
+        for attempt in range(1, _MAX_ATTEMPTS + 1):
+            token = await self._access_token()
+            async with get_session().get(
+                f"{SPOTIFY_API_URL}{path}",
+                params=params,
+                headers={"Authorization": f"Bearer {token}"},
+            ) as response:
+                if attempt < _MAX_ATTEMPTS:
+                    if response.status == 401:
+                        self._token = None
+                        continue
+                    if response.status == 429:
+                        retry_after = float(response.headers.get("Retry-After", 1))
+                        logger.warning("Spotify rate limited; retrying in %ss", retry_after)
+                        await asyncio.sleep(retry_after)
+                        continue
+                response.raise_for_status()
+                data = await response.json()
+            break
+        self.requests += 1
+
+        self._cache[key] = (time.monotonic() + self.cache_ttl, data)
+        self._cache.move_to_end(key)
+        while len(self._cache) > _MAX_CACHED_RESPONSES:
+            self._cache.popitem(last=False)
+        return data
+
     async def get_track_name(self, track_url):
-        track_id = track_url.split("/")[-1].split("?")[0]
-        # spotipy is blocking, so keep it off the event loop.
-        track = await asyncio.to_thread(self.spotify.track, track_id)
+        track = await self._get(f"/tracks/{_spotify_id(track_url)}")
         return self._format_track(track)
 
-    async def get_playlist_songs(self, playlist_url):
-        playlist_id = playlist_url.split("/")[-1].split("?")[0]
-        results = await asyncio.to_thread(self.spotify.playlist_tracks, playlist_id)
-        songs = []
-        while results:
-            for item in results["items"]:
-                track = item.get("track")
-                if not track:
-                    continue
-                songs.append(self._format_track(track))
-            # Follow pagination so playlists over 100 tracks aren't truncated.
-            if results.get("next"):
-                results = await asyncio.to_thread(self.spotify.next, results)
-            else:
-                break
-        return songs
-
-    async def get_album_songs(self, album_url):
-        album_id = album_url.split("/")[-1].split("?")[0]
-        results = await asyncio.to_thread(self.spotify.album_tracks, album_id)
-        songs = []
-        while results:
-            for item in results["items"]:
-                songs.append(self._format_track(item))
-            if results.get("next"):
-                results = await asyncio.to_thread(self.spotify.next, results)
-            else:
-                break
-        return songs
+    async def iter_playlist_songs(self, playlist_url, limit=None):
+        """Yield a playlist's songs a page at a time, up to about ``limit``."""
+        path = f"/playlists/{_spotify_id(playlist_url)}/tracks"
+        pages = self._iter_pages(path, PLAYLIST_PAGE_SIZE, limit, fields=_PLAYLIST_FIELDS)
+        async for items in pages:
+            # Removed/unavailable tracks come back as {"track": None}.
+            yield [
+                self._format_track(item["track"]) for item in items if item.get("track")
+            ]
+
+    async def iter_album_songs(self, album_url, limit=None):
+        """Yield an album's songs a page at a time, up to about ``limit``."""
+        path = f"/albums/{_spotify_id(album_url)}/tracks"
+        async for items in self._iter_pages(path, ALBUM_PAGE_SIZE, limit):
+            yield [self._format_track(item) for item in items]
+
+    async def _iter_pages(self, path, page_size, limit, **params):
+        """Yield each page's items in order, the first one as soon as it's in.
+
+        The first page says how many tracks there are, so the rest are
+        requested by offset, ``PAGE_CONCURRENCY`` at a time, instead of
+        following each page's ``next`` link one after another. Nothing past
+        ``limit`` tracks is requested, and pages still in flight are
+        cancelled if the caller stops early.
+        """
+        first = await self._get(path, limit=page_size, offset=0, **params)
+        yield first["items"]
+        total = first.get("total") or 0
+        if limit is not None:
+            total = min(total, limit)
+        offsets = iter(range(page_size, total, page_size))
+
+        def request(offset):
+            return asyncio.ensure_future(
+                self._get(path, limit=page_size, offset=offset, **params)
+            )
+
+        pending = deque(request(offset) for _, offset in zip(range(PAGE_CONCURRENCY), offsets))
+        try:
+            while pending:
+                page = await pending.popleft()
+                offset = next(offsets, None)
+                if offset is not None:
+                    pending.append(request(offset))
+                yield page["items"]
+        finally:
+            for task in pending:
+                task.cancel()
+
+
+def _spotify_id(url):
+    return url.split("/")[-1].split("?")[0]
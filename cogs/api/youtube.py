@@ -7,6 +7,8 @@ from urllib.parse import urlparse
 
 import yt_dlp
 
+from cogs.utils.music.audio_cache import AudioCache
+
 # Downloaded audio is kept in a dedicated directory instead of the repo working
 # directory, so cleanup is scoped and the source tree stays clean.
 DOWNLOAD_DIR = os.environ.get("DZ_DOWNLOAD_DIR", "downloads")
@@ -40,20 +42,34 @@ def _reject_internal_urls(video_url):
 
 
 class YouTubeAPI:
-    def __init__(self, config):
+    def __init__(self, config, cache=None, resolve_cache=None):
+        # Optional shared AudioCache; without one every song is downloaded.
+        self.cache = cache
+        # Optional shared ResolveCache; without one every text query is
+        # searched on YouTube.
+        self.resolve_cache = resolve_cache
         self.audio_format = config.get("audio_format", "mp3")
         self.audio_quality = config.get("audio_quality", "192")
-        self.downloading = False
+        # "passthrough" keeps the source's Opus stream (remuxed, not
+        # re-encoded) so the player can hand it to Discord as-is instead of
+        # decoding it to PCM for discord.py to encode back to Opus.
+        self.passthrough = config.get("audio_mode") == "passthrough"
+        if self.passthrough:
+            self.audio_format = "opus"
         self.max_duration = int(
             config.get("max_duration", "1200")
         )  # in seconds, 20 minutes
         os.makedirs(DOWNLOAD_DIR, exist_ok=True)
 
-    def download(self, video_url):
-        file_name = os.path.join(DOWNLOAD_DIR, f"{uuid.uuid4().int}")
-
-        ydl_opts = {
-            "format": "bestaudio/best",
+    def _ydl_opts(self, file_name):
+        return {
+            # yt-dlp's FFmpegExtractAudio copies the stream when the source
+            # codec already matches, so prefer a native Opus source.
+            "format": (
+                "bestaudio[acodec=opus]/bestaudio/best"
+                if self.passthrough
+                else "bestaudio/best"
+            ),
             "postprocessors": [
                 {
                     "key": "FFmpegExtractAudio",
@@ -66,81 +82,129 @@ class YouTubeAPI:
             "no_warnings": True,
         }
 
-        self.downloading = True
-
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            # Anything that isn't itself a URL is a search term; a URL (YouTube
-            # or otherwise - SoundCloud, Bandcamp, a direct audio link, etc.)
-            # is handed to yt-dlp as-is instead of being turned into a literal
-            # text search on the URL string.
-            is_query = not video_url.startswith(("http://", "https://"))
-            if is_query:
-                video_url = f"ytsearch:{video_url}"
-
-            try:
-                if not is_query:
-                    _reject_internal_urls(video_url)
-                info = ydl.extract_info(video_url, download=True)
-
-                if is_query:
-                    entries = info.get("entries") or []
-                    if not entries:
-                        raise LookupError(f"No results found for: {video_url}")
-                    info = entries[0]
-
-                file_path = f"{file_name}.{self.audio_format}"
-                return file_path, info
-            finally:
-                self.downloading = False
-
-    def is_video_playable(self, video_url):
-        file_name = f"{uuid.uuid4().int}"
-
-        self.downloading = True
-
-        ydl_opts = {
-            "format": "bestaudio/best",
-            "postprocessors": [
-                {
-                    "key": "FFmpegExtractAudio",
-                    "preferredcodec": self.audio_format,
-                    "preferredquality": self.audio_quality,
-                }
-            ],
-            "outtmpl": f"{file_name}.%(ext)s",
-            "noplaylist": True,
-            "no_warnings": True,
-        }
+    def _extract(self, ydl, video_url, download):
+        # Anything that isn't itself a URL is a search term; a URL (YouTube
+        # or otherwise - SoundCloud, Bandcamp, a direct audio link, etc.)
+        # is handed to yt-dlp as-is instead of being turned into a literal
+        # text search on the URL string.
+        is_query = not video_url.startswith(("http://", "https://"))
+        if is_query:
+            video_url = f"ytsearch:{video_url}"
+        else:
+            _reject_internal_urls(video_url)
+
+        info = ydl.extract_info(video_url, download=download)
+
+        if is_query:
+            entries = info.get("entries") or []
+            if not entries:
+                raise LookupError(f"No results found for: {video_url}")
+            info = entries[0]
+        return info
+
+    def is_info_playable(self, info):
+        # Livestreams and some entries report no/zero duration; that's not
+        # the same as being too long, so don't reject them.
+        duration = info.get("duration")
+        return not (duration and duration > self.max_duration)
+
+    def resolve(self, video_url):
+        """Extract metadata for a URL or search query without downloading.
+
+        The returned info dict can be handed straight to :meth:`download` so
+        the (slow, network-bound) extraction - including the ``ytsearch:``
+        round trip for text queries - only ever runs once per song.
+        """
+        with yt_dlp.YoutubeDL(self._ydl_opts(uuid.uuid4().int)) as ydl:
+            return self._extract(ydl, video_url, download=False)
+
+    def download(self, video_url, info=None):
+        file_name = os.path.join(DOWNLOAD_DIR, f"{uuid.uuid4().int}")
 
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            # Anything that isn't itself a URL is a search term; a URL (YouTube
-            # or otherwise - SoundCloud, Bandcamp, a direct audio link, etc.)
-            # is handed to yt-dlp as-is instead of being turned into a literal
-            # text search on the URL string.
-            is_query = not video_url.startswith(("http://", "https://"))
-            if is_query:
-                video_url = f"ytsearch:{video_url}"
-
-            try:
-                if not is_query:
-                    _reject_internal_urls(video_url)
-                info = ydl.extract_info(video_url, download=False)
-
-                if is_query:
-                    entries = info.get("entries") or []
-                    if not entries:
-                        return False
-                    info = entries[0]
-
-                # Livestreams and some entries report no/zero duration; that's
-                # not the same as being too long, so don't reject them.
-                duration = info.get("duration")
-                if duration and duration > self.max_duration:
-                    return False
-
-                return True
-            finally:
-                self.downloading = False
+        with yt_dlp.YoutubeDL(self._ydl_opts(file_name)) as ydl:
+            if info is None:
+                info = self._extract(ydl, video_url, download=True)
+            else:
+                # Already resolved by resolve(): only fetch the media and
+                # run the post-processors, skipping a second extraction.
+                info = ydl.process_ie_result(info, download=True)
+
+            file_path = f"{file_name}.{self.audio_format}"
+            return file_path, info
+
+    def _prepare(self, video_url):
+        """Resolve a request, apply the duration gate and check the caches.
+
+        Returns ``None`` when the song is too long to be played, otherwise
+        ``(video_url, info, cached_path, extracted)``. ``extracted`` is False
+        when ``info`` came from the resolve cache - it then only holds
+        metadata (no format list) and ``video_url`` is the resolved video's
+        own URL rather than the original search query.
+        """
+        is_query = not video_url.startswith(("http://", "https://"))
+        info = None
+        if is_query and self.resolve_cache is not None:
+            info = self.resolve_cache.get(video_url)
+        extracted = info is None
+        if extracted:
+            info = self.resolve(video_url)
+            if is_query and self.resolve_cache is not None:
+                self.resolve_cache.put(video_url, info)
+        else:
+            video_url = info["webpage_url"]
+
+        if not self.is_info_playable(info):
+            return None
+
+        cached_path = None
+        if self.cache is not None:
+            key = AudioCache.key_for(info, self.audio_format)
+            if key is not None:
+                cached_path = self.cache.lookup(key)
+        return video_url, info, cached_path, extracted
+
+    def download_to_cache(self, video_url, info=None):
+        """Download (reusing ``info`` if already extracted) into the cache."""
+        file_path, info = self.download(video_url, info)
+        if self.cache is not None:
+            key = AudioCache.key_for(info, self.audio_format)
+            if key is not None:
+                file_path = self.cache.store(key, file_path)
+        return file_path, info
+
+    def resolve_and_download(self, video_url):
+        """Resolve once, apply the duration gate, then download.
+
+        Returns ``None`` when the song is too long to be played, otherwise the
+        same ``(file_path, info)`` tuple as :meth:`download`. With a cache, a
+        previously downloaded video is served from disk, and the returned path
+        carries a cache reference the caller must release.
+        """
+        prepared = self._prepare(video_url)
+        if prepared is None:
+            return None
+        video_url, info, cached_path, extracted = prepared
+        if cached_path is not None:
+            return cached_path, info
+        # A resolve-cache hit has no format list: extract the known video
+        # URL directly, which still skips the search round trip.
+        return self.download_to_cache(video_url, info if extracted else None)
+
+    def resolve_for_streaming(self, video_url):
+        """Resolve a song so playback can start before it's downloaded.
+
+        Returns ``None`` when the song is too long, ``(cached_path, info)`` on
+        an audio cache hit, and otherwise ``(None, info)`` where ``info``
+        carries the direct media ``url`` to stream from - pass it to
+        :meth:`download_to_cache` to persist the file in the background.
+        """
+        prepared = self._prepare(video_url)
+        if prepared is None:
+            return None
+        video_url, info, cached_path, extracted = prepared
+        if cached_path is None and not extracted:
+            info = self.resolve(video_url)
+        return cached_path, info
 
     async def get_playlist_songs(self, playlist_url):
         # yt-dlp extraction is blocking network I/O; run it in a worker thread.
@@ -2,19 +2,72 @@ import asyncio
 import datetime
 import logging
 import os
-from collections import defaultdict
+import time
+from collections import Counter, defaultdict
 from contextlib import contextmanager
 
 from discord.ext import commands, tasks
-from sqlalchemy import create_engine, func, text
+from sqlalchemy import create_engine, func, insert, select, text, tuple_
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.engine.url import make_url
 from sqlalchemy.orm import sessionmaker
 
 from cogs.db.base import Base
 from cogs.db.entities.chess_game import ChessGame
+from cogs.db.entities.music_session import MusicSession
 from cogs.db.entities.song import Song
+from cogs.db.entities.song_stats import SongPlayCount, SongRequestCount
 from cogs.db.entities.startup_notification import StartupNotification
 from cogs.db.entities.user import User
+from cogs.db.entities.voice_session import VoiceSession
+from cogs.db.entities.voice_time import GuildVoiceTime, VoiceTimeRollup
+
+# Song plays are buffered in memory and written with one bulk INSERT once this
+# many are pending, or every SONG_FLUSH_SECONDS, whichever comes first.
+SONG_FLUSH_SIZE = 100
+SONG_FLUSH_SECONDS = 60
+# Plays kept for retry while the database is unreachable; the oldest are
+# dropped beyond this.
+SONG_BUFFER_MAX = 10_000
+
+# How often open voice sessions record that they're still connected; at most
+# this much voice time is lost to a crash.
+VOICE_CHECKPOINT_SECONDS = 60
+# A journaled session of someone still connected after a restart carries on
+# only if the bot was down for less than this.
+VOICE_RESUME_MAX_GAP = datetime.timedelta(minutes=10)
+
+
+def _naive_utc(moment):
+    # DATETIME columns hold naive UTC.
+    return moment.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+
+
+def _aware_utc(moment):
+    return moment.replace(tzinfo=datetime.timezone.utc)
+
+
+def _split_by_day(start, end):
+    """Split ``start``..``end`` into [(UTC date, whole seconds)], one per day."""
+    total = int((end - start).total_seconds())
+    if total <= 0:
+        return []
+    cursor = start.astimezone(datetime.timezone.utc)
+    end = end.astimezone(datetime.timezone.utc)
+    pieces = []
+    while cursor.date() < end.date():
+        midnight = datetime.datetime.combine(
+            cursor.date() + datetime.timedelta(days=1),
+            datetime.time.min,
+            tzinfo=datetime.timezone.utc,
+        )
+        pieces.append((cursor.date(), int((midnight - cursor).total_seconds())))
+        cursor = midnight
+    # The last day takes the rounding remainder, so the pieces add up to the
+    # same whole seconds the users' totals get.
+    pieces.append((end.date(), total - sum(seconds for _, seconds in pieces)))
+    return [(day, seconds) for day, seconds in pieces if seconds > 0]
 
 
 def _default_db_url() -> str:
@@ -35,29 +88,56 @@ def _default_db_url() -> str:
 
 
 class Database(commands.Cog):
-    def __init__(self, bot, db_url=None):
+    def __init__(self, bot, db_url=None, song_flush_size=SONG_FLUSH_SIZE):
         self.bot = bot
         self.db_url = db_url or _default_db_url()
         self.db_name = os.environ.get("DZ_DB_NAME", "discord_bot")
         self.engine = None
         self.Session = None
         self.logger = logging.getLogger("discord")
-        # Serializes _update_user_duration/delete_user_data per user_id: the
-        # hourly tick, a disconnect flush, and a GDPR erasure can all target
-        # the same never-before-seen row concurrently (each a separate
-        # asyncio.to_thread call), and the "update, insert if 0 rows" upsert
-        # below is a check-then-act race without this - two concurrent
-        # inserts for the same new user_id raise IntegrityError.
-        self._user_locks = defaultdict(asyncio.Lock)
+        # Serializes voice-time writes (the hourly tick, disconnects and the
+        # session journal) against each other and against GDPR erasures, so
+        # an erasure can't be followed by a write that brings the row back.
+        self._ledger_lock = asyncio.Lock()
+        # Keeps a (guild_id, user_id)'s journal open and close in call order:
+        # a leave right after a join must not delete the row before the join
+        # has written it.
+        self._voice_session_locks = defaultdict(asyncio.Lock)
+        # Until resume_voice_sessions has run, the journal holds the previous
+        # process's sessions, which checkpoints must leave alone.
+        self._voice_sessions_resumed = False
+        self.last_duration_tick = {
+            "users": 0,
+            "seconds": 0,
+            "collect_ms": 0.0,
+            "write_ms": 0.0,
+        }
+        # Write-behind buffer of song plays (see record_song_play).
+        self.song_flush_size = song_flush_size
+        self.songs_flushed = 0
+        self.song_flushes = 0
+        self._song_buffer = []
+        self._song_flush_lock = asyncio.Lock()
+        self._song_flush_task = None
 
     async def cog_load(self):
         # Blocking DB setup is offloaded so it never stalls the event loop.
         await asyncio.to_thread(self._init_engine)
-        # Start the periodic flush only after the session factory exists.
+        # Start the periodic flushes only after the session factory exists.
         self.update_user_durations.start()
+        self.flush_song_buffer.start()
+        self.checkpoint_voice_sessions.start()
 
     async def cog_unload(self):
         self.update_user_durations.cancel()
+        self.flush_song_buffer.cancel()
+        self.checkpoint_voice_sessions.cancel()
+        # Bot.close() unloads every cog, so this also covers shutdown/restart.
+        await self.flush_song_plays()
+        try:
+            await self._checkpoint()
+        except Exception:
+            self.logger.exception("Failed to checkpoint voice sessions")
 
     def _init_engine(self):
         # Connect without a database to ensure it exists, then reconnect to it.
@@ -83,8 +163,43 @@ class Database(commands.Cog):
         # game.winner in chess_leaderboard) raises DetachedInstanceError.
         self.Session = sessionmaker(bind=self.engine, expire_on_commit=False)
         Base.metadata.create_all(self.engine)
+        self._create_missing_indexes()
+        self._backfill_song_counts()
         self.logger.info("DB connection initialized")
 
+    def _create_missing_indexes(self):
+        # create_all skips tables that already exist, so indexes added to an
+        # existing table's entity would never reach a deployed database.
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(self.engine, checkfirst=True)
+
+    def _backfill_song_counts(self):
+        # The play counters are kept up to date as plays are written; this
+        # builds them once from a history that predates them.
+        with self._session() as session:
+            if session.query(SongPlayCount.original_url).first() is not None:
+                return
+            if session.query(Song.id).first() is None:
+                return
+            session.execute(
+                insert(SongPlayCount).from_select(
+                    ["original_url", "title", "play_count"],
+                    select(Song.original_url, func.max(Song.title), func.count(Song.id))
+                    .where(Song.original_url.isnot(None))
+                    .group_by(Song.original_url),
+                )
+            )
+            session.execute(
+                insert(SongRequestCount).from_select(
+                    ["requested_by_user_id", "request_count"],
+                    select(Song.requested_by_user_id, func.count(Song.id))
+                    .where(Song.requested_by_user_id.isnot(None))
+                    .group_by(Song.requested_by_user_id),
+                )
+            )
+        self.logger.info("Built song play counters from the play history")
+
     @contextmanager
     def _session(self):
         """Session scope that always commits/rolls back and closes."""
@@ -107,28 +222,60 @@ class Database(commands.Cog):
         Each tick credits only the time elapsed *since the last flush* and
         resets the marker, so a user online for N hours is credited N hours
         (the old code re-added the full elapsed time every hour).
+
+        Every user's delta is written by one bulk upsert in one transaction;
+        this used to be a lock, a thread hop and a commit per connected user.
         """
-        now = datetime.datetime.now(datetime.timezone.utc)
-        # Keyed by (guild_id, user_id) - bot.py tracks a user's voice presence
-        # per-guild, since the same user can be connected in two guilds at once.
-        for key, join_time in list(self.bot.online_users.items()):
-            if self.bot.online_users.get(key) is not join_time:
-                # Disconnected (or disconnected-and-reconnected) while we were
-                # awaiting a previous user's flush in this same tick: their
-                # time for this segment was already flushed by
-                # on_voice_state_update, so don't resurrect them here or
-                # double-count it.
-                continue
-            seconds = int((now - join_time).total_seconds())
-            if seconds <= 0:
-                continue
-            self.bot.online_users[key] = now
-            _, user_id = key
-            try:
-                async with self._user_locks[user_id]:
-                    await asyncio.to_thread(self._update_user_duration, user_id, seconds)
-            except Exception:
-                self.logger.exception("Failed to update duration for %s", user_id)
+        started = time.perf_counter()
+        # Held across snapshot and write so a GDPR erasure (which also takes
+        # it) lands either wholly before the snapshot or after the write.
+        async with self._ledger_lock:
+            now = datetime.datetime.now(datetime.timezone.utc)
+            deltas = defaultdict(int)
+            credited = {}
+            # Keyed by (guild_id, user_id) - bot.py tracks a user's voice
+            # presence per-guild, since the same user can be connected in two
+            # guilds at once; the DB credit is summed per user_id. Nothing is
+            # awaited while walking it, so no connect/disconnect can interleave.
+            for key, join_time in list(self.bot.online_users.items()):
+                seconds = int((now - join_time).total_seconds())
+                if seconds <= 0:
+                    continue
+                self.bot.online_users[key] = now
+                credited[key] = join_time
+                deltas[key[1]] += seconds
+            collected = time.perf_counter()
+            if deltas:
+                try:
+                    await asyncio.to_thread(
+                        self._credit_voice_time,
+                        {key: (join_time, now) for key, join_time in credited.items()},
+                        now,
+                    )
+                except Exception:
+                    self.logger.exception(
+                        "Failed to update durations for %d user(s)", len(deltas)
+                    )
+                    # Put back the old markers of anyone still connected, so
+                    # the next tick credits this tick's time as well.
+                    for key, join_time in credited.items():
+                        if self.bot.online_users.get(key) is now:
+                            self.bot.online_users[key] = join_time
+                    deltas = {}
+        finished = time.perf_counter()
+        self.last_duration_tick = {
+            "users": len(deltas),
+            "seconds": sum(deltas.values()),
+            "collect_ms": (collected - started) * 1000,
+            "write_ms": (finished - collected) * 1000,
+        }
+        if deltas:
+            self.logger.info(
+                "Credited voice time to %d user(s) in %.1f ms (%.1f ms writing)",
+                len(deltas),
+                (finished - started) * 1000,
+                (finished - collected) * 1000,
+            )
 
     @update_user_durations.before_loop
     async def _before_durations(self):
@@ -138,37 +285,241 @@ class Database(commands.Cog):
     async def _durations_error(self, error):
         self.logger.exception("update_user_durations loop errored", exc_info=error)
 
-    def _update_user_duration(self, user_id, additional_seconds):
+    def _credit_voice_time(self, spans, mark_at=None):
+        """Credit ``spans`` ({(guild_id, user_id): (start, end)}) in one transaction.
+
+        With ``mark_at``, the spans' journaled sessions move to it in the same
+        transaction, so a crash can't leave time both credited and pending.
+        """
         with self._session() as session:
-            # Atomic SET x = x + inc at the DB level, so two concurrent flushes
-            # for the same user (e.g. the hourly tick and a disconnect landing
-            # close together) both apply instead of one clobbering the other.
-            updated = (
-                session.query(User)
-                .filter(User.id == user_id)
-                .update(
-                    {
-                        User.total_duration_seconds: User.total_duration_seconds
-                        + additional_seconds
-                    }
-                )
+            self._add_spans(session, spans)
+            if mark_at is not None:
+                self._mark_voice_sessions(session, spans, mark_at)
+
+    def _add_spans(self, session, spans):
+        """Add voice-time spans to users' totals and the per-guild rollups."""
+        per_user = defaultdict(int)
+        per_guild = defaultdict(int)
+        per_day = defaultdict(int)
+        for (guild_id, user_id), (start, end) in spans.items():
+            for day, seconds in _split_by_day(start, end):
+                per_user[user_id] += seconds
+                per_guild[(guild_id, user_id)] += seconds
+                per_day[(guild_id, user_id, day)] += seconds
+        self._add_durations(session, per_user)
+        if not per_guild:
+            return
+        self._upsert(
+            session,
+            GuildVoiceTime,
+            [
+                {"guild_id": guild_id, "user_id": user_id, "total_duration_seconds": s}
+                for (guild_id, user_id), s in per_guild.items()
+            ],
+            lambda new: {
+                "total_duration_seconds": GuildVoiceTime.total_duration_seconds
+                + new.total_duration_seconds
+            },
+        )
+        self._upsert(
+            session,
+            VoiceTimeRollup,
+            [
+                {"guild_id": guild_id, "user_id": user_id, "day": day, "seconds": s}
+                for (guild_id, user_id, day), s in per_day.items()
+            ],
+            lambda new: {"seconds": VoiceTimeRollup.seconds + new.seconds},
+        )
+
+    def _add_durations(self, session, deltas):
+        """Add ``deltas`` ({user_id: seconds}) to users' totals in one statement.
+
+        Atomic ``x = x + inc`` at the DB level, so a never-before-seen user is
+        inserted without a check-then-act race.
+        """
+        if not deltas:
+            return
+        self._upsert(
+            session,
+            User,
+            [
+                {"id": user_id, "total_duration_seconds": seconds}
+                for user_id, seconds in deltas.items()
+            ],
+            lambda new: {
+                "total_duration_seconds": User.total_duration_seconds
+                + new.total_duration_seconds
+            },
+        )
+
+    def _mark_voice_sessions(self, session, keys, now):
+        """Start (or restart) the journaled sessions of ``keys`` at ``now``."""
+        self._upsert(
+            session,
+            VoiceSession,
+            [
+                {
+                    "guild_id": guild_id,
+                    "user_id": user_id,
+                    "since": _naive_utc(now),
+                    "last_seen": _naive_utc(now),
+                }
+                for guild_id, user_id in keys
+            ],
+            lambda new: {"since": new.since, "last_seen": new.last_seen},
+        )
+
+    def _upsert(self, session, entity, rows, update):
+        """Insert ``rows``, applying ``update(new)`` where the key already exists.
+
+        ``new`` refers to the values that would have been inserted.
+        """
+        dialect = self.engine.dialect.name
+        if dialect in ("mysql", "mariadb"):
+            stmt = mysql_insert(entity).values(rows)
+            stmt = stmt.on_duplicate_key_update(**update(stmt.inserted))
+        elif dialect == "sqlite":
+            stmt = sqlite_insert(entity).values(rows)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=list(entity.__table__.primary_key.columns),
+                set_=update(stmt.excluded),
+            )
+        else:
+            raise NotImplementedError(f"No bulk upsert for {dialect}")
+        session.execute(stmt)
+
+    def duration_stats(self):
+        """Timings of the last voice-time tick, for diagnostics."""
+        return dict(self.last_duration_tick)
+
+    # ---- Voice session journal -----------------------------------------------
+    #
+    # bot.online_users only lives in memory, so a crash or `restart` used to
+    # lose up to an hour of uncredited time for everyone connected. Open
+    # sessions are mirrored in voice_sessions: written on join, moved forward
+    # with each hourly credit, checkpointed every VOICE_CHECKPOINT_SECONDS
+    # (one UPDATE for all of them) and deleted on disconnect. On startup,
+    # resume_voice_sessions picks them back up. Every journal write runs
+    # under the ledger lock, so none can land between another's snapshot of
+    # bot.online_users and its write.
+
+    async def open_voice_session(self, guild_id, user_id, since):
+        """Journal a voice session that started at ``since`` (called on join)."""
+        try:
+            async with self._voice_session_locks[(guild_id, user_id)]:
+                async with self._ledger_lock:
+                    await asyncio.to_thread(
+                        self._open_voice_session, guild_id, user_id, since
+                    )
+        except Exception:
+            self.logger.exception("Failed to journal voice session for %s", user_id)
+
+    def _open_voice_session(self, guild_id, user_id, since):
+        with self._session() as session:
+            self._mark_voice_sessions(session, [(guild_id, user_id)], since)
+
+    async def end_voice_session(self, guild_id, user_id, join_time):
+        """Credit a session's remaining time and close it (called on disconnect)."""
+        now = datetime.datetime.now(datetime.timezone.utc)
+        try:
+            async with self._voice_session_locks[(guild_id, user_id)]:
+                async with self._ledger_lock:
+                    await asyncio.to_thread(
+                        self._end_voice_session, guild_id, user_id, join_time, now
+                    )
+        except Exception:
+            self.logger.exception("Failed to flush duration for %s", user_id)
+
+    def _end_voice_session(self, guild_id, user_id, join_time, now):
+        with self._session() as session:
+            self._add_spans(session, {(guild_id, user_id): (join_time, now)})
+            session.query(VoiceSession).filter(
+                VoiceSession.guild_id == guild_id, VoiceSession.user_id == user_id
+            ).delete()
+
+    @tasks.loop(seconds=VOICE_CHECKPOINT_SECONDS)
+    async def checkpoint_voice_sessions(self):
+        await self._checkpoint()
+
+    @checkpoint_voice_sessions.error
+    async def _checkpoint_error(self, error):
+        self.logger.exception("checkpoint_voice_sessions loop errored", exc_info=error)
+
+    async def _checkpoint(self):
+        async with self._ledger_lock:
+            await asyncio.to_thread(
+                self._checkpoint_voice_sessions,
+                set(self.bot.online_users),
+                datetime.datetime.now(datetime.timezone.utc),
+                self._voice_sessions_resumed,
             )
-            if not updated:
-                session.add(
-                    User(id=user_id, total_duration_seconds=additional_seconds)
+
+    def _checkpoint_voice_sessions(self, tracked, now, prune):
+        """Mark the ``tracked`` sessions as seen at ``now``.
+
+        With ``prune``, journaled sessions that aren't tracked (e.g. left
+        behind by a failed write) are deleted rather than accruing time.
+        """
+        key = tuple_(VoiceSession.guild_id, VoiceSession.user_id)
+        with self._session() as session:
+            if tracked:
+                session.query(VoiceSession).filter(key.in_(tracked)).update(
+                    {VoiceSession.last_seen: _naive_utc(now)},
+                    synchronize_session=False,
                 )
+            if prune:
+                stale = session.query(VoiceSession)
+                if tracked:
+                    stale = stale.filter(key.not_in(tracked))
+                stale.delete(synchronize_session=False)
+
+    async def resume_voice_sessions(self, connected):
+        """Pick up the journaled sessions of the previous process.
+
+        ``connected`` holds the (guild_id, user_id) pairs in voice right now.
+        Returns {key: since} for the connected users whose session carries on.
+        Every other journaled session is credited up to its last checkpoint
+        and closed, and connected users without one get a new session
+        starting now. Sessions already in ``bot.online_users`` are live (e.g.
+        on a second on_ready) and left alone.
+        """
+        async with self._ledger_lock:
+            resumed = await asyncio.to_thread(
+                self._resume_voice_sessions,
+                set(connected),
+                set(self.bot.online_users),
+                datetime.datetime.now(datetime.timezone.utc),
+            )
+            self._voice_sessions_resumed = True
+            return resumed
 
-    async def flush_user_duration(self, user_id, join_time):
-        """Persist a single user's accrued time (called on disconnect)."""
-        seconds = int(
-            (datetime.datetime.now(datetime.timezone.utc) - join_time).total_seconds()
-        )
-        if seconds > 0:
-            try:
-                async with self._user_locks[user_id]:
-                    await asyncio.to_thread(self._update_user_duration, user_id, seconds)
-            except Exception:
-                self.logger.exception("Failed to flush duration for %s", user_id)
+    def _resume_voice_sessions(self, connected, tracked, now):
+        resumed = {}
+        credit = {}
+        with self._session() as session:
+            for row in session.query(VoiceSession).all():
+                key = (row.guild_id, row.user_id)
+                if key in tracked:
+                    continue
+                since = _aware_utc(row.since)
+                last_seen = _aware_utc(row.last_seen)
+                # Past the gap, the user may have left and come back while
+                # the bot was down: don't credit the outage.
+                if key in connected and now - last_seen <= VOICE_RESUME_MAX_GAP:
+                    resumed[key] = since
+                    continue
+                credit[key] = (since, last_seen)
+                session.delete(row)
+            self._add_spans(session, credit)
+            session.flush()
+            fresh = connected - tracked - set(resumed)
+            if fresh:
+                self._mark_voice_sessions(session, fresh, now)
+        if credit:
+            self.logger.info(
+                "Recovered voice time for %d session(s) from the journal", len(credit)
+            )
+        return resumed
 
     async def get_user_hours(self, user_id):
         return await asyncio.to_thread(self._get_user_hours, user_id)
@@ -178,13 +529,63 @@ class Database(commands.Cog):
             user = session.query(User).filter(User.id == user_id).first()
             return user.total_duration_seconds / 3600 if user else 0
 
-    async def get_all_user_hours(self):
-        return await asyncio.to_thread(self._get_all_user_hours)
+    async def get_top_user_hours(self, limit=5, exclude_ids=()):
+        """Top ``limit`` (user_id, hours) across all guilds, skipping ``exclude_ids``.
+
+        Served by the index on users.total_duration_seconds, so it reads
+        about ``limit`` rows instead of loading and sorting every user.
+        """
+        return await asyncio.to_thread(
+            self._get_top_user_hours, limit, tuple(exclude_ids)
+        )
+
+    def _get_top_user_hours(self, limit, exclude_ids):
+        with self._session() as session:
+            query = session.query(User.id, User.total_duration_seconds)
+            if exclude_ids:
+                query = query.filter(User.id.notin_(exclude_ids))
+            rows = (
+                query.order_by(User.total_duration_seconds.desc()).limit(limit).all()
+            )
+            return [(uid, secs / 3600) for uid, secs in rows]
+
+    async def get_guild_top_user_hours(self, guild_id, since_day=None, limit=5):
+        """Top ``limit`` (user_id, hours) in a guild, all-time or since ``since_day``.
+
+        Read from the rollups the voice-time credits maintain: all-time comes
+        straight off the guild_voice_time index, and a window only scans that
+        guild's rows for the days in it.
+        """
+        return await asyncio.to_thread(
+            self._get_guild_top_user_hours, guild_id, since_day, limit
+        )
 
-    def _get_all_user_hours(self):
+    def _get_guild_top_user_hours(self, guild_id, since_day, limit):
         with self._session() as session:
-            users = session.query(User.id, User.total_duration_seconds).all()
-            return [(uid, secs / 3600) for uid, secs in users]
+            if since_day is None:
+                rows = (
+                    session.query(
+                        GuildVoiceTime.user_id, GuildVoiceTime.total_duration_seconds
+                    )
+                    .filter(GuildVoiceTime.guild_id == guild_id)
+                    .order_by(GuildVoiceTime.total_duration_seconds.desc())
+                    .limit(limit)
+                    .all()
+                )
+            else:
+                total = func.sum(VoiceTimeRollup.seconds)
+                rows = (
+                    session.query(VoiceTimeRollup.user_id, total)
+                    .filter(
+                        VoiceTimeRollup.guild_id == guild_id,
+                        VoiceTimeRollup.day >= since_day,
+                    )
+                    .group_by(VoiceTimeRollup.user_id)
+                    .order_by(total.desc())
+                    .limit(limit)
+                    .all()
+                )
+            return [(uid, secs / 3600) for uid, secs in rows]
 
     # ---- Chess ---------------------------------------------------------------
 
@@ -245,53 +646,212 @@ class Database(commands.Cog):
 
     # ---- Songs ---------------------------------------------------------------
 
-    async def save_song(self, song_data, requested_by_user_id):
+    def record_song_play(self, song_data, requested_by_user_id):
+        """Buffer one song play for the next bulk write.
+
+        Called from the playback path, so it never touches the database: it
+        used to be a thread hop, a session and a commit per song. Plays are
+        written by :meth:`flush_song_plays`, which runs once
+        ``song_flush_size`` are pending, every ``SONG_FLUSH_SECONDS`` and on
+        unload. Errors are logged, never raised into playback.
+        """
         try:
-            await asyncio.to_thread(self._save_song, song_data, requested_by_user_id)
+            self._song_buffer.append(Song.row(song_data, requested_by_user_id))
+            if len(self._song_buffer) >= self.song_flush_size and (
+                self._song_flush_task is None or self._song_flush_task.done()
+            ):
+                self._song_flush_task = asyncio.create_task(self.flush_song_plays())
         except Exception:
             self.logger.exception("Error saving song")
 
-    def _save_song(self, song_data, requested_by_user_id):
+    async def flush_song_plays(self):
+        """Write every buffered play in one transaction; returns how many."""
+        async with self._song_flush_lock:
+            rows, self._song_buffer = self._song_buffer, []
+            if not rows:
+                return 0
+            try:
+                await asyncio.to_thread(self._insert_songs, rows)
+            except Exception:
+                self.logger.exception("Failed to save %d song play(s)", len(rows))
+                # Keep them for the next flush, ahead of newer plays.
+                self._song_buffer[:0] = rows
+                dropped = len(self._song_buffer) - SONG_BUFFER_MAX
+                if dropped > 0:
+                    del self._song_buffer[:dropped]
+                    self.logger.warning("Dropped %d unsaved song play(s)", dropped)
+                return 0
+            self.songs_flushed += len(rows)
+            self.song_flushes += 1
+            return len(rows)
+
+    def _insert_songs(self, rows):
         with self._session() as session:
-            session.add(Song(song_data, requested_by_user_id))
+            session.execute(insert(Song), rows)
+            self._count_song_plays(session, rows)
+
+    def _count_song_plays(self, session, rows):
+        """Add ``rows``' plays to the counters, in the caller's transaction."""
+        plays = Counter()
+        titles = {}
+        requests = Counter()
+        for row in rows:
+            if row["original_url"] is not None:
+                plays[row["original_url"]] += 1
+                titles[row["original_url"]] = row["title"]
+            if row["requested_by_user_id"] is not None:
+                requests[row["requested_by_user_id"]] += 1
+        if plays:
+            self._upsert(
+                session,
+                SongPlayCount,
+                [
+                    {"original_url": url, "title": titles[url], "play_count": count}
+                    for url, count in plays.items()
+                ],
+                lambda new: {
+                    "title": new.title,
+                    "play_count": SongPlayCount.play_count + new.play_count,
+                },
+            )
+        if requests:
+            self._upsert(
+                session,
+                SongRequestCount,
+                [
+                    {"requested_by_user_id": user_id, "request_count": count}
+                    for user_id, count in requests.items()
+                ],
+                lambda new: {
+                    "request_count": SongRequestCount.request_count
+                    + new.request_count
+                },
+            )
+
+    @tasks.loop(seconds=SONG_FLUSH_SECONDS)
+    async def flush_song_buffer(self):
+        await self.flush_song_plays()
+
+    @flush_song_buffer.error
+    async def _song_buffer_error(self, error):
+        self.logger.exception("flush_song_buffer loop errored", exc_info=error)
 
     async def get_most_played_songs(self):
+        # Buffered plays count too.
+        await self.flush_song_plays()
         return await asyncio.to_thread(self._get_most_played_songs)
 
     def _get_most_played_songs(self):
+        # Read off the play_count index instead of grouping all of songs.
         with self._session() as session:
             rows = (
                 session.query(
-                    Song.original_url,
-                    Song.title,
-                    func.count(Song.id).label("total_plays"),
+                    SongPlayCount.original_url,
+                    SongPlayCount.title,
+                    SongPlayCount.play_count,
                 )
-                .group_by(Song.original_url, Song.title)
-                .order_by(func.count(Song.id).desc())
+                .order_by(SongPlayCount.play_count.desc())
                 .limit(5)
                 .all()
             )
-            return [(r.original_url, r.title, r.total_plays) for r in rows]
+            return [(r.original_url, r.title, r.play_count) for r in rows]
+
+    # ---- Music sessions ------------------------------------------------------
+
+    async def save_music_session(self, guild_id, snapshot, position):
+        await asyncio.to_thread(self._save_music_session, guild_id, snapshot, position)
+
+    def _save_music_session(self, guild_id, snapshot, position):
+        with self._session() as session:
+            session.merge(
+                MusicSession(
+                    guild_id=guild_id,
+                    snapshot=snapshot,
+                    position=position,
+                    updated_at=datetime.datetime.now(datetime.timezone.utc),
+                )
+            )
+
+    async def save_music_session_position(self, guild_id, position):
+        await asyncio.to_thread(self._save_music_session_position, guild_id, position)
+
+    def _save_music_session_position(self, guild_id, position):
+        with self._session() as session:
+            session.query(MusicSession).filter(
+                MusicSession.guild_id == guild_id
+            ).update(
+                {
+                    MusicSession.position: position,
+                    MusicSession.updated_at: datetime.datetime.now(
+                        datetime.timezone.utc
+                    ),
+                }
+            )
+
+    async def delete_music_session(self, guild_id):
+        await asyncio.to_thread(self._delete_music_session, guild_id)
+
+    def _delete_music_session(self, guild_id):
+        with self._session() as session:
+            session.query(MusicSession).filter(
+                MusicSession.guild_id == guild_id
+            ).delete()
+
+    async def get_music_sessions(self):
+        return await asyncio.to_thread(self._get_music_sessions)
+
+    def _get_music_sessions(self):
+        with self._session() as session:
+            rows = session.query(
+                MusicSession.guild_id, MusicSession.snapshot, MusicSession.position
+            ).all()
+            return [(r.guild_id, r.snapshot, r.position) for r in rows]
 
     # ---- Data subject requests (GDPR) ---------------------------------------
 
     async def delete_user_data(self, user_id):
         """Erase all personal data stored for a user."""
-        async with self._user_locks[user_id]:
-            return await asyncio.to_thread(self._delete_user_data, user_id)
+        # Holding the flush lock keeps an in-flight flush from writing this
+        # user's plays back after they're deleted.
+        async with self._ledger_lock:
+            async with self._song_flush_lock:
+                self._song_buffer = [
+                    row
+                    for row in self._song_buffer
+                    if row["requested_by_user_id"] != user_id
+                ]
+                return await asyncio.to_thread(self._delete_user_data, user_id)
 
     def _delete_user_data(self, user_id):
         with self._session() as session:
             deleted = (
                 session.query(User).filter(User.id == user_id).delete()
             )
+            # Take the user's plays back out of the play counters.
+            plays = (
+                session.query(Song.original_url, func.count(Song.id))
+                .filter(Song.requested_by_user_id == user_id)
+                .group_by(Song.original_url)
+                .all()
+            )
+            for url, count in plays:
+                session.query(SongPlayCount).filter(
+                    SongPlayCount.original_url == url
+                ).update({SongPlayCount.play_count: SongPlayCount.play_count - count})
+            session.query(SongPlayCount).filter(SongPlayCount.play_count <= 0).delete()
+            session.query(SongRequestCount).filter(
+                SongRequestCount.requested_by_user_id == user_id
+            ).delete()
             session.query(Song).filter(
                 Song.requested_by_user_id == user_id
             ).delete()
+            for entity in (VoiceSession, GuildVoiceTime, VoiceTimeRollup):
+                session.query(entity).filter(entity.user_id == user_id).delete()
             return deleted
 
     async def get_user_data(self, user_id):
         """Return a summary of the personal data stored for a user."""
+        await self.flush_song_plays()
         return await asyncio.to_thread(self._get_user_data, user_id)
 
     def _get_user_data(self, user_id):
@@ -308,21 +868,21 @@ class Database(commands.Cog):
             }
 
     async def get_most_song_requests(self):
+        await self.flush_song_plays()
         return await asyncio.to_thread(self._get_most_song_requests)
 
     def _get_most_song_requests(self):
         with self._session() as session:
             rows = (
                 session.query(
-                    Song.requested_by_user_id,
-                    func.count(Song.id).label("total_requests"),
+                    SongRequestCount.requested_by_user_id,
+                    SongRequestCount.request_count,
                 )
-                .group_by(Song.requested_by_user_id)
-                .order_by(func.count(Song.id).desc())
+                .order_by(SongRequestCount.request_count.desc())
                 .limit(5)
                 .all()
             )
-            return [(r.requested_by_user_id, r.total_requests) for r in rows]
+            return [(r.requested_by_user_id, r.request_count) for r in rows]
 
 
 async def setup(bot):
@@ -0,0 +1,17 @@
+from sqlalchemy import BigInteger, Column, DateTime, Float, Text
+from sqlalchemy.dialects.mysql import LONGTEXT
+
+from cogs.db.base import Base
+
+
+class MusicSession(Base):
+    """A guild's last saved music session, restored after a restart."""
+
+    __tablename__ = "music_sessions"
+    guild_id = Column(BigInteger, primary_key=True, autoincrement=False)
+    # JSON written by cogs.utils.music.session_store; lyrics make it too big
+    # for MySQL's 64KB TEXT.
+    snapshot = Column(Text().with_variant(LONGTEXT, "mysql"), nullable=False)
+    # Kept out of the snapshot so advancing playback is a one-column update.
+    position = Column(Float, default=0)
+    updated_at = Column(DateTime)
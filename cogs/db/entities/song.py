@@ -11,12 +11,19 @@ class Song(Base):
     __tablename__ = "songs"
     id = Column(Integer, primary_key=True)  # Auto-generated primary key
     title = Column(String(255))
-    original_url = Column(String(255))
+    original_url = Column(String(255), index=True)
     artist = Column(String(100))
-    requested_by_user_id = Column(BigInteger)
+    requested_by_user_id = Column(BigInteger, index=True)
 
     def __init__(self, song_data, requested_by_user_id):
-        self.title = song_data["title"]
-        self.original_url = song_data["original_url"]
-        self.artist = song_data.get("uploader", "N/A")
-        self.requested_by_user_id = requested_by_user_id
+        super().__init__(**self.row(song_data, requested_by_user_id))
+
+    @staticmethod
+    def row(song_data, requested_by_user_id):
+        """Column values for one play, as used by bulk inserts."""
+        return {
+            "title": song_data["title"],
+            "original_url": song_data["original_url"],
+            "artist": song_data.get("uploader", "N/A"),
+            "requested_by_user_id": requested_by_user_id,
+        }
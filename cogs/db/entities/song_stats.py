@@ -0,0 +1,21 @@
+from sqlalchemy import BigInteger, Column, Integer, String
+
+from cogs.db.base import Base
+
+
+class SongPlayCount(Base):
+    """How often a song (by URL) has been played, kept in step with ``songs``."""
+
+    __tablename__ = "song_play_counts"
+    original_url = Column(String(255), primary_key=True)
+    # The title the song was last played under.
+    title = Column(String(255))
+    play_count = Column(Integer, nullable=False, default=0, index=True)
+
+
+class SongRequestCount(Base):
+    """How many songs a user has requested, kept in step with ``songs``."""
+
+    __tablename__ = "song_request_counts"
+    requested_by_user_id = Column(BigInteger, primary_key=True, autoincrement=False)
+    request_count = Column(Integer, nullable=False, default=0, index=True)
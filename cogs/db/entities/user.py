@@ -5,4 +5,5 @@ from cogs.db.base import Base
 class User(Base):
     __tablename__ = "users"
     id = Column(BigInteger, primary_key=True)
-    total_duration_seconds = Column(Integer, default=0)
+    # Indexed so the leaderboard's top N is read off the end of the index.
+    total_duration_seconds = Column(Integer, default=0, index=True)
@@ -0,0 +1,18 @@
+from sqlalchemy import BigInteger, Column, DateTime
+
+from cogs.db.base import Base
+
+
+class VoiceSession(Base):
+    """A voice session that hasn't been fully credited to ``users`` yet.
+
+    ``since`` is the in-memory marker of ``bot.online_users`` (join time, or
+    the last hourly credit); ``last_seen`` is the last checkpoint at which the
+    user was known to still be connected. Both are naive UTC.
+    """
+
+    __tablename__ = "voice_sessions"
+    guild_id = Column(BigInteger, primary_key=True, autoincrement=False)
+    user_id = Column(BigInteger, primary_key=True, autoincrement=False)
+    since = Column(DateTime, nullable=False)
+    last_seen = Column(DateTime, nullable=False)
@@ -0,0 +1,32 @@
+from sqlalchemy import BigInteger, Column, Date, Index, Integer
+
+from cogs.db.base import Base
+
+
+class VoiceTimeRollup(Base):
+    """Voice time a user spent in one guild on one (UTC) day."""
+
+    __tablename__ = "voice_time_rollups"
+    guild_id = Column(BigInteger, primary_key=True, autoincrement=False)
+    user_id = Column(BigInteger, primary_key=True, autoincrement=False)
+    day = Column(Date, primary_key=True)
+    seconds = Column(Integer, nullable=False, default=0)
+
+    # "This guild, since <day>" leaderboards range-scan this.
+    __table_args__ = (Index("ix_voice_time_rollups_guild_day", "guild_id", "day"),)
+
+
+class GuildVoiceTime(Base):
+    """A user's all-time voice time in one guild."""
+
+    __tablename__ = "guild_voice_time"
+    guild_id = Column(BigInteger, primary_key=True, autoincrement=False)
+    user_id = Column(BigInteger, primary_key=True, autoincrement=False)
+    total_duration_seconds = Column(Integer, nullable=False, default=0)
+
+    # A guild's all-time top N is read straight off this index.
+    __table_args__ = (
+        Index(
+            "ix_guild_voice_time_guild_total", "guild_id", "total_duration_seconds"
+        ),
+    )
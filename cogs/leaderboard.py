@@ -1,10 +1,18 @@
 import asyncio
+import datetime
 import logging
 
 from discord.ext import commands
 
 from cogs.utils.emojis import DONE, ERROR
 
+# leaderboard period -> (heading, days back); None days means all time.
+# "server" and "week" read this guild's voice-time rollups.
+GUILD_PERIODS = {
+    "server": ("this server", None),
+    "week": ("this server, last 7 days", 7),
+}
+
 
 class Leaderboard(commands.Cog):
 
@@ -14,14 +22,35 @@ class Leaderboard(commands.Cog):
 
     @commands.hybrid_command(aliases=["lb"])
     @commands.cooldown(1, 5, commands.BucketType.channel)
-    async def leaderboard(self, ctx):
-        """Gets the leaderboard for the top 5 users with most hours."""
+    async def leaderboard(self, ctx, period: str = "all"):
+        """Top 5 users by voice hours: `all` (default), `server` or `week`."""
+        period = period.lower()
+        if period != "all" and period not in GUILD_PERIODS:
+            await ctx.send("Unknown period. Use `all`, `server` or `week`.")
+            return
+        if period in GUILD_PERIODS and ctx.guild is None:
+            await ctx.send("That leaderboard is only available in a server.")
+            return
         db = self.bot.get_cog("Database")
         if db is None:
             await ctx.send("Leaderboard is temporarily unavailable.")
             return
+        heading = None
         try:
-            user_hours_list = await db.get_all_user_hours()
+            if period in GUILD_PERIODS:
+                heading, days = GUILD_PERIODS[period]
+                since_day = None
+                if days is not None:
+                    since_day = datetime.datetime.now(
+                        datetime.timezone.utc
+                    ).date() - datetime.timedelta(days=days - 1)
+                top = await db.get_guild_top_user_hours(
+                    ctx.guild.id, since_day=since_day, limit=5
+                )
+            else:
+                top = await db.get_top_user_hours(
+                    5, exclude_ids=(self.bot.user.id,)
+                )
         except Exception:
             self.logger.exception("Failed to fetch leaderboard data")
             await ctx.message.clear_reactions()
@@ -29,16 +58,13 @@ class Leaderboard(commands.Cog):
             await ctx.send("Something went wrong fetching the leaderboard.")
             return
 
-        bot_user_id = self.bot.user.id
-        user_hours_list = [uh for uh in user_hours_list if uh[0] != bot_user_id]
-        top = sorted(user_hours_list, key=lambda x: x[1], reverse=True)[:5]
-
         # Resolve the (few) needed users concurrently instead of one-by-one.
         members = await asyncio.gather(
             *(self._resolve_user(uid) for uid, _ in top), return_exceptions=True
         )
 
-        leaderboard_message = "🏆 **Leaderboard** 🏆\n\n"
+        title = f"Leaderboard ({heading})" if heading else "Leaderboard"
+        leaderboard_message = f"🏆 **{title}** 🏆\n\n"
         for index, ((user_id, hours), member) in enumerate(zip(top, members), start=1):
             username = (
                 member.name
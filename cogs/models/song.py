@@ -3,8 +3,11 @@ import discord
 
 
 class Song:
-    def __init__(self, path, info, message, lyrics=None):
+    def __init__(self, path, info, message, lyrics=None, stream_url=None):
+        # `path` is None while a streamed song is still downloading in the
+        # background; until then playback reads from `stream_url`.
         self.path = path
+        self.stream_url = stream_url
         self.info = info
         self.message = message
         self.messages_to_delete = []
@@ -12,6 +15,13 @@ class Song:
         self.lyrics_sent = False
         self.current_seconds = 0
         self.embed_message = None
+        # Set once the playlist has dropped this song's audio cache reference.
+        self.audio_released = False
+
+    @property
+    def source(self):
+        """What to hand to ffmpeg: the local file once it exists."""
+        return self.path or self.stream_url
 
     @property
     def title(self):
@@ -90,6 +100,11 @@ class Song:
     def lyrics(self):
         return self._lyrics
 
+    @lyrics.setter
+    def lyrics(self, lyrics):
+        # Set when the lyrics prefetch finishes, possibly mid-song.
+        self._lyrics = lyrics
+
     def to_embed(self, queue, shuffle=False, loop=False):
         embed = discord.Embed(title=self.title, color=0x3498DB, url=self.url)
         details = f"{self.time_since_upload}\n{self.views} views\nRequested by <@{self.message.author.id}>"
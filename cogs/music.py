@@ -1,17 +1,26 @@
 import asyncio
 import logging
 import os
+import time
 import uuid
 
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 
-from cogs.api.youtube import DOWNLOAD_DIR
 from cogs.utils.config import load_config
 from cogs.utils.emojis import DONE, ERROR
 from cogs.utils.music.guild_state import GuildMusicState
+from cogs.utils.music.services import MusicServices
+from cogs.utils.music.session_store import DEFAULT_INTERVAL, SessionStore
 from cogs.utils.music.state_machine import State
 
+# A guild's music state is dropped once it has been idle (disconnected, nothing
+# queued) this long, and rebuilt by get_state() the next time it's needed.
+DEFAULT_STATE_IDLE_MINUTES = 30
+STATE_EVICTION_CHECK_SECONDS = 60
+# Backstop for downloads nothing references any more (see FileRegistry).
+DOWNLOAD_SWEEP_MINUTES = 30
+
 
 class Music(commands.Cog):
     def __init__(self, bot, config):
@@ -21,16 +30,91 @@ class Music(commands.Cog):
         # One music state per guild so guilds don't share a voice client,
         # playlist or download queue.
         self.guild_states: dict[int, GuildMusicState] = {}
-        # Paths that have finished downloading but aren't in any guild's
-        # playlist yet (e.g. a Spotify-sourced request still awaiting lyrics
-        # before Downloader.download_next_song() calls playlist.add()) -
-        # cleanup_files must not delete these out from under that guild.
-        self.pending_download_paths: set[str] = set()
+        self.state_idle_seconds = 60 * int(
+            config.get("guild_state_idle_minutes", DEFAULT_STATE_IDLE_MINUTES)
+        )
+        self.states_created = 0
+        self.states_evicted = 0
+        # One set of API clients, caches and the download executor for every
+        # guild, handed to each GuildMusicState.
+        self.services = MusicServices(config)
+        # Saves each guild's queue so a restart can pick up where it left off.
+        self.session_store = SessionStore(
+            self,
+            interval=int(config.get("session_snapshot_seconds", DEFAULT_INTERVAL)),
+        )
 
     def get_state(self, guild) -> GuildMusicState:
-        if guild.id not in self.guild_states:
-            self.guild_states[guild.id] = GuildMusicState(self, guild)
-        return self.guild_states[guild.id]
+        state = self.guild_states.get(guild.id)
+        if state is None:
+            state = GuildMusicState(self, guild, self.services)
+            self.guild_states[guild.id] = state
+            self.states_created += 1
+            if not self.evict_idle_states.is_running():
+                self.evict_idle_states.start()
+        # Just used: restart its idle clock.
+        state.idle_since = None
+        return state
+
+    @tasks.loop(seconds=STATE_EVICTION_CHECK_SECONDS)
+    async def evict_idle_states(self):
+        """Drop guild states that have been idle for ``state_idle_seconds``.
+
+        Otherwise every guild that ever played a song keeps its playlist,
+        player, state machine and downloader for the life of the process.
+        The loop stops once no states are left; get_state() restarts it.
+        """
+        now = time.monotonic()
+        for guild_id, state in list(self.guild_states.items()):
+            if not state.idle():
+                state.idle_since = None
+            elif state.idle_since is None:
+                state.idle_since = now
+            elif now - state.idle_since >= self.state_idle_seconds:
+                try:
+                    await self.evict_state(guild_id)
+                except Exception:
+                    self.logger.exception("Failed to evict music state for %s", guild_id)
+        if not self.guild_states:
+            self.evict_idle_states.stop()
+
+    async def evict_state(self, guild_id):
+        state = self.guild_states.pop(guild_id, None)
+        if state is None:
+            return
+        await state.state_machine.stop()
+        self.services.download_scheduler.forget(state.downloader)
+        self.states_evicted += 1
+        self.logger.info(
+            "Evicted idle music state for guild %s (%d live)",
+            guild_id,
+            len(self.guild_states),
+        )
+
+    def state_stats(self):
+        return {
+            "live": len(self.guild_states),
+            "created": self.states_created,
+            "evicted": self.states_evicted,
+        }
+
+    @tasks.loop(minutes=DOWNLOAD_SWEEP_MINUTES)
+    async def sweep_downloads(self):
+        """Delete orphaned files in DOWNLOAD_DIR, off the event loop."""
+        try:
+            await asyncio.to_thread(self.services.file_registry.sweep)
+        except Exception:
+            self.logger.exception("Failed to sweep orphaned downloads")
+
+    async def cog_load(self):
+        # Task loops must not be started before there is a running event loop.
+        self.sweep_downloads.start()
+
+    async def cog_unload(self):
+        self.evict_idle_states.cancel()
+        self.sweep_downloads.cancel()
+        self.services.close()
+        self.session_store.close()
 
     def _state_for_ctx(self, ctx) -> GuildMusicState:
         return self.get_state(ctx.guild)
@@ -49,6 +133,12 @@ class Music(commands.Cog):
         if state is not None and guild.voice_client is None:
             await state.teardown()
 
+    def handle_voice_state_update(self, guild):
+        """Someone joined or left voice: let the guild re-check its listeners."""
+        state = self.guild_states.get(guild.id)
+        if state is not None:
+            state.state_machine.notify()
+
     # Response Helpers
     async def cog_success(self, message):
         try:
@@ -78,25 +168,6 @@ class Music(commands.Cog):
         with open(file_name, "rb") as file:
             return await channel.send(file=discord.File(file, file_name))
 
-    # Cleanup: only touches the dedicated downloads directory. DOWNLOAD_DIR is
-    # shared by every guild, so `keep` must cover every guild's current song
-    # and queue, not just the guild that triggered this cleanup - otherwise a
-    # busy guild's files get deleted out from under it.
-    def cleanup_files(self, current_song, queue):
-        if not os.path.isdir(DOWNLOAD_DIR):
-            return
-        keep = {current_song.path} | {s.path for s in queue} | self.pending_download_paths
-        for state in self.guild_states.values():
-            playlist = state.playlist
-            if playlist.current_song:
-                keep.add(playlist.current_song.path)
-            keep.update(s.path for s in playlist.songs)
-        for file_name in os.listdir(DOWNLOAD_DIR):
-            full_path = os.path.join(DOWNLOAD_DIR, file_name)
-            if full_path in keep:
-                continue
-            delete_file(full_path, self.logger)
-
     def _require_voice(self, ctx):
         return ctx.message.author.voice is not None
 
@@ -207,6 +278,27 @@ class Music(commands.Cog):
             sent_message = await ctx.send("DJ Khaled is not paused!")
             await self.cog_failure(sent_message, ctx.message)
 
+    @commands.hybrid_command()
+    @commands.guild_only()
+    async def seek(self, ctx, position: str):
+        """Jumps to a position in the current song, e.g. 1:30 or 90."""
+        state = self._state_for_ctx(ctx)
+        seconds = parse_timestamp(position)
+        if seconds is None:
+            sent_message = await ctx.send("Use a position like **1:30** or **90**.")
+            await self.cog_failure(sent_message, ctx.message)
+            return
+        if state.state_machine.get_state() not in (State.PLAYING, State.PAUSED):
+            sent_message = await ctx.send("DJ Khaled is not playing anything!")
+            await self.cog_failure(sent_message, ctx.message)
+            return
+        if state.player.seek(seconds) is None:
+            sent_message = await ctx.send("That's past the end of the song!")
+            await self.cog_failure(sent_message, ctx.message)
+            return
+        await state.playlist.update_curr_song_message()
+        await self.cog_success(ctx.message)
+
     @commands.hybrid_command()
     @commands.guild_only()
     async def lyrics(self, ctx):
@@ -385,9 +477,12 @@ async def setup(bot):
     await bot.add_cog(Music(bot, load_config()))
 
 
-def delete_file(file_path, logger):
-    try:
-        os.remove(file_path)
-        logger.info(f"File {file_path} deleted successfully")
-    except Exception as e:
-        logger.info(f"Error deleting file {file_path}. Error: {e}")
+def parse_timestamp(text):
+    """Seconds for "SS", "M:SS" or "H:MM:SS", or None if it isn't one."""
+    parts = text.strip().split(":")
+    if len(parts) > 3 or not all(part.isdigit() for part in parts):
+        return None
+    seconds = 0
+    for part in parts:
+        seconds = seconds * 60 + int(part)
+    return seconds
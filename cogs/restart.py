@@ -20,6 +20,15 @@ class Restart(commands.Cog):
         """Restarts the bot and resets its state (owner/admin only)."""
         await ctx.message.add_reaction(PROCESSING)
 
+        # Save every guild's queue as it is now, so the new process resumes
+        # it instead of what the last periodic snapshot saw.
+        music = self.bot.get_cog("Music")
+        if music is not None:
+            try:
+                await music.session_store.flush()
+            except Exception:
+                self.logger.exception("Failed to save music sessions")
+
         try:
             subprocess.Popen(["aws/scripts/application-start.sh"])
         except OSError:
@@ -36,6 +45,9 @@ class Restart(commands.Cog):
             except Exception:
                 self.logger.exception("Failed to record startup notification")
 
+        if music is not None:
+            # Tearing down voice on close mustn't be saved as sessions ending.
+            music.session_store.close()
         await self.bot.close()
 
 
@@ -17,6 +17,9 @@ LICHESS_CHALLENGE_OPEN_URL = f"{LICHESS_BASE_URL}/api/challenge/open"
 
 GENIUS_BASE_URL = "https://api.genius.com"
 
+SPOTIFY_API_URL = "https://api.spotify.com/v1"
+SPOTIFY_TOKEN_URL = "https://accounts.spotify.com/api/token"
+
 FOOTBALL_API_BASE_URL = "https://v3.football.api-sports.io"
 
 FORMULA1_API_BASE_URL = "https://v1.formula-1.api-sports.io"
@@ -0,0 +1,189 @@
+"""Content-addressed on-disk cache of downloaded audio.
+
+Every download used to land under a fresh ``uuid4`` name and was deleted as
+soon as no guild had it queued, so a song replayed a few minutes later was
+fetched and transcoded from scratch. Finished downloads are now stored under a
+stable ``<extractor>-<video id>.<ext>`` name in ``DOWNLOAD_DIR`` and kept
+around, within a size budget, until they are the least recently used entry
+*and* no guild still references them.
+
+The cache is shared by every guild and is touched from both the event loop and
+the download executor threads, so all bookkeeping happens under one lock.
+"""
+
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger("discord")
+
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+
+# Video ids legitimately contain "-" (YouTube's do), so only the extractor
+# name is stripped of it - that keeps the first "-" an unambiguous separator.
+_UNSAFE_EXTRACTOR_CHARS = re.compile(r"[^A-Za-z0-9_]")
+_UNSAFE_ID_CHARS = re.compile(r"[^A-Za-z0-9_-]")
+# "<extractor>-<id>.<ext>": legacy uuid downloads are all digits with no "-",
+# so they are never mistaken for cache entries when re-indexing on startup.
+_CACHE_FILE_RE = re.compile(r"^[A-Za-z0-9_]+-[A-Za-z0-9_-]+\.\w+$")
+
+
+class _Entry:
+    __slots__ = ("path", "size", "refs")
+
+    def __init__(self, path, size, refs=0):
+        self.path = path
+        self.size = size
+        self.refs = refs
+
+
+class AudioCache:
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        # Least recently used first.
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+        self._paths: dict[str, str] = {}
+        self._total_bytes = 0
+        self._load()
+
+    def _load(self):
+        """Re-index entries left on disk by a previous run, oldest first."""
+        if not os.path.isdir(self.directory):
+            return
+        found = []
+        for file_name in os.listdir(self.directory):
+            if not _CACHE_FILE_RE.match(file_name):
+                continue
+            path = os.path.join(self.directory, file_name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            found.append((stat.st_mtime, file_name, path, stat.st_size))
+        for _mtime, file_name, path, size in sorted(found):
+            self._add(file_name, _Entry(path, size))
+        if found:
+            logger.info(
+                "Audio cache loaded %d entries (%d bytes)",
+                len(self._entries),
+                self._total_bytes,
+            )
+
+    def _add(self, key, entry):
+        self._entries[key] = entry
+        self._paths[entry.path] = key
+        self._total_bytes += entry.size
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._paths.pop(entry.path, None)
+        self._total_bytes -= entry.size
+        return entry
+
+    @staticmethod
+    def key_for(info, audio_format):
+        """Cache key for a resolved yt-dlp info dict, or None if uncacheable."""
+        extractor = info.get("extractor_key") or info.get("extractor")
+        video_id = info.get("id")
+        # A livestream's "file" is whatever part of the stream was captured.
+        if not extractor or not video_id or info.get("is_live"):
+            return None
+        extractor = _UNSAFE_EXTRACTOR_CHARS.sub("_", str(extractor))
+        video_id = _UNSAFE_ID_CHARS.sub("_", str(video_id))
+        return f"{extractor}-{video_id}.{audio_format}"
+
+    def lookup(self, key):
+        """Return the cached path for ``key`` with a reference held, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and not os.path.exists(entry.path):
+                # Removed behind our back (manual cleanup, disk wipe).
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            entry.refs += 1
+            self._entries.move_to_end(key)
+        try:
+            # mtime doubles as the persisted LRU order across restarts.
+            os.utime(entry.path)
+        except OSError:
+            pass
+        return entry.path
+
+    def store(self, key, file_path):
+        """Move a finished download into the cache, returning the cached path.
+
+        The returned path has a reference held for the caller. If another
+        download of the same video won the race, the duplicate is discarded.
+        """
+        path = os.path.join(self.directory, key)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                os.replace(file_path, path)
+                entry = _Entry(path, os.path.getsize(path))
+                self._add(key, entry)
+            elif file_path != entry.path:
+                _remove_quietly(file_path)
+            entry.refs += 1
+            self._entries.move_to_end(key)
+            self._evict_locked()
+        return entry.path
+
+    def owns(self, path):
+        with self._lock:
+            return path in self._paths
+
+    def release(self, path):
+        """Drop one reference to ``path``; unknown paths are ignored."""
+        with self._lock:
+            key = self._paths.get(path)
+            if key is None:
+                return
+            entry = self._entries[key]
+            entry.refs = max(entry.refs - 1, 0)
+
+    def evict(self):
+        with self._lock:
+            self._evict_locked()
+
+    def _evict_locked(self):
+        if self._total_bytes <= self.max_bytes:
+            return
+        for key in list(self._entries):
+            if self._total_bytes <= self.max_bytes:
+                break
+            entry = self._entries[key]
+            if entry.refs:
+                continue
+            self._remove(key)
+            self.evictions += 1
+            _remove_quietly(entry.path)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except OSError as e:
+        logger.debug("Could not remove cached audio %s: %s", path, e)
@@ -0,0 +1,72 @@
+"""Process-wide download scheduler shared by every guild.
+
+Each guild's :class:`~cogs.utils.music.downloader.Downloader` used to own a
+single-thread executor and a ``tasks.loop`` that pulled one song every 30
+seconds, so a 25-track album took ~12 minutes to materialize while every guild
+kept its own idle thread around. Downloads are now dispatched from here, as
+soon as something changes (a song is queued, a download finishes, a song
+starts playing) instead of on a timer:
+
+* ``max_concurrent`` caps downloads in flight across the whole process, and
+  they all run on one shared executor.
+* Guilds with work are served round-robin, one download at a time, so a huge
+  import in one guild can't starve a single ``play`` in another.
+* Each guild only keeps ``lookahead`` songs downloaded or downloading ahead of
+  the one playing; the rest stay queued until playback catches up.
+"""
+
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger("discord")
+
+DEFAULT_MAX_CONCURRENT = 4
+DEFAULT_LOOKAHEAD = 3
+
+
+class DownloadScheduler:
+    def __init__(self, max_concurrent=DEFAULT_MAX_CONCURRENT, lookahead=DEFAULT_LOOKAHEAD):
+        self.max_concurrent = max_concurrent
+        self.lookahead = lookahead
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_concurrent, thread_name_prefix="download"
+        )
+        self.in_flight = 0
+        # Downloaders with queued work, in round-robin order.
+        self._waiting: deque = deque()
+
+    def notify(self, downloader):
+        """Tell the scheduler a guild may have new work (or new room for it)."""
+        if downloader not in self._waiting:
+            self._waiting.append(downloader)
+        self._dispatch()
+
+    def forget(self, downloader):
+        try:
+            self._waiting.remove(downloader)
+        except ValueError:
+            pass
+
+    def _dispatch(self):
+        # Every pass either starts a download or drops a downloader that has
+        # nothing startable, so this always terminates.
+        while self._waiting and self.in_flight < self.max_concurrent:
+            downloader = self._waiting.popleft()
+            if not downloader.wants_download(self.lookahead):
+                continue
+            task = downloader.start_next()
+            self.in_flight += 1
+            task.add_done_callback(self._on_done)
+            if downloader.wants_download(self.lookahead):
+                self._waiting.append(downloader)
+
+    def _on_done(self, task):
+        self.in_flight -= 1
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Download task failed", exc_info=task.exception())
+        self._dispatch()
+
+    def shutdown(self):
+        self._waiting.clear()
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -1,76 +1,134 @@
 import asyncio
 import logging
-import os
-import random
-from concurrent.futures import ThreadPoolExecutor
+from contextlib import aclosing
+from operator import itemgetter
 
-from discord.ext import tasks
-
-from cogs.api.genius import GeniusAPI
-from cogs.api.spotify import SpotifyAPI
-from cogs.api.youtube import YouTubeAPI
 from cogs.utils.emojis import PROCESSING
+from cogs.utils.music.song_queue import SongQueue
 from cogs.utils.music.state_machine import State
 
+# Download queue items are (query, request message, spotify_req) tuples.
+_item_message = itemgetter(1)
+
 
 class Downloader:
     def __init__(self, state):
         # `state` is the per-guild GuildMusicState.
         self.state = state
         self.logger = logging.getLogger("discord")
-        self.queue = []
-        self.queue_cancelled = False
-        # A single shared executor rather than one per download.
-        self.executor = ThreadPoolExecutor(max_workers=1)
-        # Guards the is_running()-then-start() section in enqueue(): without
-        # it, two overlapping play calls can both observe the loop as not
-        # running (across the `await download_next_song()` in between) and
-        # both call .start(), and the second start() raises RuntimeError.
-        self._start_lock = asyncio.Lock()
-
-        self.spotify = SpotifyAPI(state.config)
-        self.youtube = YouTubeAPI(state.config)
-        self.genius = GeniusAPI(state.config)
+        self._queue = SongQueue(message_of=_item_message)
+        # Items popped off `queue` whose download hasn't been committed to
+        # the playlist (or dropped) yet.
+        self.in_flight = []
+        # Process-wide: owns the shared executor and decides when this
+        # guild's next download starts (see DownloadScheduler).
+        self.scheduler = state.services.download_scheduler
+        self.files = state.services.file_registry
+        # Bumped by clear(): a download started under an older generation
+        # finishes into the void instead of resurrecting a cleared queue.
+        self._generation = 0
+        # Parallel downloads finish in any order, but songs are committed to
+        # the playlist in the order they were queued. `_next_commit` only
+        # moves past a seq once every earlier one has finished too, so a
+        # failed download never lets a later song jump an unfinished one.
+        self._next_seq = 0
+        self._next_commit = 0
+        self._finished = set()
+        self._commit_order = asyncio.Condition()
+        # Stream mode: a song is queued as soon as it's resolved and plays
+        # from its media URL while the file downloads in the background.
+        self.stream_playback = str(
+            state.config.get("stream_playback", "false")
+        ).lower() in ("1", "true", "yes")
+        self._background_downloads = set()
+        # Lyrics lookups run alongside the download instead of holding up the
+        # song being queued; see _attach_lyrics().
+        self._lyrics_tasks = set()
+
+        # Process-wide clients (see MusicServices): every guild shares one
+        # Spotify token, one HTTP session and the same caches.
+        self.spotify = state.services.spotify
+        self.youtube = state.services.youtube
+        self.genius = state.services.genius
+
+    @property
+    def queue(self):
+        return self._queue
+
+    @queue.setter
+    def queue(self, queue):
+        self._queue = SongQueue(queue, message_of=_item_message)
 
     def set_queue(self, queue):
         self.queue = queue
 
-    def set_queue_cancelled(self, value: bool):
-        self.queue_cancelled = value
+    def busy(self):
+        """True while songs are queued or still downloading."""
+        return bool(self.queue or self.in_flight)
 
-    @tasks.loop(seconds=30)
-    async def process_queue(self):
-        try:
-            if len(self.queue) == 0:
-                self.process_queue.stop()
-                return
-            await self.download_next_song()
-        except Exception:
-            self.logger.exception("Error processing download queue")
+    def idle(self):
+        """True when nothing is queued or downloading, even in the background."""
+        return not self.busy() and not self._background_downloads
+
+    def wants_download(self, lookahead):
+        if not self.queue:
+            return False
+        ahead = len(self.state.playlist.songs) + len(self.in_flight)
+        return ahead < lookahead
+
+    def schedule(self):
+        """Ask the shared scheduler to (re)consider this guild's queue."""
+        self.scheduler.notify(self)
 
-    async def get_spotify_songs(self, url, message):
-        song_names = []
+    def start_next(self):
+        """Pop the next queued song and start downloading it in a task.
+
+        Called by the scheduler, which accounts for the task it returns.
+        """
+        item, seq = self._pop_next()
+        return asyncio.create_task(self._download(item, seq, self._generation))
+
+    async def iter_spotify_songs(self, url, message, limit=None):
+        """Yield queue items for a Spotify link, a page at a time."""
         if "/playlist/" in url:
-            song_names = await self.spotify.get_playlist_songs(url)
+            pages = self.spotify.iter_playlist_songs(url, limit)
         elif "/album/" in url:
-            song_names = await self.spotify.get_album_songs(url)
+            pages = self.spotify.iter_album_songs(url, limit)
         else:
-            spotify_name = await self.spotify.get_track_name(url)
-            song_names.append(spotify_name)
-
-        # Always return a concrete list (the old code left `songs` unbound when
-        # song_names was empty, raising UnboundLocalError).
-        return [(song_name, message, True) for song_name in song_names]
-
-    async def download_next_song(self):
-        if len(self.queue) == 0:
+            yield [(await self.spotify.get_track_name(url), message, True)]
             return
+        async with aclosing(pages):
+            async for song_names in pages:
+                yield [(song_name, message, True) for song_name in song_names]
+
+    def _pop_next(self):
+        item = self.queue.pop(shuffle=self.state.playlist.shuffle)
+        self.in_flight.append(item)
+        seq = self._next_seq
+        self._next_seq += 1
+        return item, seq
 
-        pop_index = 0
-        if self.state.playlist.shuffle:
-            pop_index = random.randint(0, len(self.queue) - 1)
+    async def _download(self, item, seq, generation):
+        try:
+            await self._download_and_commit(item, seq, generation)
+        finally:
+            self.in_flight.remove(item)
+            async with self._commit_order:
+                # Seqs below _next_commit were skipped by clear().
+                if seq >= self._next_commit:
+                    self._finished.add(seq)
+                while self._next_commit in self._finished:
+                    self._finished.remove(self._next_commit)
+                    self._next_commit += 1
+                self._commit_order.notify_all()
+            # Room may have opened up in this guild's lookahead window.
+            self.schedule()
+            # An idle countdown may have been on hold for this download.
+            self.state.state_machine.notify()
 
-        next_song_name, message, spotify_req = self.queue.pop(pop_index)
+    async def _download_and_commit(self, item, seq, generation):
+        next_song_name, message, spotify_req = item
+        lyrics = self._prefetch_lyrics(next_song_name) if spotify_req else None
 
         try:
             existing_reactions = [reaction.emoji for reaction in message.reactions]
@@ -79,15 +137,31 @@ class Downloader:
         except Exception as e:
             self.logger.debug("Could not add loading reaction: %s", e)
 
+        # One executor hop: metadata is extracted once and the resolved info
+        # dict is reused for the download instead of re-extracting.
+        fetch = self.youtube.resolve_and_download
+        if self.stream_playback:
+            fetch = self.youtube.resolve_for_streaming
         try:
-            is_playable = await self.state.bot.loop.run_in_executor(
-                self.executor, self.youtube.is_video_playable, next_song_name
+            result = await self.state.bot.loop.run_in_executor(
+                self.scheduler.executor, fetch, next_song_name
             )
+            stream_url = None
+            if result is not None and result[0] is None:
+                stream_url = result[1].get("url")
+                if stream_url is None:
+                    # Merged/fragmented formats have no single URL to stream.
+                    result = await self.state.bot.loop.run_in_executor(
+                        self.scheduler.executor,
+                        self.youtube.download_to_cache,
+                        next_song_name,
+                        result[1],
+                    )
         except Exception:
-            self.logger.exception("Error checking playability of %s", next_song_name)
-            is_playable = False
+            self.logger.exception("Error downloading %s", next_song_name)
+            result = None
 
-        if not is_playable:
+        if result is None:
             sent_message = await message.channel.send(
                 f"**{next_song_name}** is too long or there was an error "
                 "downloading the song. Try another query."
@@ -95,51 +169,36 @@ class Downloader:
             await self.state.cog_failure(sent_message, message)
             return
 
-        try:
-            next_song_path, next_song_info = await self.state.bot.loop.run_in_executor(
-                self.executor, self.youtube.download, next_song_name
-            )
-        except Exception:
-            self.logger.exception("Error downloading %s", next_song_name)
-            sent_message = await message.channel.send(
-                f"**{next_song_name}** is too long or there was an error "
-                "downloading the song. Try another query."
-            )
-            await self.state.cog_failure(sent_message, message)
-            return
+        next_song_path, next_song_info = result
 
-        # The file is on disk but not in any guild's playlist yet - reserve it
-        # so another guild's cleanup_files() (triggered by e.g. the
-        # `await self.genius.fetch_lyrics(...)` below) can't delete it out
-        # from under this download before playlist.add() runs.
-        self.state.cog.pending_download_paths.add(next_song_path)
+        # This download holds the file until the Song it becomes takes over
+        # the reference (or it's released below).
+        self.files.track(next_song_path)
+        added = None
         try:
-            if self.queue_cancelled:
-                # The queue was cancelled while this download was in flight: the
-                # song will never play, so don't react success and don't leak the
-                # file that was just downloaded for it. Only stop the download
-                # queue here - the state machine may still be actively playing a
-                # previous song (e.g. a plain `clear`), and stopping it would
-                # silently kill that playback's progress/idle-timeout tracking.
-                self.set_queue_cancelled(False)
-                self.process_queue.stop()
-                self._delete_file_quietly(next_song_path)
+            async with self._commit_order:
+                await self._commit_order.wait_for(lambda: self._next_commit >= seq)
+
+            if generation != self._generation:
+                # The queue was cleared while this download was in flight: the
+                # song will never play, so don't react success (the file is
+                # released below). The state machine is left alone - it may
+                # still be actively playing a previous song (e.g. a plain
+                # `clear`).
                 try:
                     await message.clear_reactions()
                 except Exception:
                     pass
                 return
 
-            lyrics = None
             if spotify_req:
-                lyrics = await self.genius.fetch_lyrics(next_song_name)
                 next_song_name = f"{next_song_name} audio"
 
             # React success (or send a failure) only once the song is actually
             # queued - reacting beforehand left a false "done" checkmark on
             # requests dropped because the requester left voice mid-download.
             added = await self.state.playlist.add(
-                next_song_path, next_song_info, message, lyrics
+                next_song_path, next_song_info, message, None, stream_url
             )
             if not added:
                 sent_message = await message.channel.send(
@@ -149,60 +208,129 @@ class Downloader:
                 await self.state.cog_failure(sent_message, message)
                 return
 
-            if all(message is not item[1] for item in self.queue):
+            if lyrics is not None:
+                self._attach_lyrics(added, lyrics)
+            if stream_url is not None:
+                self._persist_in_background(added, next_song_name, next_song_info)
+
+            pending = self.queue.has_message(message) or any(
+                other is not item and other[1] is message for other in self.in_flight
+            )
+            if not pending:
                 await self.state.cog_success(message)
 
             await self.state.playlist.update_message()
         finally:
-            self.state.cog.pending_download_paths.discard(next_song_path)
+            if not added:
+                # Never reached the playlist, so nothing else will release it.
+                self._discard_download(next_song_path)
 
-    def _delete_file_quietly(self, file_path):
-        try:
-            os.remove(file_path)
-        except OSError as e:
-            self.logger.debug("Could not remove leftover download %s: %s", file_path, e)
+    def _prefetch_lyrics(self, song_name):
+        task = asyncio.create_task(self.genius.fetch_lyrics(song_name))
+        self._lyrics_tasks.add(task)
+        task.add_done_callback(self._lyrics_tasks.discard)
+        return task
+
+    def _attach_lyrics(self, song, task):
+        """Give ``song`` its lyrics now if they're ready, else once they are."""
+
+        def attach(task):
+            if task.cancelled():
+                return
+            # May run inside _download_and_commit: never raise into it.
+            if task.exception() is not None:
+                self.logger.error(
+                    "Lyrics lookup failed for %s", song.title, exc_info=task.exception()
+                )
+                return
+            song.lyrics = task.result()
+
+        if task.done():
+            attach(task)
+        else:
+            task.add_done_callback(attach)
+
+    def _persist_in_background(self, song, query, info):
+        """Download a streaming song's file and switch the Song over to it."""
+
+        async def persist():
+            try:
+                path, _ = await self.state.bot.loop.run_in_executor(
+                    self.scheduler.executor,
+                    self.youtube.download_to_cache,
+                    query,
+                    info,
+                )
+            except Exception:
+                self.logger.exception("Background download of %s failed", query)
+                return
+            self.files.track(path)
+            if song.audio_released:
+                # The song finished (or was cleared) before its download did.
+                self._discard_download(path)
+            else:
+                song.path = path
+
+        task = asyncio.create_task(persist())
+        self._background_downloads.add(task)
+        task.add_done_callback(self._background_downloads.discard)
+
+    def _discard_download(self, file_path):
+        # A cached file may be shared with other guilds (or replayed later),
+        # so this only drops this request's reference to it.
+        self.files.release(file_path)
 
     async def enqueue(self, query, message):
+        playlist = self.state.playlist
+        room = playlist.max_size - len(self.queue) - len(playlist.songs)
         if "spotify.com" in query:
-            songs = await self.get_spotify_songs(query, message)
+            # Long playlists arrive a page at a time: the first page is queued
+            # (and starts downloading) while the rest are still being fetched.
+            # One past the room left, so a truncated import is noticed.
+            pages = self.iter_spotify_songs(query, message, max(room, 0) + 1)
         else:
-            songs = [(query, message, False)]
+            pages = _single_page([(query, message, False)])
 
         dropped = 0
-        for song in songs:
-            if song not in self.queue:
-                playlist = self.state.playlist
-                combined_total = len(self.queue) + len(playlist.songs)
-                if combined_total + 1 <= playlist.max_size:
-                    self.queue.append(song)
-                    if self.queue_cancelled:
-                        self.set_queue_cancelled(False)
-                else:
-                    dropped += 1
+        async with aclosing(pages):
+            async for songs in pages:
+                for song in songs:
+                    if song in self.queue:
+                        continue
+                    if len(self.queue) + len(playlist.songs) < playlist.max_size:
+                        self.queue.append(song)
+                    else:
+                        dropped += 1
+                self.schedule()
+                self.state.state_machine.start()
+                if dropped:
+                    # Don't fetch more pages of songs that can't be queued.
+                    break
 
         if dropped:
             # Otherwise a full playlist/album import silently drops the songs
             # that don't fit, with no indication anything was left out.
             await message.channel.send(
-                f"Queue is full ({self.state.playlist.max_size} max) - "
-                f"{dropped} song(s) from this request were not added."
+                f"Queue is full ({playlist.max_size} max) - "
+                "the rest of this request was not added."
             )
 
-        async with self._start_lock:
-            if not self.process_queue.is_running():
-                await self.download_next_song()
-                self.process_queue.start()
-
-        self.state.state_machine.start()
-
     async def clear(self):
         self.logger.info("Clearing download queue")
         self.set_queue([])
-        self.set_queue_cancelled(True)
+        self.scheduler.forget(self)
+        async with self._commit_order:
+            self._generation += 1
+            # Downloads queued from now on don't wait behind the cleared ones.
+            self._next_commit = self._next_seq
+            self._finished.clear()
+            self._commit_order.notify_all()
 
     async def stop(self):
         self.logger.info("Stopping downloader")
-        if self.process_queue.is_running():
-            self.process_queue.cancel()
         await self.clear()
         self.state.state_machine.transition_to(State.STOPPED)
+
+
+async def _single_page(songs):
+    yield songs
@@ -0,0 +1,162 @@
+"""Shared, rate-limit-aware scheduler for the music embeds' edits.
+
+Every playing guild used to edit its now-playing embed every two seconds, and
+every finished download re-edited the playlist embed straight away. Discord
+rate-limits message edits per channel, so that traffic regularly ran the
+bucket dry and discord.py then held back *all* of the bot's edits in that
+channel until it reset. Edits now go through one :class:`EmbedUpdater`:
+
+* Edits are queued per channel and sent at most once per that channel's
+  interval. A newer edit of a message still waiting to go out replaces the
+  older one instead of queuing behind it.
+* Edits whose rendered embed is identical to what was last sent are dropped.
+* A channel is forgotten once nothing is queued for it and its interval has
+  run out, so the bot doesn't keep state for every channel it ever edited in.
+* The interval adapts to the ``X-RateLimit-*`` headers Discord sends back:
+  it spreads the edits left in the current window evenly, waits for the reset
+  when the bucket is empty, and backs off on a 429.
+
+The headers are read through the ``http_trace`` hook discord.py offers for its
+own HTTP session (see :meth:`Khaled._http_trace`).
+"""
+
+import asyncio
+import logging
+import re
+import time
+from collections import OrderedDict
+
+import discord
+
+logger = logging.getLogger("discord")
+
+DEFAULT_MIN_INTERVAL = 2.0
+DEFAULT_MAX_INTERVAL = 30.0
+
+# PATCH /channels/{channel_id}/messages/{message_id}
+_EDIT_ROUTE = re.compile(r"/channels/(\d+)/messages/\d+$")
+# Rendered content of recently edited messages, for the unchanged check.
+_MAX_TRACKED_MESSAGES = 1024
+
+
+class _Channel:
+    __slots__ = ("interval", "next_at", "pending", "task")
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.next_at = 0.0
+        # message id -> (message, embed, rendered), oldest first.
+        self.pending: OrderedDict = OrderedDict()
+        self.task = None
+
+
+class EmbedUpdater:
+    def __init__(
+        self, min_interval=DEFAULT_MIN_INTERVAL, max_interval=DEFAULT_MAX_INTERVAL
+    ):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.sent = 0
+        self.skipped = 0
+        self.coalesced = 0
+        self.failed = 0
+        self.rate_limited = 0
+        self._channels: dict[int, _Channel] = {}
+        self._last_sent: OrderedDict = OrderedDict()
+
+    def submit(self, message, embed):
+        """Queue ``message.edit(embed=embed)``; returns without waiting for it."""
+        rendered = embed.to_dict()
+        channel_id = message.channel.id
+        channel = self._channels.get(channel_id)
+
+        if channel is not None and channel.pending.pop(message.id, None) is not None:
+            self.coalesced += 1
+        if self._last_sent.get(message.id) == rendered:
+            self.skipped += 1
+            return
+        if channel is None:
+            channel = self._channels[channel_id] = _Channel(self.min_interval)
+        channel.pending[message.id] = (message, embed, rendered)
+        if channel.task is None or channel.task.done():
+            channel.task = asyncio.create_task(self._drain(channel_id, channel))
+
+    async def _drain(self, channel_id, channel):
+        while True:
+            delay = channel.next_at - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            # Everything queued may have been superseded while we slept.
+            if not channel.pending:
+                break
+            message_id, (message, embed, rendered) = channel.pending.popitem(last=False)
+            try:
+                await message.edit(embed=embed)
+            except discord.NotFound:
+                self._last_sent.pop(message_id, None)
+            except Exception as e:
+                self.failed += 1
+                logger.warning("Failed to update embed message %s: %s", message_id, e)
+            else:
+                self.sent += 1
+                self._remember(message_id, rendered)
+            channel.next_at = max(channel.next_at, time.monotonic() + channel.interval)
+        # Idle and past its interval: an edit from now on may go out at once,
+        # so there's nothing left to remember about this channel.
+        if self._channels.get(channel_id) is channel:
+            del self._channels[channel_id]
+
+    def _remember(self, message_id, rendered):
+        self._last_sent[message_id] = rendered
+        self._last_sent.move_to_end(message_id)
+        while len(self._last_sent) > _MAX_TRACKED_MESSAGES:
+            self._last_sent.popitem(last=False)
+
+    def observe(self, method, path, status, headers):
+        """Adapt a channel's interval to the response to one of its edits."""
+        if method != "PATCH":
+            return
+        match = _EDIT_ROUTE.search(path)
+        if match is None:
+            return
+        channel = self._channels.get(int(match.group(1)))
+        if channel is None:
+            return
+        now = time.monotonic()
+
+        if status == 429:
+            self.rate_limited += 1
+            retry_after = float(headers.get("Retry-After", channel.interval))
+            channel.interval = min(channel.interval * 2, self.max_interval)
+            channel.next_at = max(channel.next_at, now + retry_after)
+            return
+
+        remaining = headers.get("X-RateLimit-Remaining")
+        reset_after = headers.get("X-RateLimit-Reset-After")
+        if remaining is None or reset_after is None:
+            return
+        remaining, reset_after = int(remaining), float(reset_after)
+        if remaining == 0:
+            # Out of edits: wait for the window to reset ourselves rather
+            # than have discord.py queue the channel's other edits behind us.
+            channel.next_at = max(channel.next_at, now + reset_after)
+            interval = reset_after
+        else:
+            interval = reset_after / remaining
+        channel.interval = min(max(interval, self.min_interval), self.max_interval)
+
+    def stats(self):
+        return {
+            "sent": self.sent,
+            "skipped": self.skipped,
+            "coalesced": self.coalesced,
+            "failed": self.failed,
+            "rate_limited": self.rate_limited,
+            "channels": len(self._channels),
+        }
+
+    def close(self):
+        for channel in self._channels.values():
+            if channel.task is not None:
+                channel.task.cancel()
+        self._channels.clear()
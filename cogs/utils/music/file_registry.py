@@ -0,0 +1,115 @@
+"""Reference-counted registry of downloaded audio files.
+
+Every song start used to call ``Music.cleanup_files``, which built a keep-set
+from every guild's current song and queue and then listed the whole shared
+``DOWNLOAD_DIR`` to delete whatever wasn't in it. That cost grew with
+guilds x queue length + files on disk. It also needed a separate
+"pending download" set so a finished file couldn't be deleted before it
+reached a playlist.
+
+Files are now deleted when their last reference goes:
+
+* A file the :class:`~cogs.utils.music.audio_cache.AudioCache` owns is
+  refcounted (and evicted) by the cache.
+* Any other download is :meth:`track`-ed with one reference when it finishes,
+  and deleted on the :meth:`release` that drops it to zero.
+
+A queued song's reference passes to its :class:`~cogs.models.song.Song`,
+which keeps it until the song has finished playing: ffmpeg has the file open
+and a seek, loop replay or voice-drop resume reopens it.
+
+:meth:`sweep` is a slow, periodic backstop for files nothing references:
+leftovers from a crash, or yt-dlp temp files from a download that failed.
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import Counter
+
+logger = logging.getLogger("discord")
+
+# An untracked file younger than this may still be being written by yt-dlp.
+DEFAULT_ORPHAN_MIN_AGE = 60 * 60
+
+
+class FileRegistry:
+    def __init__(self, directory, cache):
+        self.directory = directory
+        self.cache = cache
+        self.deleted = 0
+        self.swept = 0
+        self._lock = threading.Lock()
+        self._refs: Counter = Counter()
+
+    def track(self, path):
+        """Hold a reference to a finished download the audio cache doesn't own."""
+        if path is None or self.cache.owns(path):
+            return
+        with self._lock:
+            self._refs[path] += 1
+
+    def release(self, path):
+        """Drop one reference to ``path``, deleting it if that was the last."""
+        if path is None:
+            return
+        if self.cache.owns(path):
+            self.cache.release(path)
+            # The cache may have gone over budget while this was referenced.
+            self.cache.evict()
+            return
+        with self._lock:
+            if path not in self._refs:
+                return
+            self._refs[path] -= 1
+            if self._refs[path] > 0:
+                return
+            del self._refs[path]
+        self._delete(path)
+        self.deleted += 1
+
+    def tracked(self, path):
+        with self._lock:
+            return path in self._refs
+
+    def sweep(self, min_age=DEFAULT_ORPHAN_MIN_AGE):
+        """Delete files nothing references that are older than ``min_age`` seconds.
+
+        Blocking (it lists the directory); run it in a worker thread.
+        """
+        try:
+            entries = list(os.scandir(self.directory))
+        except OSError:
+            return 0
+        cutoff = time.time() - min_age
+        removed = 0
+        for entry in entries:
+            path = entry.path
+            if self.tracked(path) or self.cache.owns(path):
+                continue
+            try:
+                if not entry.is_file() or entry.stat().st_mtime > cutoff:
+                    continue
+            except OSError:
+                continue
+            if self._delete(path):
+                removed += 1
+        self.swept += removed
+        if removed:
+            logger.info("Swept %d orphaned download(s)", removed)
+        return removed
+
+    def stats(self):
+        with self._lock:
+            tracked = len(self._refs)
+        return {"tracked": tracked, "deleted": self.deleted, "swept": self.swept}
+
+    @staticmethod
+    def _delete(path):
+        try:
+            os.remove(path)
+            return True
+        except OSError as e:
+            logger.debug("Could not remove download %s: %s", path, e)
+            return False
@@ -6,28 +6,48 @@ a time and a second guild's songs leaked into the first guild's channel. Each
 guild now gets its own :class:`GuildMusicState`; the ``Music`` cog owns a
 ``guild_id -> GuildMusicState`` map and routes every command to the caller's
 guild.
+
+Process-wide clients and caches come from the cog's
+:class:`~cogs.utils.music.services.MusicServices`, so a guild's state holds only
+its own queue, player and state machine. The cog evicts a state that has been
+idle for ``guild_state_idle_minutes`` and rebuilds it on the next command.
 """
 
 import logging
 
 from cogs.utils.music.downloader import Downloader
 from cogs.utils.music.player import Player
-from cogs.utils.music.playlist import Playlist
+from cogs.utils.music.playlist import DEFAULT_MAX_SIZE, Playlist
 from cogs.utils.music.state_machine import State, StateMachine
 
 
 class GuildMusicState:
-    def __init__(self, cog, guild):
+    def __init__(self, cog, guild, services):
         self.cog = cog
+        self.services = services
         self.bot = cog.bot
         self.guild = guild
         self.config = cog.config
         self.logger = logging.getLogger("discord")
 
-        self.playlist = Playlist(self)
+        self.playlist = Playlist(
+            self, max_size=int(self.config.get("max_playlist_size", DEFAULT_MAX_SIZE))
+        )
         self.player = Player(self)
         self.state_machine = StateMachine(self)
         self.downloader = Downloader(self)
+        # When the cog's eviction sweep first saw this guild idle.
+        self.idle_since = None
+
+    def idle(self):
+        """True when nothing is connected, playing, queued or downloading."""
+        return (
+            self.state_machine.get_state() == State.DISCONNECTED
+            and self.player.voice_client is None
+            and self.playlist.current_song is None
+            and not self.playlist.songs
+            and self.downloader.idle()
+        )
 
     # Presentation helpers proxied to the cog so the internal classes don't need
     # to know about Discord reaction plumbing.
@@ -37,15 +57,18 @@ class GuildMusicState:
     async def cog_failure(self, sent_message, query_message):
         await self.cog.cog_failure(sent_message, query_message)
 
-    def cleanup_files(self, current_song, queue):
-        self.cog.cleanup_files(current_song, queue)
+    def release_audio(self, path):
+        self.services.file_registry.release(path)
+
+    def update_embed(self, message, embed):
+        self.services.embed_updater.submit(message, embed)
 
     async def stop(self, ctx=None):
-        # state_machine.stop() cancels the handle_state loop's own task, which
-        # is the task running this code when called from an auto-stop tick
+        # state_machine.stop() cancels the state machine's own task, which is
+        # the task running this code when called from an auto-stop step
         # (idle timeout / alone-in-channel). Cancelling first meant the
         # CancelledError surfaced at player.stop()'s voice disconnect await
-        # and skipped every cleanup step after it - so cancel the loop last,
+        # and skipped every cleanup step after it - so cancel the task last,
         # once all other cleanup has actually run.
         await self.downloader.stop()
         await self.player.stop()
@@ -61,5 +84,5 @@ class GuildMusicState:
         await self.state_machine.stop()
         await self.downloader.clear()
         await self.player.stop()
-        await self.playlist.clear()
+        await self.playlist.reset()
         self.state_machine.set_state(State.DISCONNECTED)
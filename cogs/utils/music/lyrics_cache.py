@@ -0,0 +1,56 @@
+"""Persistent cache of song title -> Genius lyrics.
+
+Every Spotify-sourced song used to cost a Genius search plus a lyrics page
+fetch, even when the same track had been requested minutes earlier, and songs
+Genius has no lyrics for were searched again on every request. Lookups are now
+remembered in a small SQLite file next to the resolve cache, keyed by the
+normalized title:
+
+* lyrics are kept for ``ttl_seconds`` so corrections eventually get picked up;
+* "no lyrics" results are kept too, for the shorter ``negative_ttl_seconds``;
+* failed lookups (network errors, rate limits) are not cached at all.
+"""
+
+import os
+
+from cogs.utils.music.sqlite_cache import SqliteCache
+
+LYRICS_CACHE_PATH = os.environ.get("DZ_LYRICS_CACHE_PATH", "lyrics_cache.db")
+
+DEFAULT_TTL_SECONDS = 30 * 24 * 60 * 60
+DEFAULT_NEGATIVE_TTL_SECONDS = 24 * 60 * 60
+DEFAULT_MAX_ENTRIES = 10_000
+
+# Returned by get() for a title that isn't cached; None is a cached "no lyrics".
+MISSING = object()
+
+
+class LyricsCache(SqliteCache):
+    table = "lyrics"
+    key_column = "title"
+    value_column = "lyrics"
+    value_type = "TEXT"
+    missing = MISSING
+
+    def __init__(
+        self,
+        path=LYRICS_CACHE_PATH,
+        ttl_seconds=DEFAULT_TTL_SECONDS,
+        negative_ttl_seconds=DEFAULT_NEGATIVE_TTL_SECONDS,
+        max_entries=DEFAULT_MAX_ENTRIES,
+    ):
+        super().__init__(path, ttl_seconds, max_entries)
+        self.negative_ttl_seconds = negative_ttl_seconds
+
+    def _ttl_for(self, lyrics):
+        return self.ttl_seconds if lyrics is not None else self.negative_ttl_seconds
+
+    def _expired_clause(self, now):
+        return (
+            f"created_at < ? OR ({self.value_column} IS NULL AND created_at < ?)",
+            (now - self.ttl_seconds, now - self.negative_ttl_seconds),
+        )
+
+    def get(self, title):
+        """Return the cached lyrics for ``title`` (None if it has none), or MISSING."""
+        return super().get(title)
@@ -1,5 +1,5 @@
-import asyncio
 import logging
+import threading
 import time
 
 import discord
@@ -7,6 +7,56 @@ import discord
 from cogs.models.song import Song
 from cogs.utils.music.state_machine import State
 
+# discord.py pulls one 20ms frame per read() from the playing source.
+FRAME_SECONDS = discord.opus.Encoder.FRAME_LENGTH / 1000
+
+# Keep a streamed song going through the dropped connections and expiring
+# chunks that are routine on long-lived media URLs.
+STREAM_BEFORE_OPTIONS = "-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5"
+
+
+class _FrameCounter(discord.AudioSource):
+    """Wraps the playing source to count the frames actually sent to voice.
+
+    The wrapped ffmpeg source can be swapped for one opened at another offset
+    (see :meth:`Player.seek`) without the voice client noticing - going
+    through ``VoiceClient.source`` would resume a paused song and race the
+    audio thread's in-progress ``read()``.
+    """
+
+    def __init__(self, source, start=0.0):
+        self.source = source
+        self.start = start
+        self.frames = 0
+        # Set once the source ran dry: the song played to its end (or ffmpeg
+        # failed), as opposed to playback being cut off from outside.
+        self.finished = False
+        self._lock = threading.Lock()
+
+    def read(self):
+        with self._lock:
+            data = self.source.read()
+            if data:
+                self.frames += 1
+            else:
+                self.finished = True
+        return data
+
+    def swap(self, source, start):
+        """Continue from ``source``, which begins ``start`` seconds in."""
+        with self._lock:
+            old, self.source = self.source, source
+            self.start = start
+            self.frames = 0
+            self.finished = False
+        return old
+
+    def is_opus(self):
+        return self.source.is_opus()
+
+    def cleanup(self):
+        self.source.cleanup()
+
 
 class Player:
     def __init__(self, state):
@@ -16,22 +66,45 @@ class Player:
         self.end_timestamp = None
         self.idle_timeout = 300
         self.audio_source = None
+        self._frame_counter = None
         self.logger = logging.getLogger("discord")
 
-    async def play(self, song: Song):
+    @property
+    def position(self):
+        """Seconds of the current song played so far.
+
+        Derived from the frames the voice client has actually read, so it
+        stands still while paused or buffering and needs no timer to advance.
+        """
+        counter = self._frame_counter
+        if counter is None:
+            return 0.0
+        return counter.start + counter.frames * FRAME_SECONDS
+
+    def interrupted(self):
+        """True if the last song stopped before its end without being skipped.
+
+        That's what a voice connection drop looks like: discord.py gives up
+        on the track while it waits to reconnect.
+        """
+        return self._frame_counter is not None and not self._frame_counter.finished
+
+    async def play(self, song: Song, offset=0.0):
         if self.state.state_machine.get_state() == State.PLAYING:
             self.logger.warning("Already playing a song, skipping play request.")
             return
 
         playlist = self.state.playlist
         self.logger.info("Starting playback")
-        self.play_audio(song.path)
+        self.play_audio(song.source, offset)
         # A stale end_timestamp from the idle gap before this song started
         # would otherwise make the next idle period look like it's already
         # exceeded idle_timeout on its very first tick.
         self.end_timestamp = None
         playlist.set_current_song(song)
         self.logger.info(f"Playing song: {song.title}")
+        # The song just left the lookahead window; let the next one download.
+        self.state.downloader.schedule()
 
         await playlist.update_message()
 
@@ -42,10 +115,8 @@ class Player:
 
         # Mark the request message for later cleanup once the song is no longer
         # queued for download and isn't still pending in the playlist.
-        pending_download = any(
-            song.message is item[1] for item in self.state.downloader.queue
-        )
-        pending_in_playlist = any(song.message is s.message for s in playlist.songs)
+        pending_download = self.state.downloader.queue.has_message(song.message)
+        pending_in_playlist = playlist.songs.has_message(song.message)
         # A looped song replays the same Song object each cycle; without the
         # membership check this appends a duplicate every replay, and each
         # duplicate turns into a wasted (and logged) failing delete() once the
@@ -60,15 +131,11 @@ class Player:
         playlist.set_last_song(song)
 
         db = self.state.bot.get_cog("Database")
-        if db is not None:
-            await db.save_song(song.info, song.message.author.id)
-            self.logger.info("Song statistics saved for %s", song.title)
-
-        # cleanup_files does a directory scan plus per-file os.remove() -
-        # offload it like every other blocking filesystem/DB call in this
-        # codebase, or it stalls the event loop (all guilds' commands and
-        # voice heartbeats) on every song start.
-        await asyncio.to_thread(self.state.cleanup_files, song, playlist.songs)
+        # A song resumed part-way (after a restart) was counted when it started.
+        if db is not None and not offset:
+            # Buffered; the Database cog writes plays in bulk off this path.
+            db.record_song_play(song.info, song.message.author.id)
+            self.logger.info("Song play recorded for %s", song.title)
 
     async def join_voice_channel(self, message):
         """Ensure the bot is connected, returning the voice client on success.
@@ -82,7 +149,10 @@ class Player:
         if message.author.voice is None:
             self.logger.warning("Requester is not in a voice channel.")
             return None
-        voice_channel = message.author.voice.channel
+        return await self.connect(message.author.voice.channel)
+
+    async def connect(self, voice_channel):
+        """Join ``voice_channel``, returning the voice client or None on failure."""
         self.logger.info(f"Joining voice channel: {voice_channel.name}")
         try:
             self.voice_client = await voice_channel.connect()
@@ -97,15 +167,72 @@ class Player:
         self.state.state_machine.transition_to(State.STOPPED)
         return self.voice_client
 
-    def play_audio(self, song_path):
-        self.logger.debug("Playing audio for song path: %s", song_path)
-        self.audio_source = discord.FFmpegPCMAudio(song_path)
-        self.voice_client.play(self.audio_source)
+    def _open_source(self, song_path, offset=0.0):
+        before_options = []
+        if offset:
+            # Before the input, so ffmpeg seeks in the container instead of
+            # decoding (and discarding) everything up to the offset.
+            before_options.append(f"-ss {offset:.3f}")
+        kwargs = {}
+        if song_path.startswith(("http://", "https://")):
+            # Stream mode: the file is still downloading in the background.
+            before_options.append(STREAM_BEFORE_OPTIONS)
+        if before_options:
+            kwargs["before_options"] = " ".join(before_options)
+        if song_path.endswith(".opus"):
+            # Passthrough mode: the file is already Opus, so ffmpeg only
+            # repackages the packets and discord.py skips its encoder.
+            return discord.FFmpegOpusAudio(song_path, codec="copy", **kwargs)
+        return discord.FFmpegPCMAudio(song_path, **kwargs)
+
+    def play_audio(self, song_path, offset=0.0):
+        self.logger.debug("Playing audio for song path: %s at %ss", song_path, offset)
+        self.audio_source = self._open_source(song_path, offset)
+        self._frame_counter = _FrameCounter(self.audio_source, offset)
+        self.voice_client.play(self._frame_counter, after=self._on_playback_end)
         self.logger.info("Audio playback started")
 
+    def seek(self, seconds):
+        """Jump to ``seconds`` into the current song, paused or not.
+
+        Returns the new position, or None when nothing is playing or the
+        position is past the end of the song.
+        """
+        song = self.state.playlist.current_song
+        counter = self._frame_counter
+        if song is None or counter is None or counter.finished:
+            return None
+        seconds = max(float(seconds), 0.0)
+        if song.duration_seconds and seconds >= song.duration_seconds:
+            return None
+        self.audio_source = self._open_source(song.source, seconds)
+        counter.swap(self.audio_source, seconds).cleanup()
+        self.logger.info("Seeked %s to %.1fs", song.title, seconds)
+        return seconds
+
+    def resume_interrupted(self):
+        """Restart the current song where a voice drop cut it off."""
+        song = self.state.playlist.current_song
+        if song is None:
+            return False
+        offset = self.position
+        self.logger.info("Resuming %s at %.1fs after a voice drop", song.title, offset)
+        self.play_audio(song.source, offset)
+        return True
+
+    def _on_playback_end(self, error):
+        # Called on discord.py's audio player thread when the track finishes,
+        # is skipped or fails - the state machine takes it from there.
+        if error is not None:
+            self.logger.error("Playback ended with an error: %s", error)
+        self.state.state_machine.notify_threadsafe()
+
     async def skip(self, message):
         if self.voice_client and self.voice_client.is_playing():
             self.logger.info("Skipping the current song.")
+            if self._frame_counter is not None:
+                # Cut off on purpose: don't mistake it for a voice drop.
+                self._frame_counter.finished = True
             self.voice_client.stop()
             try:
                 await message.delete()
@@ -154,7 +281,8 @@ class Player:
             self.logger.info("Disconnected from the voice channel.")
 
             self.state.state_machine.set_state(State.DISCONNECTED)
-            await self.state.playlist.clear()
+            await self.state.playlist.reset()
 
             self.end_timestamp = None
             self.audio_source = None
+            self._frame_counter = None
@@ -1,19 +1,20 @@
 import logging
-import random
-from typing import List, Optional
+from typing import Iterable, Optional
 
 import discord
 from discord import Message
 
 from cogs.models.song import Song
-from cogs.utils.music.state_machine import TICK_INTERVAL_SECONDS
+from cogs.utils.music.song_queue import SongQueue
+
+DEFAULT_MAX_SIZE = 25
 
 
 class Playlist:
-    def __init__(self, state, max_size=25):
+    def __init__(self, state, max_size=DEFAULT_MAX_SIZE):
         # `state` is the per-guild GuildMusicState.
         self.state = state
-        self.songs: List[Song] = []
+        self._songs = SongQueue(message_of=_song_message)
         self.max_size: int = max_size
         self.shuffle: bool = False
         self.loop: bool = False
@@ -23,6 +24,14 @@ class Playlist:
         self.user_req_message: Optional[Message] = None
         self.logger = logging.getLogger("discord")
 
+    @property
+    def songs(self) -> SongQueue:
+        return self._songs
+
+    @songs.setter
+    def songs(self, songs: Iterable[Song]):
+        self._songs = SongQueue(songs, message_of=_song_message)
+
     def _get_looped_song(self) -> Optional[Song]:
         if self.loop and self.current_song:
             self.current_song.current_seconds = 0
@@ -31,13 +40,20 @@ class Playlist:
 
     async def clear_last(self):
         if self.last_song:
+            # A looped song is about to play again from the same file.
+            if not (self.loop and self.last_song is self.current_song):
+                self._release_audio(self.last_song)
             await self.delete_song_log(self.last_song)
             self.last_song = None
 
-    def _handle_index(self) -> int:
-        if self.shuffle and self.songs:
-            return random.randint(0, len(self.songs) - 1)
-        return 0
+    def _release_audio(self, song: Optional[Song]):
+        # Each Song holds one audio cache reference from the moment it's
+        # added; a song can be dropped through several paths (finished,
+        # cleared, skipped), so make the release idempotent.
+        if song is None or song.audio_released:
+            return
+        song.audio_released = True
+        self.state.release_audio(song.path)
 
     def toggle_loop(self):
         self.loop = not self.loop
@@ -49,19 +65,24 @@ class Playlist:
 
     async def add(
         self,
-        song_path: str,
+        song_path: Optional[str],
         song_info: dict,
         message: Message,
         lyrics: Optional[str] = None,
-    ) -> bool:
+        stream_url: Optional[str] = None,
+    ) -> Optional[Song]:
+        """Queue a song, returning it - or None if voice couldn't be joined."""
         voice_client = await self.state.player.join_voice_channel(message)
         if voice_client is None:
             self.logger.warning(
-                "Could not join a voice channel; dropping song %s", song_path
+                "Could not join a voice channel; dropping song %s",
+                song_path or stream_url,
             )
-            return False
-        self.songs.append(Song(song_path, song_info, message, lyrics))
-        return True
+            return None
+        song = Song(song_path, song_info, message, lyrics, stream_url)
+        self.songs.append(song)
+        self.state.state_machine.notify()
+        return song
 
     async def get_next(self) -> Optional[Song]:
         looped_song = self._get_looped_song()
@@ -69,12 +90,13 @@ class Playlist:
             return looped_song
 
         await self.clear_last()
+        # Moving on: the previous song is done, even if it was looping.
+        self._release_audio(self.current_song)
 
         if not self.songs:
             return None
 
-        index = self._handle_index()
-        next_song = self.songs.pop(index)
+        next_song = self.songs.pop(shuffle=self.shuffle)
         self.set_current_song(next_song)
         return next_song
 
@@ -100,25 +122,16 @@ class Playlist:
     async def update_curr_song_message(self):
         song = self.current_song
         if song:
-            song.current_seconds += TICK_INTERVAL_SECONDS
-            embed = song.to_embed(self.songs, self.shuffle, self.loop)
+            song.current_seconds = int(self.state.player.position)
             if song.embed_message:
-                try:
-                    await song.embed_message.edit(embed=embed)
-                except Exception as e:
-                    self.logger.warning(
-                        "Exception while updating message for song %s: %s",
-                        song.title,
-                        e,
-                    )
+                # Paced and coalesced per channel by the cog's EmbedUpdater.
+                embed = song.to_embed(self.songs, self.shuffle, self.loop)
+                self.state.update_embed(song.embed_message, embed)
 
     async def update_message(self):
         if not self.sent_message:
             return
-        try:
-            await self.sent_message.edit(embed=self.get_embed())
-        except Exception as e:
-            self.logger.warning(f"Exception while updating playlist message: {e}")
+        self.state.update_embed(self.sent_message, self.get_embed())
 
     def get_embed(self) -> discord.Embed:
         dl_queue = self.state.downloader.queue
@@ -134,7 +147,7 @@ class Playlist:
             return embed
 
         description = ""
-        for index, song in enumerate(self.songs, 1):
+        for index, song in enumerate(self.songs.first(21), 1):
             if index <= 20:
                 description += f"{index}. **{song.title}**\n"
             else:
@@ -159,7 +172,24 @@ class Playlist:
             return None
 
     async def clear(self):
+        """Drop every queued song.
+
+        The song playing (if any) is left alone: ffmpeg still has its file
+        open and seeking or resuming it reopens the file, so its audio is
+        released by clear_last() once it finishes, or by reset().
+        """
+        for song in self.songs:
+            self._release_audio(song)
+        self.songs.clear()
+
+    async def reset(self):
+        """Drop everything, including the current song; playback must be over."""
+        await self.clear()
         await self.clear_last()
-        self.songs = []
+        self._release_audio(self.current_song)
         self.current_song = None
         self.last_song = None
+
+
+def _song_message(song: Song) -> Message:
+    return song.message
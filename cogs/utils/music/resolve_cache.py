@@ -0,0 +1,68 @@
+"""Persistent cache of free-text search query -> resolved video.
+
+Every text ``play`` query and every Spotify-derived "Artist - Title" string
+used to go through a ``ytsearch:`` round trip in yt-dlp, even for songs the
+bot had resolved minutes earlier. Resolutions are now remembered in a small
+SQLite file (kept outside ``DOWNLOAD_DIR``, which the orphan sweep cleans),
+with a TTL so re-uploads/takedowns eventually get picked up and a row cap so
+the file can't grow without bound.
+
+Only the metadata the bot actually renders or stores is cached - enough to
+build a :class:`~cogs.models.song.Song` and an audio cache key - not the
+format list, so a miss in the audio cache still needs one extraction of the
+(now known) video URL.
+"""
+
+import json
+import os
+
+from cogs.utils.music.sqlite_cache import SqliteCache
+
+RESOLVE_CACHE_PATH = os.environ.get("DZ_RESOLVE_CACHE_PATH", "resolve_cache.db")
+
+DEFAULT_TTL_SECONDS = 7 * 24 * 60 * 60
+DEFAULT_MAX_ENTRIES = 10_000
+
+CACHED_FIELDS = (
+    "id",
+    "extractor_key",
+    "webpage_url",
+    "original_url",
+    "title",
+    "duration",
+    "uploader",
+    "thumbnail",
+    "view_count",
+    "like_count",
+    "comment_count",
+    "upload_date",
+)
+
+
+class ResolveCache(SqliteCache):
+    table = "resolutions"
+    key_column = "query"
+    value_column = "info"
+
+    def __init__(
+        self,
+        path=RESOLVE_CACHE_PATH,
+        ttl_seconds=DEFAULT_TTL_SECONDS,
+        max_entries=DEFAULT_MAX_ENTRIES,
+    ):
+        super().__init__(path, ttl_seconds, max_entries)
+
+    def _encode(self, info):
+        return json.dumps(info)
+
+    def _decode(self, stored):
+        return json.loads(stored)
+
+    def get(self, query):
+        """Return the cached info dict for ``query``, or None."""
+        return super().get(query)
+
+    def put(self, query, info):
+        if not info.get("id") or not info.get("webpage_url"):
+            return
+        super().put(query, {field: info.get(field) for field in CACHED_FIELDS})
@@ -0,0 +1,73 @@
+"""Process-wide music services, shared by every guild.
+
+Each guild's :class:`~cogs.utils.music.downloader.Downloader` used to build
+its own ``SpotifyAPI``, ``YouTubeAPI`` and ``GeniusAPI`` (and ``YouTubeAPI``
+re-ran ``os.makedirs`` every time), so memory and start-up work grew with the
+number of guilds that ever played a song. The ``Music`` cog now builds one
+:class:`MusicServices` and hands it to every
+:class:`~cogs.utils.music.guild_state.GuildMusicState`; per-guild objects only
+hold guild state (queue, player, state machine).
+
+    python -m benchmarks.guild_state_memory_bench
+"""
+
+from cogs.api.genius import GeniusAPI
+from cogs.api.spotify import SpotifyAPI
+from cogs.api.youtube import DOWNLOAD_DIR, YouTubeAPI
+from cogs.utils.music.audio_cache import DEFAULT_MAX_BYTES, AudioCache
+from cogs.utils.music.download_scheduler import (
+    DEFAULT_LOOKAHEAD,
+    DEFAULT_MAX_CONCURRENT,
+    DownloadScheduler,
+)
+from cogs.utils.music.embed_updater import EmbedUpdater
+from cogs.utils.music.file_registry import FileRegistry
+from cogs.utils.music.lyrics_cache import LyricsCache
+from cogs.utils.music.resolve_cache import ResolveCache
+
+
+class MusicServices:
+    def __init__(self, config):
+        # A song any guild played recently is served from disk instead of
+        # being downloaded again.
+        cache_mb = config.get("audio_cache_mb")
+        self.audio_cache = AudioCache(
+            DOWNLOAD_DIR,
+            max_bytes=int(cache_mb) * 1024 * 1024 if cache_mb else DEFAULT_MAX_BYTES,
+        )
+        # Deletes every other download once nothing references it.
+        self.file_registry = FileRegistry(DOWNLOAD_DIR, self.audio_cache)
+        self.resolve_cache = ResolveCache(
+            ttl_seconds=int(config.get("resolve_cache_ttl_hours", "168")) * 3600,
+            max_entries=int(config.get("resolve_cache_max_entries", "10000")),
+        )
+        # Owns the one download executor.
+        self.download_scheduler = DownloadScheduler(
+            max_concurrent=int(
+                config.get("download_concurrency", DEFAULT_MAX_CONCURRENT)
+            ),
+            lookahead=int(config.get("download_lookahead", DEFAULT_LOOKAHEAD)),
+        )
+        # Paces every guild's now-playing/playlist embed edits per channel.
+        self.embed_updater = EmbedUpdater()
+        self.spotify = SpotifyAPI(
+            config,
+            cache_ttl=int(config.get("spotify_cache_ttl_seconds", "3600")),
+        )
+        self.youtube = YouTubeAPI(
+            config, cache=self.audio_cache, resolve_cache=self.resolve_cache
+        )
+        self.lyrics_cache = LyricsCache(
+            ttl_seconds=int(config.get("lyrics_cache_ttl_days", "30")) * 24 * 3600,
+            negative_ttl_seconds=int(
+                config.get("lyrics_cache_negative_ttl_hours", "24")
+            )
+            * 3600,
+        )
+        self.genius = GeniusAPI(config, cache=self.lyrics_cache)
+
+    def close(self):
+        self.download_scheduler.shutdown()
+        self.resolve_cache.close()
+        self.lyrics_cache.close()
+        self.embed_updater.close()
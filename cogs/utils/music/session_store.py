@@ -0,0 +1,275 @@
+"""Saves every guild's music session to the database and restores it on startup.
+
+A guild's queue used to live only in memory, so the ``restart`` command, a
+deploy or a crash dropped every guild's playlist, download queue and current
+song, and the audio they had already downloaded had to be fetched again. The
+:class:`SessionStore` now snapshots each connected guild every
+``interval`` seconds:
+
+* Only guilds whose snapshot changed are written, and a song advancing is a
+  position-only update rather than a rewrite of the whole queue.
+* A guild that stopped playing has its saved session deleted.
+
+On startup :meth:`SessionStore.restore` rejoins each saved voice channel that
+still has listeners and rebuilds the queue. Songs whose file is still in the
+audio cache are queued straight away and the current one resumes where it left
+off. Songs whose file is gone are re-queued for download, ahead of the saved
+download queue.
+"""
+
+import asyncio
+import json
+import logging
+import os
+
+import discord
+
+from cogs.models.song import Song
+from cogs.utils.music.state_machine import State
+
+logger = logging.getLogger("discord")
+
+DEFAULT_INTERVAL = 15
+# What the now-playing embed and the download path read from yt-dlp's info
+# dict; the rest (formats, expiring media URLs, ...) isn't worth storing.
+_INFO_KEYS = (
+    "id",
+    "extractor",
+    "extractor_key",
+    "title",
+    "original_url",
+    "duration",
+    "uploader",
+    "thumbnail",
+    "view_count",
+    "like_count",
+    "comment_count",
+    "upload_date",
+)
+
+
+def snapshot(state):
+    """What's needed to resume ``state``, or None if there's nothing to resume."""
+    player = state.player
+    playlist = state.playlist
+    downloader = state.downloader
+    voice_client = player.voice_client
+    if voice_client is None or voice_client.channel is None:
+        return None
+    current = playlist.current_song
+    # Popped for download but not queued yet: they'd be lost otherwise.
+    queue = [*downloader.in_flight, *downloader.queue]
+    if current is None and not playlist.songs and not queue:
+        return None
+    return {
+        "voice_channel_id": voice_client.channel.id,
+        "loop": playlist.loop,
+        "shuffle": playlist.shuffle,
+        "paused": state.state_machine.get_state() == State.PAUSED,
+        "position": round(player.position, 1) if current is not None else 0.0,
+        "current": _song_record(state, current) if current is not None else None,
+        "songs": [_song_record(state, song) for song in playlist.songs],
+        "queue": [
+            {
+                "query": query,
+                "channel_id": message.channel.id,
+                "message_id": message.id,
+                "spotify": spotify_req,
+            }
+            for query, message, spotify_req in queue
+        ],
+    }
+
+
+def _song_record(state, song):
+    cached = song.path is not None and state.services.audio_cache.owns(song.path)
+    return {
+        "info": {key: song.info[key] for key in _INFO_KEYS if key in song.info},
+        "cache_key": os.path.basename(song.path) if cached else None,
+        "lyrics": song.lyrics,
+        "channel_id": song.message.channel.id,
+        "message_id": song.message.id,
+        "embed_message_id": song.embed_message.id if song.embed_message else None,
+    }
+
+
+class SessionStore:
+    def __init__(self, cog, interval=DEFAULT_INTERVAL):
+        self.cog = cog
+        self.interval = interval
+        # guild id -> the snapshot JSON and position last written for it.
+        self._written: dict[int, str] = {}
+        self._positions: dict[int, float] = {}
+        self._task = None
+        self.restored = False
+
+    def _db(self):
+        return self.cog.bot.get_cog("Database")
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Failed to save music sessions")
+
+    async def flush(self):
+        """Write what changed since the last flush."""
+        db = self._db()
+        if db is None:
+            return
+        gone = set(self._written)
+        for guild_id, state in list(self.cog.guild_states.items()):
+            record = snapshot(state)
+            if record is None:
+                continue
+            gone.discard(guild_id)
+            position = record.pop("position")
+            data = json.dumps(record, sort_keys=True)
+            if data != self._written.get(guild_id):
+                await db.save_music_session(guild_id, data, position)
+            elif position != self._positions.get(guild_id):
+                await db.save_music_session_position(guild_id, position)
+            else:
+                continue
+            self._written[guild_id] = data
+            self._positions[guild_id] = position
+        for guild_id in gone:
+            await db.delete_music_session(guild_id)
+            self._written.pop(guild_id, None)
+            self._positions.pop(guild_id, None)
+
+    async def restore(self):
+        """Resume the sessions saved by the previous run, then start saving."""
+        if self.restored:
+            return
+        self.restored = True
+        db = self._db()
+        if db is None:
+            return
+        try:
+            rows = await db.get_music_sessions()
+        except Exception:
+            logger.exception("Failed to load saved music sessions")
+            rows = []
+        for guild_id, data, position in rows:
+            guild = self.cog.bot.get_guild(guild_id)
+            resumed = False
+            if guild is not None:
+                try:
+                    record = json.loads(data)
+                    record["position"] = position or 0.0
+                    resumed = await restore(self.cog.get_state(guild), record)
+                except Exception:
+                    logger.exception("Failed to restore music session for %s", guild_id)
+            if not resumed:
+                try:
+                    await db.delete_music_session(guild_id)
+                except Exception:
+                    logger.exception("Failed to delete music session for %s", guild_id)
+        self.start()
+
+
+async def restore(state, record):
+    """Rebuild ``state`` from a :func:`snapshot`; returns whether it resumed."""
+    voice_channel = state.guild.get_channel(record["voice_channel_id"])
+    if voice_channel is None or not any(not m.bot for m in voice_channel.members):
+        return False
+
+    messages = {}
+    redownload = []
+    current = None
+    if record["current"] is not None:
+        current, item = await _load_song(state, record["current"], messages)
+        if item is not None:
+            redownload.append(item)
+    songs = []
+    for song_record in record["songs"]:
+        song, item = await _load_song(state, song_record, messages)
+        if song is not None:
+            songs.append(song)
+        elif item is not None:
+            redownload.append(item)
+    queue = []
+    for item in record["queue"]:
+        message = await _fetch_message(state.guild, item, messages)
+        if message is not None:
+            queue.append((item["query"], message, item["spotify"]))
+
+    restored = ([current] if current is not None else []) + songs
+    if (not restored and not redownload and not queue) or (
+        await state.player.connect(voice_channel) is None
+    ):
+        for song in restored:
+            state.release_audio(song.path)
+        return False
+
+    playlist = state.playlist
+    playlist.loop = record["loop"]
+    playlist.shuffle = record["shuffle"]
+    playlist.songs = songs
+    state.downloader.set_queue(redownload + queue)
+    if current is not None:
+        await state.player.play(current, record["position"])
+        state.state_machine.transition_to(State.PLAYING)
+        if record["paused"]:
+            state.state_machine.transition_to(State.PAUSED)
+    state.downloader.schedule()
+    state.state_machine.start()
+    logger.info(
+        "Restored music session in %s: %d song(s), %d to download",
+        state.guild.id,
+        len(restored),
+        len(redownload) + len(queue),
+    )
+    return True
+
+
+async def _load_song(state, record, messages):
+    """Returns ``(song, None)`` if its file is cached, else ``(None, item)``.
+
+    ``item`` re-queues the song for download; both are None if its request
+    message is gone.
+    """
+    message = await _fetch_message(state.guild, record, messages)
+    if message is None:
+        return None, None
+    path = None
+    if record["cache_key"]:
+        # Holds the cache reference the Song releases once it's done.
+        path = state.services.audio_cache.lookup(record["cache_key"])
+    if path is None:
+        return None, (record["info"]["original_url"], message, False)
+    song = Song(path, record["info"], message, record["lyrics"])
+    if record["embed_message_id"]:
+        # Keep updating (and later delete) the now-playing embed sent before
+        # the restart instead of posting another one.
+        song.embed_message = message.channel.get_partial_message(
+            record["embed_message_id"]
+        )
+        song.messages_to_delete.append(song.embed_message)
+    return song, None
+
+
+async def _fetch_message(guild, record, messages):
+    key = (record["channel_id"], record["message_id"])
+    if key not in messages:
+        channel = guild.get_channel(record["channel_id"])
+        message = None
+        if channel is not None:
+            try:
+                message = await channel.fetch_message(record["message_id"])
+            except discord.DiscordException as e:
+                logger.info("Request message %s is gone: %s", key[1], e)
+        messages[key] = message
+    return messages[key]
@@ -0,0 +1,142 @@
+"""FIFO queue of songs (or download requests) with O(1) shuffle and lookups.
+
+The playlist and the download queue used to be plain lists: taking the next
+song was a ``pop(0)`` or ``pop(random_index)``, de-duplicating a request was a
+``not in`` scan and checking whether a request message still had songs pending
+was an ``any(...)`` over everything queued. That's fine for 25 songs and
+quadratic for a several-thousand-track import. :class:`SongQueue` keeps:
+
+* the FIFO order as a deque of sequence numbers, with entries taken out of the
+  middle (by a shuffled pop) skipped lazily when they reach the front;
+* every live entry in a swap-remove array, so a shuffled pop is a lazy
+  Fisher-Yates step - the same uniform order as shuffling the queue up front,
+  but songs queued mid-shuffle join the draw without reshuffling anything;
+* counts per item and per request message for membership checks.
+"""
+
+import random
+from collections import Counter, deque
+from itertools import islice
+
+
+class SongQueue:
+    def __init__(self, items=(), message_of=None):
+        # Maps an item to the request message it came from.
+        self._message_of = message_of
+        self._next_seq = 0
+        self._items: dict[int, object] = {}
+        self._order: deque = deque()
+        # Live sequence numbers, in no particular order, for shuffled pops.
+        self._bag: list[int] = []
+        self._bag_index: dict[int, int] = {}
+        self._counts: Counter = Counter()
+        self._message_counts: Counter = Counter()
+        self.extend(items)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __bool__(self):
+        return bool(self._items)
+
+    def __iter__(self):
+        # Copied so callers may mutate the queue while iterating over it.
+        return iter([self._items[seq] for seq in self._order if seq in self._items])
+
+    def __contains__(self, item):
+        return self._counts[item] > 0
+
+    def __getitem__(self, index):
+        if index == 0:
+            return self.peek()
+        if index < 0:
+            return list(self)[index]
+        try:
+            return next(islice(iter(self), index, None))
+        except StopIteration:
+            raise IndexError("SongQueue index out of range") from None
+
+    def __eq__(self, other):
+        if isinstance(other, (SongQueue, list, tuple)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self):
+        return f"SongQueue({list(self)!r})"
+
+    def has_message(self, message):
+        """True if any queued item came from ``message``."""
+        return self._message_counts[id(message)] > 0
+
+    def append(self, item):
+        seq = self._next_seq
+        self._next_seq += 1
+        self._items[seq] = item
+        self._order.append(seq)
+        self._bag_index[seq] = len(self._bag)
+        self._bag.append(seq)
+        self._counts[item] += 1
+        if self._message_of is not None:
+            self._message_counts[id(self._message_of(item))] += 1
+
+    def extend(self, items):
+        for item in items:
+            self.append(item)
+
+    def peek(self):
+        """The item the next unshuffled ``pop()`` returns."""
+        self._skip_removed()
+        if not self._order:
+            raise IndexError("peek from an empty SongQueue")
+        return self._items[self._order[0]]
+
+    def pop(self, shuffle=False):
+        """Take the oldest item, or a uniformly random one with ``shuffle``."""
+        if not self._items:
+            raise IndexError("pop from an empty SongQueue")
+        if shuffle:
+            seq = self._bag[random.randrange(len(self._bag))]
+        else:
+            self._skip_removed()
+            seq = self._order.popleft()
+        return self._remove(seq)
+
+    def clear(self):
+        self._items.clear()
+        self._order.clear()
+        self._bag.clear()
+        self._bag_index.clear()
+        self._counts.clear()
+        self._message_counts.clear()
+
+    def first(self, count):
+        """Up to ``count`` items from the front, without copying the whole queue."""
+        live = (self._items[seq] for seq in self._order if seq in self._items)
+        return list(islice(live, count))
+
+    def _skip_removed(self):
+        order = self._order
+        while order and order[0] not in self._items:
+            order.popleft()
+
+    def _remove(self, seq):
+        item = self._items.pop(seq)
+        # Swap-remove from the bag.
+        index = self._bag_index.pop(seq)
+        last = self._bag.pop()
+        if last != seq:
+            self._bag[index] = last
+            self._bag_index[last] = index
+        self._counts[item] -= 1
+        if not self._counts[item]:
+            del self._counts[item]
+        if self._message_of is not None:
+            key = id(self._message_of(item))
+            self._message_counts[key] -= 1
+            if not self._message_counts[key]:
+                del self._message_counts[key]
+        # Shuffled pops leave their sequence number in the FIFO order; drop
+        # them once they'd make up most of it so it can't grow unbounded.
+        if len(self._order) > 2 * len(self._items) + 64:
+            self._order = deque(s for s in self._order if s in self._items)
+        return item
@@ -0,0 +1,131 @@
+"""Small persistent key -> value caches kept in a SQLite file.
+
+The resolve and lyrics caches are the same thing with a different table and
+value codec: each row carries when it was written (for the TTL) and when it
+was last read (for the LRU row cap), and every call runs under one lock so a
+connection is shared safely by the download worker threads.
+
+Subclasses name the table and its columns and may override :meth:`_encode` /
+:meth:`_decode` (stored text <-> value) and :meth:`_ttl_for` (per-value TTL).
+"""
+
+import sqlite3
+import threading
+import time
+
+
+def normalize_query(query):
+    return " ".join(query.casefold().split())
+
+
+class SqliteCache:
+    table = None
+    key_column = None
+    value_column = None
+    # Column type of the stored value; "TEXT NOT NULL" unless None is a value.
+    value_type = "TEXT NOT NULL"
+    # Returned by get() for a key that isn't cached.
+    missing = None
+
+    def __init__(self, path, ttl_seconds, max_entries):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # Opened lazily from a worker thread, so constructing the cache (e.g.
+        # in the Music cog's __init__) never touches the disk.
+        self._conn = None
+
+    def _connection(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} ("
+                f" {self.key_column} TEXT PRIMARY KEY,"
+                f" {self.value_column} {self.value_type},"
+                " created_at REAL NOT NULL,"
+                " last_used REAL NOT NULL)"
+            )
+            self._conn.execute(
+                f"CREATE INDEX IF NOT EXISTS ix_{self.table}_last_used "
+                f"ON {self.table} (last_used)"
+            )
+            self._conn.commit()
+        return self._conn
+
+    def _encode(self, value):
+        return value
+
+    def _decode(self, stored):
+        return stored
+
+    def _ttl_for(self, stored):
+        return self.ttl_seconds
+
+    def _expired_clause(self, now):
+        """WHERE clause (and its parameters) matching every expired row."""
+        return "created_at < ?", (now - self.ttl_seconds,)
+
+    def get(self, key):
+        """Return the cached value for ``key``, or ``missing``."""
+        key = normalize_query(key)
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute(
+                f"SELECT {self.value_column}, created_at FROM {self.table} "
+                f"WHERE {self.key_column} = ?",
+                (key,),
+            ).fetchone()
+            if row is None or now - row[1] > self._ttl_for(row[0]):
+                if row is not None:
+                    conn.execute(
+                        f"DELETE FROM {self.table} WHERE {self.key_column} = ?", (key,)
+                    )
+                    conn.commit()
+                self.misses += 1
+                return self.missing
+            conn.execute(
+                f"UPDATE {self.table} SET last_used = ? WHERE {self.key_column} = ?",
+                (now, key),
+            )
+            conn.commit()
+            self.hits += 1
+        return self._decode(row[0])
+
+    def put(self, key, value):
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} "
+                f"({self.key_column}, {self.value_column}, created_at, last_used) "
+                "VALUES (?, ?, ?, ?)",
+                (normalize_query(key), self._encode(value), now, now),
+            )
+            self._evict_locked(conn, now)
+            conn.commit()
+
+    def _evict_locked(self, conn, now):
+        clause, params = self._expired_clause(now)
+        conn.execute(f"DELETE FROM {self.table} WHERE {clause}", params)
+        (count,) = conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()
+        if count > self.max_entries:
+            conn.execute(
+                f"DELETE FROM {self.table} WHERE {self.key_column} IN ("
+                f" SELECT {self.key_column} FROM {self.table} "
+                "ORDER BY last_used LIMIT ?)",
+                (count - self.max_entries,),
+            )
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
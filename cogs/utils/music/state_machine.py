@@ -1,11 +1,24 @@
+"""Per-guild playback state machine.
+
+Every active guild used to run a ``tasks.loop`` that woke up every two
+seconds to check for a finished track, an empty channel or an idle timeout,
+whether or not anything had changed. The machine now sleeps until something
+happens - the voice client's ``after`` callback at the end of a track, a song
+being queued, a state transition, a download finishing or a voice state
+update - and only keeps timers for the idle-timeout deadline and the
+now-playing progress bar while a song is actually playing.
+"""
+
+import asyncio
 import logging
+import time
 from enum import Enum
 
-from discord.ext import tasks
-
-# Shared with Playlist.update_curr_song_message(), which advances a song's
-# progress by this same amount every tick - keep both in sync.
-TICK_INTERVAL_SECONDS = 2
+# How often the now-playing progress bar is re-rendered while a song plays.
+PROGRESS_REFRESH_SECONDS = 2
+# How long a dropped voice connection gets to come back (discord.py keeps
+# reconnecting on its own) before the guild's session is given up.
+RECONNECT_GRACE_SECONDS = 60
 
 
 class State(Enum):
@@ -32,6 +45,16 @@ class StateMachine:
             State.RESUMED: [State.PLAYING, State.STOPPED, State.DISCONNECTED],
         }
 
+        self._task = None
+        self._wakeup = asyncio.Event()
+        # monotonic() deadline of the next progress bar refresh.
+        self._progress_due = None
+        # Whether the last step started (or continued) an idle countdown.
+        self._idle_armed = False
+        # monotonic() deadline for a dropped voice connection to come back.
+        self._reconnect_due = None
+        self.wakeups = 0
+
     @property
     def current(self):
         return self.__state
@@ -41,58 +64,127 @@ class StateMachine:
 
     def set_state(self, new_state: State):
         """Force a state without transition validation (recovery/teardown)."""
-        self.__state = new_state
+        self._enter(new_state)
 
     def transition_to(self, new_state):
         current_state = self.__state
         if new_state in self.valid_transitions.get(current_state, []):
-            self.__state = new_state
+            self._enter(new_state)
             self.logger.info(f"State transition: {current_state} -> {new_state}")
         else:
             self.logger.warning(
                 f"Invalid transition attempted: {current_state} -> {new_state}"
             )
 
+    def _enter(self, new_state):
+        self.__state = new_state
+        if new_state == State.PLAYING:
+            self._progress_due = time.monotonic() + PROGRESS_REFRESH_SECONDS
+        else:
+            self._progress_due = None
+        # The new state may have work to do straight away (e.g. STOPPED with
+        # a song queued), so run a step for it.
+        self.notify()
+
+    def notify(self):
+        """Wake the state machine; something it reacts to has changed."""
+        self._wakeup.set()
+
+    def notify_threadsafe(self):
+        # For callbacks that run off the event loop, like the voice client's
+        # ``after`` hook on discord.py's audio player thread.
+        self.state.bot.loop.call_soon_threadsafe(self.notify)
+
     def start(self):
-        if not self.handle_state.is_running():
-            self.handle_state.start()
-            self.logger.info("State machine loop started.")
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+            self.logger.info("State machine started.")
+        self.notify()
 
     async def stop(self):
-        if self.handle_state.is_running():
-            self.handle_state.cancel()
-            self.logger.info("State machine loop stopped.")
-
-    @tasks.loop(seconds=TICK_INTERVAL_SECONDS)
-    async def handle_state(self):
-        # Entire body guarded so a transient error can't permanently kill the
-        # loop (a bare tasks.loop stops for good on the first exception).
-        try:
-            await self._tick()
-        except Exception:
-            self.logger.exception("Error in music state machine tick")
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            self.logger.info("State machine stopped.")
+        self._task = None
+
+    async def _run(self):
+        await self.state.bot.wait_until_ready()
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self._next_timeout())
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            self.wakeups += 1
+            # Guarded so a transient error can't permanently kill the loop.
+            try:
+                await self._tick()
+            except Exception:
+                self.logger.exception("Error in music state machine tick")
+
+    def _next_timeout(self):
+        """Seconds until the next timer-driven step, or None to wait for an event."""
+        deadlines = []
+        if self._reconnect_due is not None:
+            deadlines.append(self._reconnect_due - time.monotonic())
+        if self._progress_due is not None:
+            deadlines.append(self._progress_due - time.monotonic())
+        player = self.state.player
+        if self._idle_armed and player.end_timestamp is not None:
+            deadlines.append(player.end_timestamp + player.idle_timeout - time.time())
+        if not deadlines:
+            return None
+        return max(min(deadlines), 0)
+
+    @staticmethod
+    def _voice_connected(player):
+        return player.voice_client is not None and player.voice_client.is_connected()
+
+    async def _handle_idle(self):
+        player = self.state.player
+        await player.handle_idle()
+        self._idle_armed = player.idle()
+
+    async def _refresh_progress(self):
+        if self._progress_due is None or time.monotonic() < self._progress_due:
+            return
+        self._progress_due += PROGRESS_REFRESH_SECONDS
+        await self.state.playlist.update_curr_song_message()
 
     async def _tick(self):
         player = self.state.player
         playlist = self.state.playlist
         state = self.current
+        self._idle_armed = False
 
         # Reconcile with the real voice client: if we think we're connected but
         # the client is gone, recover to a clean STOPPED/DISCONNECTED state.
         if state in (State.PLAYING, State.PAUSED, State.RESUMED):
-            if player.voice_client is None or not player.voice_client.is_connected():
+            if not self._voice_connected(player):
+                if self._reconnect_due is None:
+                    self.logger.warning("Voice connection dropped; waiting for it.")
+                    self._reconnect_due = time.monotonic() + RECONNECT_GRACE_SECONDS
+                if player.voice_client is not None and (
+                    time.monotonic() < self._reconnect_due
+                ):
+                    return
+                self._reconnect_due = None
                 self.logger.warning("Voice client lost; resetting state machine.")
-                await playlist.clear()
+                await playlist.reset()
                 self.set_state(State.DISCONNECTED)
                 await self.stop()
                 return
+            self._reconnect_due = None
 
         match state:
             case State.PLAYING:
-                await playlist.update_curr_song_message()
+                await self._refresh_progress()
                 if player.idle():
-                    await playlist.clear_last()
-                    self.transition_to(State.STOPPED)
+                    # discord.py drops the track when the connection blips;
+                    # once it's back, carry on from where it was cut off.
+                    if not (player.interrupted() and player.resume_interrupted()):
+                        await playlist.clear_last()
+                        self.transition_to(State.STOPPED)
 
             case State.STOPPED:
                 if playlist.empty():
@@ -101,8 +193,8 @@ class StateMachine:
                     # the queue before its download starts) - don't count
                     # that as idle time, or a slow download can trigger the
                     # idle-timeout disconnect and wipe the queue mid-import.
-                    if not self.state.downloader.process_queue.is_running():
-                        await player.handle_idle()
+                    if not self.state.downloader.busy():
+                        await self._handle_idle()
                 else:
                     next_song = await playlist.get_next()
                     if next_song is not None:
@@ -111,7 +203,7 @@ class StateMachine:
 
             case State.PAUSED:
                 player.pause()
-                await player.handle_idle()
+                await self._handle_idle()
 
             case State.RESUMED:
                 player.resume()
@@ -127,6 +219,3 @@ class StateMachine:
                 await self.state.stop()
                 self.set_state(State.DISCONNECTED)
 
-    @handle_state.before_loop
-    async def before_handle_state(self):
-        await self.state.bot.wait_until_ready()
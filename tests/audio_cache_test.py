@@ -0,0 +1,104 @@
+import os
+
+import pytest
+
+from cogs.utils.music.audio_cache import AudioCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return AudioCache(str(tmp_path), max_bytes=10)
+
+
+def download(tmp_path, name, size):
+    path = tmp_path / name
+    path.write_bytes(b"x" * size)
+    return str(path)
+
+
+def test_key_for_uses_extractor_and_video_id():
+    info = {"extractor_key": "Youtube", "id": "dQw4w9-WgXc"}
+    assert AudioCache.key_for(info, "mp3") == "Youtube-dQw4w9-WgXc.mp3"
+
+
+def test_key_for_rejects_livestreams_and_missing_ids():
+    assert AudioCache.key_for({"extractor_key": "Youtube"}, "mp3") is None
+    assert (
+        AudioCache.key_for({"extractor_key": "Youtube", "id": "x", "is_live": True}, "mp3")
+        is None
+    )
+
+
+def test_key_for_strips_path_separators():
+    key = AudioCache.key_for({"extractor_key": "Generic", "id": "../../etc"}, "mp3")
+    assert "/" not in key
+
+
+def test_store_then_lookup_counts_hits_and_misses(cache, tmp_path):
+    assert cache.lookup("Youtube-a.mp3") is None
+
+    path = cache.store("Youtube-a.mp3", download(tmp_path, "1.mp3", 4))
+
+    assert path == os.path.join(str(tmp_path), "Youtube-a.mp3")
+    assert os.path.exists(path)
+    assert not os.path.exists(tmp_path / "1.mp3")
+    assert cache.lookup("Youtube-a.mp3") == path
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 1)
+
+
+def test_store_discards_duplicate_download_of_the_same_video(cache, tmp_path):
+    first = cache.store("Youtube-a.mp3", download(tmp_path, "1.mp3", 4))
+    second = cache.store("Youtube-a.mp3", download(tmp_path, "2.mp3", 4))
+
+    assert first == second
+    assert not os.path.exists(tmp_path / "2.mp3")
+
+
+def test_eviction_is_lru_and_skips_referenced_entries(cache, tmp_path):
+    a = cache.store("Youtube-a.mp3", download(tmp_path, "1.mp3", 4))
+    b = cache.store("Youtube-b.mp3", download(tmp_path, "2.mp3", 4))
+    cache.release(b)
+    # `a` is still referenced (e.g. playing in a guild), so the over-budget
+    # store evicts the unreferenced `b` even though `a` is older.
+    c = cache.store("Youtube-c.mp3", download(tmp_path, "3.mp3", 4))
+
+    assert os.path.exists(a)
+    assert not os.path.exists(b)
+    assert os.path.exists(c)
+    assert cache.stats()["evictions"] == 1
+
+
+def test_released_entries_are_evicted_on_demand(cache, tmp_path):
+    a = cache.store("Youtube-a.mp3", download(tmp_path, "1.mp3", 6))
+    b = cache.store("Youtube-b.mp3", download(tmp_path, "2.mp3", 6))
+    assert os.path.exists(a) and os.path.exists(b)
+
+    cache.release(a)
+    cache.evict()
+
+    assert not os.path.exists(a)
+    assert cache.owns(b)
+
+
+def test_lookup_forgets_entries_deleted_behind_its_back(cache, tmp_path):
+    path = cache.store("Youtube-a.mp3", download(tmp_path, "1.mp3", 4))
+    os.remove(path)
+
+    assert cache.lookup("Youtube-a.mp3") is None
+    assert not cache.owns(path)
+
+
+def test_existing_entries_are_reindexed_on_startup(tmp_path):
+    download(tmp_path, "Youtube-a.mp3", 4)
+    download(tmp_path, "12345.mp3", 4)  # legacy uuid download, not cached
+
+    cache = AudioCache(str(tmp_path))
+
+    assert cache.owns(os.path.join(str(tmp_path), "Youtube-a.mp3"))
+    assert not cache.owns(os.path.join(str(tmp_path), "12345.mp3"))
+    assert cache.stats()["bytes"] == 4
+
+
+def test_release_of_unknown_path_is_ignored(cache):
+    cache.release("downloads/not-cached.mp3")  # must not raise
@@ -225,6 +225,21 @@ async def test_on_ready_skips_notification_when_none_pending(khaled):
     khaled.fetch_message_by_id.assert_not_awaited()
 
 
+@pytest.mark.asyncio
+async def test_on_ready_restores_music_sessions(khaled):
+    _set_connection_state(khaled, user=MagicMock(id=1))
+    music_cog = MagicMock()
+    music_cog.session_store.restore = AsyncMock()
+
+    khaled.get_cog = MagicMock(side_effect=lambda name: {"Music": music_cog}.get(name))
+    khaled.change_presence = AsyncMock()
+    khaled.update_online_users = AsyncMock()
+
+    await khaled.on_ready()
+
+    music_cog.session_store.restore.assert_awaited_once()
+
+
 @pytest.mark.asyncio
 @pytest.mark.parametrize(
     "error, expected_snippet",
@@ -330,6 +345,52 @@ async def test_update_online_users_tracks_members_in_stage_channels(khaled):
     assert (100, 3) in khaled.online_users
 
 
+@pytest.mark.asyncio
+async def test_update_online_users_resumes_journaled_sessions(khaled):
+    staying = MagicMock(id=1, bot=False)
+    leaving = MagicMock(id=2, bot=False)
+    voice_channel = MagicMock(members=[staying, leaving])
+    guild = MagicMock(id=100, voice_channels=[voice_channel], stage_channels=[])
+    _set_connection_state(khaled, guilds=[guild])
+    khaled.online_users = {}
+    journaled_since = object()
+
+    async def resume(connected):
+        assert connected == {(100, 1), (100, 2)}
+        # Member 2 disconnects while the journal is being read.
+        voice_channel.members = [staying]
+        return {(100, 1): journaled_since, (100, 2): journaled_since}
+
+    db_cog = MagicMock()
+    db_cog.resume_voice_sessions = AsyncMock(side_effect=resume)
+    db_cog.end_voice_session = AsyncMock()
+    khaled.get_cog = MagicMock(side_effect=lambda name: {"Database": db_cog}.get(name))
+
+    await khaled.update_online_users()
+
+    assert khaled.online_users == {(100, 1): journaled_since}
+    db_cog.end_voice_session.assert_awaited_once_with(100, 2, journaled_since)
+
+
+@pytest.mark.asyncio
+async def test_update_online_users_starts_fresh_when_resuming_fails(khaled):
+    human = MagicMock(id=1, bot=False)
+    guild = MagicMock(
+        id=100, voice_channels=[MagicMock(members=[human])], stage_channels=[]
+    )
+    _set_connection_state(khaled, guilds=[guild])
+    khaled.online_users = {}
+    db_cog = MagicMock()
+    db_cog.resume_voice_sessions = AsyncMock(side_effect=RuntimeError("db down"))
+    khaled.get_cog = MagicMock(side_effect=lambda name: {"Database": db_cog}.get(name))
+    khaled.logger = MagicMock()
+
+    await khaled.update_online_users()
+
+    assert (100, 1) in khaled.online_users
+    khaled.logger.exception.assert_called_once()
+
+
 @pytest.mark.asyncio
 async def test_on_voice_state_update_disconnect_flushes_duration(khaled):
     member = MagicMock(id=42, guild=MagicMock(id=100))
@@ -339,14 +400,14 @@ async def test_on_voice_state_update_disconnect_flushes_duration(khaled):
     khaled.online_users = {(100, 42): join_time}
 
     db_cog = MagicMock()
-    db_cog.flush_user_duration = AsyncMock()
+    db_cog.end_voice_session = AsyncMock()
     khaled.get_cog = MagicMock(side_effect=lambda name: {"Database": db_cog}.get(name))
     _set_connection_state(khaled, user=MagicMock(id=999))
 
     await khaled.on_voice_state_update(member, before, after)
 
     assert (100, 42) not in khaled.online_users
-    db_cog.flush_user_duration.assert_awaited_once_with(42, join_time)
+    db_cog.end_voice_session.assert_awaited_once_with(100, 42, join_time)
 
 
 @pytest.mark.asyncio
@@ -366,7 +427,7 @@ async def test_on_voice_state_update_disconnect_from_one_guild_keeps_other_guild
     }
 
     db_cog = MagicMock()
-    db_cog.flush_user_duration = AsyncMock()
+    db_cog.end_voice_session = AsyncMock()
     khaled.get_cog = MagicMock(side_effect=lambda name: {"Database": db_cog}.get(name))
     _set_connection_state(khaled, user=MagicMock(id=999))
 
@@ -390,6 +451,24 @@ async def test_on_voice_state_update_connect_tracks_human_join(khaled):
     assert (100, 7) in khaled.online_users
 
 
+@pytest.mark.asyncio
+async def test_on_voice_state_update_connect_journals_the_session(khaled):
+    member = MagicMock(id=7, bot=False, guild=MagicMock(id=100))
+    before = MagicMock(channel=None)
+    after = MagicMock(channel=MagicMock())
+    khaled.online_users = {}
+    db_cog = MagicMock()
+    db_cog.open_voice_session = AsyncMock()
+    khaled.get_cog = MagicMock(side_effect=lambda name: {"Database": db_cog}.get(name))
+    _set_connection_state(khaled, user=MagicMock(id=999))
+
+    await khaled.on_voice_state_update(member, before, after)
+
+    db_cog.open_voice_session.assert_awaited_once_with(
+        100, 7, khaled.online_users[(100, 7)]
+    )
+
+
 @pytest.mark.asyncio
 async def test_on_voice_state_update_bot_kicked_triggers_forced_disconnect(khaled):
     guild = MagicMock()
@@ -409,6 +488,39 @@ async def test_on_voice_state_update_bot_kicked_triggers_forced_disconnect(khale
     music_cog.handle_forced_disconnect.assert_awaited_once_with(guild)
 
 
+@pytest.mark.asyncio
+async def test_on_voice_state_update_wakes_the_music_cog_for_member_changes(khaled):
+    guild = MagicMock()
+    member = MagicMock(id=7, bot=False, guild=guild)
+    before = MagicMock(channel=MagicMock())
+    after = MagicMock(channel=None)
+
+    music_cog = MagicMock()
+    khaled.get_cog = MagicMock(side_effect=lambda name: {"Music": music_cog}.get(name))
+    _set_connection_state(khaled, user=MagicMock(id=999))
+    khaled.online_users = {}
+
+    await khaled.on_voice_state_update(member, before, after)
+
+    music_cog.handle_voice_state_update.assert_called_once_with(guild)
+
+
+@pytest.mark.asyncio
+async def test_http_responses_are_reported_to_the_music_embed_updater(khaled):
+    music_cog = MagicMock()
+    khaled.get_cog = MagicMock(side_effect=lambda name: {"Music": music_cog}.get(name))
+    params = MagicMock(method="PATCH")
+    params.url.path = "/api/v10/channels/1/messages/2"
+    params.response.status = 200
+    params.response.headers = {"X-RateLimit-Remaining": "4"}
+
+    await khaled._on_http_request_end(None, None, params)
+
+    music_cog.services.embed_updater.observe.assert_called_once_with(
+        "PATCH", "/api/v10/channels/1/messages/2", 200, {"X-RateLimit-Remaining": "4"}
+    )
+
+
 @pytest.mark.asyncio
 async def test_fetch_message_by_id_rejects_non_integer_ids(khaled):
     assert await khaled.fetch_message_by_id("abc", "def") is None
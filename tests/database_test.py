@@ -10,6 +10,9 @@ from sqlalchemy.pool import StaticPool
 from cogs import database as database_module
 from cogs.database import Database, _default_db_url
 from cogs.db.base import Base
+from cogs.db.entities.song import Song
+from cogs.db.entities.song_stats import SongPlayCount
+from cogs.db.entities.voice_session import VoiceSession
 
 
 class _FakeBootstrapConn:
@@ -176,23 +179,35 @@ async def test_save_chess_game_error_is_logged_not_raised(db_cog):
 
 
 @pytest.mark.asyncio
-async def test_cog_load_initializes_engine_and_starts_duration_loop(db_cog):
+async def test_cog_load_initializes_engine_and_starts_flush_loops(db_cog):
     db_cog._init_engine = MagicMock()
     db_cog.update_user_durations.start = MagicMock()
+    db_cog.flush_song_buffer.start = MagicMock()
+    db_cog.checkpoint_voice_sessions.start = MagicMock()
 
     await db_cog.cog_load()
 
     db_cog._init_engine.assert_called_once()
     db_cog.update_user_durations.start.assert_called_once()
+    db_cog.flush_song_buffer.start.assert_called_once()
+    db_cog.checkpoint_voice_sessions.start.assert_called_once()
 
 
 @pytest.mark.asyncio
-async def test_cog_unload_cancels_duration_loop(db_cog):
+async def test_cog_unload_cancels_loops_and_flushes_song_plays(db_cog):
     db_cog.update_user_durations.cancel = MagicMock()
+    db_cog.flush_song_buffer.cancel = MagicMock()
+    db_cog.checkpoint_voice_sessions.cancel = MagicMock()
+    db_cog.record_song_play(SONG_DATA, requested_by_user_id=42)
 
     await db_cog.cog_unload()
 
     db_cog.update_user_durations.cancel.assert_called_once()
+    db_cog.flush_song_buffer.cancel.assert_called_once()
+    db_cog.checkpoint_voice_sessions.cancel.assert_called_once()
+    assert db_cog._song_buffer == []
+    with db_cog._session() as session:
+        assert session.query(Song).count() == 1
 
 
 @pytest.mark.asyncio
@@ -237,9 +252,8 @@ async def test_update_user_durations_credits_connected_users(db_cog):
 
     await db_cog.update_user_durations.coro(db_cog)
 
-    hours = dict(await db_cog.get_all_user_hours())
-    assert hours[1] == pytest.approx(1, abs=0.01)
-    assert hours[2] == pytest.approx(1, abs=0.01)
+    assert await db_cog.get_user_hours(1) == pytest.approx(1, abs=0.01)
+    assert await db_cog.get_user_hours(2) == pytest.approx(1, abs=0.01)
     # The marker is reset so the next tick only credits time since now.
     assert db_cog.bot.online_users[(10, 1)] > one_hour_ago
     assert db_cog.bot.online_users[(10, 2)] > one_hour_ago
@@ -259,8 +273,7 @@ async def test_update_user_durations_credits_same_user_in_two_guilds_independent
 
     await db_cog.update_user_durations.coro(db_cog)
 
-    hours = dict(await db_cog.get_all_user_hours())
-    assert hours[1] == pytest.approx(3, abs=0.01)
+    assert await db_cog.get_user_hours(1) == pytest.approx(3, abs=0.01)
 
 
 @pytest.mark.asyncio
@@ -270,44 +283,169 @@ async def test_update_user_durations_skips_user_with_no_elapsed_time(db_cog):
 
     await db_cog.update_user_durations.coro(db_cog)
 
-    hours = dict(await db_cog.get_all_user_hours())
-    assert hours.get(1, 0) == 0
+    assert await db_cog.get_user_hours(1) == 0
     # The marker must be left untouched when nothing was credited.
     assert db_cog.bot.online_users[(10, 1)] == now
 
 
 @pytest.mark.asyncio
-async def test_update_user_durations_logs_error_and_still_credits_other_users(db_cog):
+async def test_update_user_durations_writes_every_user_in_one_transaction(db_cog):
+    now = datetime.datetime.now(datetime.timezone.utc)
+    one_hour_ago = now - datetime.timedelta(hours=1)
+    db_cog.bot.online_users = {(10, user_id): one_hour_ago for user_id in range(50)}
+    # An existing row is added to; the rest are inserted.
+    await db_cog.end_voice_session(20, 0, one_hour_ago)
+    real_credit = db_cog._credit_voice_time
+    db_cog._credit_voice_time = MagicMock(side_effect=real_credit)
+
+    await db_cog.update_user_durations.coro(db_cog)
+
+    db_cog._credit_voice_time.assert_called_once()
+    hours = dict(await db_cog.get_top_user_hours(limit=100))
+    assert len(hours) == 50
+    assert hours[0] == pytest.approx(2, abs=0.01)
+    assert hours[49] == pytest.approx(1, abs=0.01)
+    stats = db_cog.duration_stats()
+    assert stats["users"] == 50
+    assert stats["seconds"] == pytest.approx(50 * 3600, abs=50)
+    assert stats["write_ms"] >= 0
+
+
+@pytest.mark.asyncio
+async def test_update_user_durations_failure_keeps_markers_for_the_next_tick(db_cog):
     now = datetime.datetime.now(datetime.timezone.utc)
     one_hour_ago = now - datetime.timedelta(hours=1)
     db_cog.bot.online_users = {(10, 1): one_hour_ago, (10, 2): one_hour_ago}
     db_cog.logger = MagicMock()
-    real_update = db_cog._update_user_duration
+    real_credit = db_cog._credit_voice_time
+    db_cog._credit_voice_time = MagicMock(side_effect=RuntimeError("db exploded"))
 
-    def flaky_update(user_id, seconds):
-        if user_id == 1:
-            raise RuntimeError("db exploded")
-        return real_update(user_id, seconds)
+    await db_cog.update_user_durations.coro(db_cog)
 
-    db_cog._update_user_duration = flaky_update
+    db_cog.logger.exception.assert_called_once_with(
+        "Failed to update durations for %d user(s)", 2
+    )
+    assert db_cog.bot.online_users == {(10, 1): one_hour_ago, (10, 2): one_hour_ago}
+    assert db_cog.duration_stats()["users"] == 0
 
+    db_cog._credit_voice_time = real_credit
     await db_cog.update_user_durations.coro(db_cog)
 
-    db_cog.logger.exception.assert_called_once_with(
-        "Failed to update duration for %s", 1
+    assert await db_cog.get_user_hours(1) == pytest.approx(1, abs=0.01)
+    assert await db_cog.get_user_hours(2) == pytest.approx(1, abs=0.01)
+
+
+def test_credit_voice_time_uses_on_duplicate_key_update_on_mysql(db_cog):
+    from sqlalchemy.dialects import mysql
+
+    session = MagicMock()
+    db_cog.engine = MagicMock()
+    db_cog.engine.dialect.name = "mysql"
+    db_cog.Session = MagicMock(return_value=session)
+    end = datetime.datetime(2024, 1, 1, 12, tzinfo=datetime.timezone.utc)
+    start = end - datetime.timedelta(minutes=1)
+
+    db_cog._credit_voice_time({(10, 1): (start, end), (10, 2): (start, end)})
+
+    users, guilds, days = (
+        str(call.args[0].compile(dialect=mysql.dialect()))
+        for call in session.execute.call_args_list
     )
-    hours = dict(await db_cog.get_all_user_hours())
-    assert hours.get(1, 0) == 0
-    assert hours[2] == pytest.approx(1, abs=0.01)
+    assert users.count("INSERT INTO users") == 1
+    assert (
+        "ON DUPLICATE KEY UPDATE total_duration_seconds = "
+        "(users.total_duration_seconds + VALUES(total_duration_seconds))"
+    ) in users
+    assert "ON DUPLICATE KEY UPDATE" in guilds
+    assert "ON DUPLICATE KEY UPDATE" in days
+    session.commit.assert_called_once()
 
 
 @pytest.mark.asyncio
-async def test_flush_user_duration_logs_error_without_raising(db_cog):
+async def test_update_user_durations_does_not_resurrect_user_who_disconnects_mid_tick(
+    db_cog,
+):
+    # Regression test: a user who disconnects (and is popped by
+    # on_voice_state_update) while the tick's write is in flight must not be
+    # put back into online_users - falsely marking them online forever and
+    # double-crediting their voice time on every future tick. That includes
+    # the failure path, which restores the markers of users still connected.
+    now = datetime.datetime.now(datetime.timezone.utc)
+    one_hour_ago = now - datetime.timedelta(hours=1)
+    db_cog.bot.online_users = {(10, 1): one_hour_ago, (10, 2): one_hour_ago}
     db_cog.logger = MagicMock()
-    db_cog._update_user_duration = MagicMock(side_effect=RuntimeError("db down"))
 
-    await db_cog.flush_user_duration(
-        1, datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(hours=1)
+    def racing_credit(*args):
+        del db_cog.bot.online_users[(10, 2)]
+        raise RuntimeError("db exploded")
+
+    db_cog._credit_voice_time = racing_credit
+
+    await db_cog.update_user_durations.coro(db_cog)
+
+    assert db_cog.bot.online_users == {(10, 1): one_hour_ago}
+
+
+@pytest.mark.asyncio
+async def test_delete_user_data_waits_for_an_in_flight_tick(db_cog):
+    # The tick snapshots and writes under the ledger lock; an erasure landing
+    # in between must run after the write, not before it, or the write would
+    # bring the erased row back.
+    now = datetime.datetime.now(datetime.timezone.utc)
+    db_cog.bot.online_users = {(10, 1): now - datetime.timedelta(hours=1)}
+    real_credit = db_cog._credit_voice_time
+    erasure = []
+
+    def slow_credit(*args):
+        time.sleep(0.05)
+        real_credit(*args)
+
+    db_cog._credit_voice_time = slow_credit
+
+    async def forget_me():
+        await asyncio.sleep(0)
+        db_cog.bot.online_users.pop((10, 1), None)
+        erasure.append(await db_cog.delete_user_data(1))
+
+    await asyncio.gather(db_cog.update_user_durations.coro(db_cog), forget_me())
+
+    assert erasure == [1]
+    assert await db_cog.get_user_hours(1) == 0
+
+
+def _journal(db_cog):
+    with db_cog._session() as session:
+        return {
+            (row.guild_id, row.user_id): (
+                row.since.replace(tzinfo=datetime.timezone.utc),
+                row.last_seen.replace(tzinfo=datetime.timezone.utc),
+            )
+            for row in session.query(VoiceSession).all()
+        }
+
+
+@pytest.mark.asyncio
+async def test_voice_session_is_journaled_on_join_and_closed_on_disconnect(db_cog):
+    join_time = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(
+        minutes=30
+    )
+
+    await db_cog.open_voice_session(10, 1, join_time)
+    assert _journal(db_cog) == {(10, 1): (join_time, join_time)}
+
+    await db_cog.end_voice_session(10, 1, join_time)
+
+    assert _journal(db_cog) == {}
+    assert await db_cog.get_user_hours(1) == pytest.approx(0.5, abs=0.01)
+
+
+@pytest.mark.asyncio
+async def test_end_voice_session_logs_error_without_raising(db_cog):
+    db_cog.logger = MagicMock()
+    db_cog._end_voice_session = MagicMock(side_effect=RuntimeError("db down"))
+
+    await db_cog.end_voice_session(
+        10, 1, datetime.datetime.now(datetime.timezone.utc)
     )  # must not raise
 
     db_cog.logger.exception.assert_called_once_with(
@@ -316,36 +454,241 @@ async def test_flush_user_duration_logs_error_without_raising(db_cog):
 
 
 @pytest.mark.asyncio
-async def test_update_user_durations_does_not_resurrect_user_who_disconnects_mid_tick(
-    db_cog,
-):
-    # Regression test: a plain read of `list(online_users.items())` followed by
-    # an unconditional `online_users[user_id] = now` would resurrect a user who
-    # disconnected (and was popped by on_voice_state_update) while an earlier
-    # user in the same tick was still being awaited - falsely marking them
-    # online forever and double-crediting their voice time on every future
-    # tick.
+async def test_hourly_credit_moves_journal_markers_forward(db_cog):
     now = datetime.datetime.now(datetime.timezone.utc)
     one_hour_ago = now - datetime.timedelta(hours=1)
+    await db_cog.open_voice_session(10, 1, one_hour_ago)
     db_cog.bot.online_users = {(10, 1): one_hour_ago, (10, 2): one_hour_ago}
 
-    real_to_thread = database_module.asyncio.to_thread
+    await db_cog.update_user_durations.coro(db_cog)
+
+    # Both the journaled user and one tracked before the journal existed
+    # now have a session starting at this tick.
+    tick = db_cog.bot.online_users[(10, 1)]
+    assert _journal(db_cog) == {(10, 1): (tick, tick), (10, 2): (tick, tick)}
+
 
-    async def racing_to_thread(func, *args, **kwargs):
-        if args and args[0] == 1:
-            # Simulate user 2 disconnecting (and being flushed/popped by
-            # on_voice_state_update) while user 1's flush is in flight.
-            del db_cog.bot.online_users[(10, 2)]
-        return await real_to_thread(func, *args, **kwargs)
+@pytest.mark.asyncio
+async def test_checkpoint_updates_every_tracked_session(db_cog):
+    long_ago = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(
+        hours=2
+    )
+    await db_cog.open_voice_session(10, 1, long_ago)
+    await db_cog.open_voice_session(20, 2, long_ago)
+    db_cog.bot.online_users = {(10, 1): long_ago, (20, 2): long_ago}
+
+    await db_cog.checkpoint_voice_sessions.coro(db_cog)
+
+    journal = _journal(db_cog)
+    assert set(journal) == {(10, 1), (20, 2)}
+    assert {since for since, _ in journal.values()} == {long_ago}
+    assert all(last_seen > long_ago for _, last_seen in journal.values())
 
-    with pytest.MonkeyPatch.context() as mp:
-        mp.setattr(database_module.asyncio, "to_thread", racing_to_thread)
-        await db_cog.update_user_durations.coro(db_cog)
 
-    assert (10, 2) not in db_cog.bot.online_users
-    hours = dict(await db_cog.get_all_user_hours())
-    assert hours.get(2, 0) == 0
-    assert hours[1] == pytest.approx(1, abs=0.01)
+@pytest.mark.asyncio
+async def test_checkpoint_deletes_untracked_sessions_once_resumed(db_cog):
+    long_ago = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(
+        hours=2
+    )
+    await db_cog.open_voice_session(10, 1, long_ago)
+    await db_cog.open_voice_session(10, 2, long_ago)
+    db_cog.bot.online_users = {(10, 1): long_ago}
+
+    # Before resuming, the journal is the previous process's: not touched.
+    await db_cog.checkpoint_voice_sessions.coro(db_cog)
+    assert _journal(db_cog)[(10, 2)] == (long_ago, long_ago)
+
+    await db_cog.resume_voice_sessions({(10, 1)})
+    await db_cog.checkpoint_voice_sessions.coro(db_cog)
+
+    assert set(_journal(db_cog)) == {(10, 1)}
+    assert await db_cog.get_user_hours(2) == 0
+
+
+@pytest.mark.asyncio
+async def test_leave_right_after_join_does_not_orphan_the_session(db_cog):
+    # The join's write waits behind an in-flight tick; the leave that follows
+    # must not close the session before it has been opened.
+    join_time = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(
+        minutes=30
+    )
+    async with db_cog._ledger_lock:
+        join = asyncio.create_task(db_cog.open_voice_session(10, 1, join_time))
+        await asyncio.sleep(0)
+        leave = asyncio.create_task(db_cog.end_voice_session(10, 1, join_time))
+        await asyncio.sleep(0)
+    await asyncio.gather(join, leave)
+
+    assert _journal(db_cog) == {}
+    assert await db_cog.get_user_hours(1) == pytest.approx(0.5, abs=0.01)
+
+
+@pytest.mark.asyncio
+async def test_disconnect_mid_tick_does_not_orphan_the_session(db_cog):
+    # The tick re-marks the sessions it credits; a disconnect landing while
+    # that write is in flight must close the session after it, not before.
+    one_hour_ago = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(
+        hours=1
+    )
+    await db_cog.open_voice_session(10, 1, one_hour_ago)
+    db_cog.bot.online_users = {(10, 1): one_hour_ago}
+    real_credit = db_cog._credit_voice_time
+
+    def slow_credit(*args):
+        time.sleep(0.05)
+        real_credit(*args)
+
+    db_cog._credit_voice_time = slow_credit
+
+    async def leave():
+        await asyncio.sleep(0)
+        join_time = db_cog.bot.online_users.pop((10, 1))
+        await db_cog.end_voice_session(10, 1, join_time)
+
+    await asyncio.gather(db_cog.update_user_durations.coro(db_cog), leave())
+
+    assert _journal(db_cog) == {}
+    assert await db_cog.get_user_hours(1) == pytest.approx(1, abs=0.01)
+
+
+@pytest.mark.asyncio
+async def test_checkpoint_error_handler_logs_exception(db_cog):
+    db_cog.logger = MagicMock()
+    error = RuntimeError("loop crashed")
+
+    await db_cog._checkpoint_error(error)
+
+    db_cog.logger.exception.assert_called_once_with(
+        "checkpoint_voice_sessions loop errored", exc_info=error
+    )
+
+
+@pytest.mark.asyncio
+async def test_resume_voice_sessions_after_a_crash(db_cog):
+    now = datetime.datetime.now(datetime.timezone.utc)
+    since = now - datetime.timedelta(minutes=50)
+    with db_cog._session() as session:
+        for guild_id, user_id, last_seen in (
+            # Still connected, restarted a minute after the last checkpoint.
+            (10, 1, now - datetime.timedelta(minutes=1)),
+            # Left while the bot was down.
+            (10, 2, now - datetime.timedelta(minutes=20)),
+            # Still connected, but the bot was down for longer than the gap.
+            (10, 3, now - datetime.timedelta(minutes=30)),
+        ):
+            session.add(
+                VoiceSession(
+                    guild_id=guild_id,
+                    user_id=user_id,
+                    since=database_module._naive_utc(since),
+                    last_seen=database_module._naive_utc(last_seen),
+                )
+            )
+    db_cog.bot.online_users = {}
+
+    resumed = await db_cog.resume_voice_sessions({(10, 1), (10, 3), (10, 4)})
+
+    assert resumed == {(10, 1): since}
+    hours = dict(await db_cog.get_top_user_hours(limit=100))
+    # Credited up to their last checkpoint only.
+    assert hours[2] == pytest.approx(30 / 60, abs=0.01)
+    assert hours[3] == pytest.approx(20 / 60, abs=0.01)
+    assert 1 not in hours and 4 not in hours
+    journal = _journal(db_cog)
+    assert set(journal) == {(10, 1), (10, 3), (10, 4)}
+    assert journal[(10, 1)][0] == since
+    assert journal[(10, 3)][0] > since
+    assert journal[(10, 4)][0] > since
+
+
+@pytest.mark.asyncio
+async def test_resume_voice_sessions_leaves_tracked_sessions_alone(db_cog):
+    # A second on_ready in the same process: the journal rows belong to
+    # sessions that are already being tracked.
+    join_time = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(
+        minutes=5
+    )
+    await db_cog.open_voice_session(10, 1, join_time)
+    db_cog.bot.online_users = {(10, 1): join_time}
+
+    assert await db_cog.resume_voice_sessions({(10, 1)}) == {}
+
+    assert _journal(db_cog) == {(10, 1): (join_time, join_time)}
+    assert await db_cog.get_user_hours(1) == 0
+
+
+@pytest.mark.asyncio
+async def test_delete_user_data_erases_journaled_voice_sessions(db_cog):
+    now = datetime.datetime.now(datetime.timezone.utc)
+    await db_cog.open_voice_session(10, 1, now)
+    await db_cog.open_voice_session(10, 2, now)
+
+    await db_cog.delete_user_data(1)
+
+    assert set(_journal(db_cog)) == {(10, 2)}
+
+
+def test_split_by_day_splits_at_utc_midnight():
+    start = datetime.datetime(2026, 3, 1, 23, 30, 0, 500000, tzinfo=datetime.timezone.utc)
+    end = datetime.datetime(2026, 3, 3, 0, 15, tzinfo=datetime.timezone.utc)
+
+    pieces = database_module._split_by_day(start, end)
+
+    assert pieces == [
+        (datetime.date(2026, 3, 1), 1799),
+        (datetime.date(2026, 3, 2), 86400),
+        (datetime.date(2026, 3, 3), 900),
+    ]
+    assert sum(s for _, s in pieces) == int((end - start).total_seconds())
+    assert database_module._split_by_day(end, start) == []
+
+
+@pytest.mark.asyncio
+async def test_voice_time_credits_maintain_per_guild_rollups(db_cog):
+    now = datetime.datetime.now(datetime.timezone.utc)
+    two_hours_ago = now - datetime.timedelta(hours=2)
+    one_hour_ago = now - datetime.timedelta(hours=1)
+    # User 1 is in two guilds at once; user 2 only in guild 20.
+    db_cog.bot.online_users = {
+        (10, 1): two_hours_ago,
+        (20, 1): one_hour_ago,
+        (20, 2): one_hour_ago,
+    }
+
+    await db_cog.update_user_durations.coro(db_cog)
+    db_cog.bot.online_users.pop((20, 2))
+    await db_cog.end_voice_session(20, 2, one_hour_ago)
+
+    assert await db_cog.get_user_hours(1) == pytest.approx(3, abs=0.01)
+    assert await db_cog.get_guild_top_user_hours(10) == [
+        (1, pytest.approx(2, abs=0.01))
+    ]
+    assert await db_cog.get_guild_top_user_hours(20) == [
+        (2, pytest.approx(2, abs=0.01)),
+        (1, pytest.approx(1, abs=0.01)),
+    ]
+    today = now.date()
+    week = await db_cog.get_guild_top_user_hours(
+        20, since_day=today - datetime.timedelta(days=6), limit=1
+    )
+    assert week == [(2, pytest.approx(2, abs=0.01))]
+    tomorrow = today + datetime.timedelta(days=1)
+    assert await db_cog.get_guild_top_user_hours(20, since_day=tomorrow) == []
+
+
+@pytest.mark.asyncio
+async def test_delete_user_data_erases_voice_time_rollups(db_cog):
+    join_time = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(
+        hours=1
+    )
+    await db_cog.end_voice_session(10, 1, join_time)
+    await db_cog.end_voice_session(10, 2, join_time)
+
+    await db_cog.delete_user_data(1)
+
+    assert [uid for uid, _ in await db_cog.get_guild_top_user_hours(10)] == [2]
+    week = await db_cog.get_guild_top_user_hours(10, since_day=datetime.date.min)
+    assert [uid for uid, _ in week] == [2]
 
 
 def test_session_rolls_back_on_error(db_cog):
@@ -377,6 +720,39 @@ def test_default_db_url_assembles_from_discrete_env_vars(monkeypatch):
     assert _default_db_url() == "mysql+pymysql://u:p@h:1234"
 
 
+@pytest.mark.asyncio
+async def test_get_top_user_hours_sorts_limits_and_excludes(db_cog):
+    with db_cog._session() as session:
+        db_cog._add_durations(
+            session, {1: 3600, 2: 7200, 3: 1800, 999: 10**6, 4: 5400}
+        )
+
+    top = await db_cog.get_top_user_hours(3, exclude_ids=[999])
+
+    assert top == [(2, 2.0), (4, 1.5), (1, 1.0)]
+    assert (await db_cog.get_top_user_hours(1))[0][0] == 999
+
+
+def test_users_total_duration_is_indexed(db_cog):
+    from sqlalchemy import inspect
+
+    indexes = inspect(db_cog.engine).get_indexes("users")
+    assert ["total_duration_seconds"] in [index["column_names"] for index in indexes]
+
+
+def test_init_engine_adds_indexes_missing_from_existing_tables(db_cog):
+    from sqlalchemy import inspect
+
+    with db_cog.engine.begin() as conn:
+        conn.exec_driver_sql("DROP INDEX ix_users_total_duration_seconds")
+
+    db_cog._create_missing_indexes()
+    db_cog._create_missing_indexes()  # idempotent
+
+    names = [index["name"] for index in inspect(db_cog.engine).get_indexes("users")]
+    assert "ix_users_total_duration_seconds" in names
+
+
 @pytest.mark.asyncio
 async def test_get_user_hours_for_unknown_user_returns_zero(db_cog):
     assert await db_cog.get_user_hours(999) == 0
@@ -384,40 +760,40 @@ async def test_get_user_hours_for_unknown_user_returns_zero(db_cog):
 
 @pytest.mark.asyncio
 async def test_get_user_hours_for_known_user(db_cog):
-    await db_cog.flush_user_duration(
-        1, datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(hours=2)
+    join_time = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(
+        hours=2
     )
+    await db_cog.end_voice_session(10, 1, join_time)
 
     assert await db_cog.get_user_hours(1) == pytest.approx(2, abs=0.01)
 
 
 @pytest.mark.asyncio
-async def test_concurrent_flushes_for_a_brand_new_user_do_not_race(db_cog):
-    # Regression test: `_update_user_duration`'s "update, insert if 0 rows"
-    # upsert is a check-then-act race for a never-before-seen user_id - two
-    # concurrent flushes (e.g. the hourly tick and a disconnect landing close
-    # together) can both see 0 rows updated and both try to insert the same
-    # new primary key, raising IntegrityError and losing one flush's credit.
-    # The per-user lock in flush_user_duration/update_user_durations must
-    # serialize these instead of letting both threads run at once.
+async def test_concurrent_disconnects_for_a_brand_new_user_do_not_race(db_cog):
+    # Regression test: an "update, insert if 0 rows" write is a check-then-act
+    # race for a never-before-seen user_id - two concurrent disconnects (the
+    # same user leaving voice in two guilds) could both see 0 rows updated
+    # and both try to insert the same new primary key, raising IntegrityError
+    # and losing one session's credit. The write is an atomic upsert, and
+    # the ledger lock still serializes the two threads.
     calls = []
-    real_update = db_cog._update_user_duration
+    real_end = db_cog._end_voice_session
 
-    def tracking_update(user_id, seconds):
+    def tracking_end(*args):
         start = time.monotonic()
         time.sleep(0.05)
-        real_update(user_id, seconds)
+        real_end(*args)
         calls.append((start, time.monotonic()))
 
-    db_cog._update_user_duration = tracking_update
+    db_cog._end_voice_session = tracking_end
 
     now = datetime.datetime.now(datetime.timezone.utc)
     join_a = now - datetime.timedelta(seconds=10)
     join_b = now - datetime.timedelta(seconds=20)
 
     await asyncio.gather(
-        db_cog.flush_user_duration(999, join_a),
-        db_cog.flush_user_duration(999, join_b),
+        db_cog.end_voice_session(10, 999, join_a),
+        db_cog.end_voice_session(20, 999, join_b),
     )
 
     assert len(calls) == 2
@@ -429,12 +805,12 @@ async def test_concurrent_flushes_for_a_brand_new_user_do_not_race(db_cog):
 
 
 @pytest.mark.asyncio
-async def test_flush_user_duration_skips_non_positive_elapsed(db_cog):
-    # A join_time in the future (clock skew, or a flush racing a fresh join)
-    # must not persist a negative/zero duration.
+async def test_end_voice_session_skips_non_positive_elapsed(db_cog):
+    # A join_time in the future (clock skew, or a disconnect racing a fresh
+    # join) must not persist a negative/zero duration.
     future = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=1)
 
-    await db_cog.flush_user_duration(1, future)
+    await db_cog.end_voice_session(10, 1, future)
 
     assert await db_cog.get_user_hours(1) == 0
 
@@ -472,12 +848,13 @@ SONG_DATA = {
 
 
 @pytest.mark.asyncio
-async def test_save_song_and_get_most_played_songs(db_cog):
-    await db_cog.save_song(SONG_DATA, requested_by_user_id=42)
-    await db_cog.save_song(SONG_DATA, requested_by_user_id=42)
+async def test_record_song_play_and_get_most_played_songs(db_cog):
+    db_cog.record_song_play(SONG_DATA, requested_by_user_id=42)
+    db_cog.record_song_play(SONG_DATA, requested_by_user_id=42)
     other_song = {"original_url": "https://youtu.be/xyz", "title": "Other Song"}
-    await db_cog.save_song(other_song, requested_by_user_id=7)
+    db_cog.record_song_play(other_song, requested_by_user_id=7)
 
+    # Reads flush what's still buffered first.
     most_played = await db_cog.get_most_played_songs()
 
     assert most_played[0] == (SONG_DATA["original_url"], SONG_DATA["title"], 2)
@@ -486,9 +863,9 @@ async def test_save_song_and_get_most_played_songs(db_cog):
 
 @pytest.mark.asyncio
 async def test_get_most_song_requests(db_cog):
-    await db_cog.save_song(SONG_DATA, requested_by_user_id=42)
-    await db_cog.save_song(SONG_DATA, requested_by_user_id=42)
-    await db_cog.save_song(SONG_DATA, requested_by_user_id=7)
+    db_cog.record_song_play(SONG_DATA, requested_by_user_id=42)
+    db_cog.record_song_play(SONG_DATA, requested_by_user_id=42)
+    db_cog.record_song_play(SONG_DATA, requested_by_user_id=7)
 
     requests = dict(await db_cog.get_most_song_requests())
 
@@ -497,19 +874,187 @@ async def test_get_most_song_requests(db_cog):
 
 
 @pytest.mark.asyncio
-async def test_save_song_error_is_logged_not_raised(db_cog):
-    db_cog.engine.dispose()
+async def test_play_counters_accumulate_across_flushes(db_cog):
+    db_cog.record_song_play(SONG_DATA, requested_by_user_id=42)
+    await db_cog.flush_song_plays()
+    renamed = {**SONG_DATA, "title": "Some Song (Remastered)"}
+    db_cog.record_song_play(renamed, requested_by_user_id=7)
+    db_cog.record_song_play(renamed, requested_by_user_id=42)
+    await db_cog.flush_song_plays()
+
+    # One row per URL, under the title it was last played with.
+    assert await db_cog.get_most_played_songs() == [
+        (SONG_DATA["original_url"], "Some Song (Remastered)", 3)
+    ]
+    assert await db_cog.get_most_song_requests() == [(42, 2), (7, 1)]
+
+
+def test_play_counters_are_built_from_existing_history(db_cog):
+    with db_cog._session() as session:
+        session.add_all(
+            [
+                Song(SONG_DATA, 42),
+                Song(SONG_DATA, 7),
+                Song({"original_url": "https://youtu.be/xyz", "title": "Other"}, 7),
+            ]
+        )
+
+    db_cog._backfill_song_counts()
+    db_cog._backfill_song_counts()  # only once
+
+    assert db_cog._get_most_played_songs() == [
+        (SONG_DATA["original_url"], SONG_DATA["title"], 2),
+        ("https://youtu.be/xyz", "Other", 1),
+    ]
+    assert db_cog._get_most_song_requests() == [(7, 2), (42, 1)]
+
+
+def test_songs_are_indexed_by_url_and_requester(db_cog):
+    from sqlalchemy import inspect
+
+    indexed = [
+        index["column_names"] for index in inspect(db_cog.engine).get_indexes("songs")
+    ]
+    assert ["original_url"] in indexed
+    assert ["requested_by_user_id"] in indexed
+
+
+@pytest.mark.asyncio
+async def test_delete_user_data_takes_plays_out_of_the_counters(db_cog):
+    other_song = {"original_url": "https://youtu.be/xyz", "title": "Other Song"}
+    db_cog.record_song_play(SONG_DATA, requested_by_user_id=1)
+    db_cog.record_song_play(SONG_DATA, requested_by_user_id=2)
+    db_cog.record_song_play(other_song, requested_by_user_id=1)
+    await db_cog.flush_song_plays()
+
+    await db_cog.delete_user_data(1)
+
+    assert await db_cog.get_most_played_songs() == [
+        (SONG_DATA["original_url"], SONG_DATA["title"], 1)
+    ]
+    assert await db_cog.get_most_song_requests() == [(2, 1)]
+    with db_cog._session() as session:
+        assert session.query(SongPlayCount).count() == 1
+
+
+def test_record_song_play_only_buffers(db_cog):
+    db_cog._insert_songs = MagicMock()
+
+    db_cog.record_song_play(SONG_DATA, requested_by_user_id=1)
+
+    db_cog._insert_songs.assert_not_called()
+    assert db_cog._song_buffer == [
+        {
+            "title": SONG_DATA["title"],
+            "original_url": SONG_DATA["original_url"],
+            "artist": "N/A",
+            "requested_by_user_id": 1,
+        }
+    ]
+
+
+def test_record_song_play_logs_error_without_raising(db_cog):
+    db_cog.logger = MagicMock()
+
+    db_cog.record_song_play({"title": "No URL"}, requested_by_user_id=1)  # must not raise
+
+    db_cog.logger.exception.assert_called_once_with("Error saving song")
+    assert db_cog._song_buffer == []
+
+
+@pytest.mark.asyncio
+async def test_flush_song_plays_writes_buffer_in_one_commit(db_cog):
+    for user_id in range(250):
+        db_cog._song_buffer.append(Song.row(SONG_DATA, user_id))
+    commits = []
+    session_factory = db_cog.Session
+
+    def counting_session():
+        session = session_factory()
+        session.commit = MagicMock(side_effect=lambda: commits.append(1) or None)
+        return session
+
+    db_cog.Session = counting_session
+    assert await db_cog.flush_song_plays() == 250
+    db_cog.Session = session_factory
+
+    assert len(commits) == 1
+    assert db_cog.songs_flushed == 250
+    assert db_cog.song_flushes == 1
+    assert await db_cog.flush_song_plays() == 0
+
+
+@pytest.mark.asyncio
+async def test_record_song_play_flushes_once_the_size_threshold_is_reached(db_cog):
+    db_cog.song_flush_size = 3
+    db_cog.record_song_play(SONG_DATA, requested_by_user_id=1)
+    db_cog.record_song_play(SONG_DATA, requested_by_user_id=2)
+    assert db_cog._song_flush_task is None
+
+    db_cog.record_song_play(SONG_DATA, requested_by_user_id=3)
+    await db_cog._song_flush_task
+
+    assert db_cog._song_buffer == []
+    assert db_cog.songs_flushed == 3
+
+
+@pytest.mark.asyncio
+async def test_flush_song_buffer_loop_flushes(db_cog):
+    db_cog.record_song_play(SONG_DATA, requested_by_user_id=1)
+
+    await db_cog.flush_song_buffer()
+
+    assert db_cog.songs_flushed == 1
+
+
+@pytest.mark.asyncio
+async def test_failed_song_flush_is_logged_and_kept_for_retry(db_cog):
+    session_factory = db_cog.Session
     db_cog.Session = None
+    db_cog.logger = MagicMock()
+    db_cog.record_song_play(SONG_DATA, requested_by_user_id=1)
+
+    assert await db_cog.flush_song_plays() == 0  # must not raise
+
+    db_cog.logger.exception.assert_called_once()
+    assert len(db_cog._song_buffer) == 1
+    db_cog.Session = session_factory
+    assert await db_cog.flush_song_plays() == 1
+
+
+@pytest.mark.asyncio
+async def test_failed_song_flush_drops_oldest_plays_beyond_the_cap(db_cog, monkeypatch):
+    monkeypatch.setattr(database_module, "SONG_BUFFER_MAX", 2)
+    db_cog.Session = None
+    db_cog.logger = MagicMock()
+    for user_id in range(3):
+        db_cog.record_song_play(SONG_DATA, requested_by_user_id=user_id)
+
+    await db_cog.flush_song_plays()
+
+    assert [row["requested_by_user_id"] for row in db_cog._song_buffer] == [1, 2]
+    db_cog.logger.warning.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_song_buffer_error_handler_logs_exception(db_cog):
+    db_cog.logger = MagicMock()
+    error = RuntimeError("loop crashed")
 
-    await db_cog.save_song(SONG_DATA, requested_by_user_id=1)  # must not raise
+    await db_cog._song_buffer_error(error)
+
+    db_cog.logger.exception.assert_called_once_with(
+        "flush_song_buffer loop errored", exc_info=error
+    )
 
 
 @pytest.mark.asyncio
 async def test_get_user_data_and_delete_user_data(db_cog):
-    await db_cog.flush_user_duration(
-        1, datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(hours=1)
+    join_time = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(
+        hours=1
     )
-    await db_cog.save_song(SONG_DATA, requested_by_user_id=1)
+    await db_cog.end_voice_session(10, 1, join_time)
+    db_cog.record_song_play(SONG_DATA, requested_by_user_id=1)
 
     data = await db_cog.get_user_data(1)
     assert data["tracked_seconds"] > 0
@@ -522,7 +1067,29 @@ async def test_get_user_data_and_delete_user_data(db_cog):
     assert cleared == {"tracked_seconds": 0, "songs_requested": 0}
 
 
+@pytest.mark.asyncio
+async def test_delete_user_data_drops_buffered_song_plays(db_cog):
+    db_cog.record_song_play(SONG_DATA, requested_by_user_id=1)
+    db_cog.record_song_play(SONG_DATA, requested_by_user_id=2)
+
+    await db_cog.delete_user_data(1)
+
+    assert (await db_cog.get_user_data(1))["songs_requested"] == 0
+    assert (await db_cog.get_user_data(2))["songs_requested"] == 1
+
+
 @pytest.mark.asyncio
 async def test_get_user_data_for_unknown_user(db_cog):
     data = await db_cog.get_user_data(12345)
     assert data == {"tracked_seconds": 0, "songs_requested": 0}
+
+
+@pytest.mark.asyncio
+async def test_music_session_round_trip(db_cog):
+    await db_cog.save_music_session(1, '{"songs": []}', 0.0)
+    await db_cog.save_music_session(1, '{"songs": [1]}', 3.0)
+    await db_cog.save_music_session_position(1, 12.5)
+    await db_cog.save_music_session(2, "{}", 0.0)
+    await db_cog.delete_music_session(2)
+
+    assert await db_cog.get_music_sessions() == [(1, '{"songs": [1]}', 12.5)]
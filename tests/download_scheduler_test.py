@@ -0,0 +1,117 @@
+import asyncio
+
+import pytest
+
+from cogs.utils.music.download_scheduler import DownloadScheduler
+
+
+class FakeDownloader:
+    def __init__(self, name, songs, log):
+        self.name = name
+        self.queue = list(songs)
+        self.in_flight = 0
+        self.log = log
+        self.release = asyncio.Event()
+
+    def wants_download(self, lookahead):
+        return bool(self.queue) and self.in_flight < lookahead
+
+    def start_next(self):
+        song = self.queue.pop(0)
+        self.in_flight += 1
+        self.log.append((self.name, song))
+
+        async def job():
+            await self.release.wait()
+            self.in_flight -= 1
+
+        return asyncio.create_task(job())
+
+
+@pytest.fixture
+def scheduler():
+    scheduler = DownloadScheduler(max_concurrent=2, lookahead=5)
+    yield scheduler
+    scheduler.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_one_guild_cannot_take_every_slot(scheduler):
+    scheduler.max_concurrent = 3
+    scheduler.lookahead = 2
+    log = []
+    big_import = FakeDownloader("a", ["a1", "a2", "a3"], log)
+    single_play = FakeDownloader("b", ["b1"], log)
+
+    scheduler.notify(big_import)
+    scheduler.notify(single_play)
+
+    # The big import is capped by its lookahead window, leaving a slot for
+    # the other guild's single song.
+    assert log == [("a", "a1"), ("a", "a2"), ("b", "b1")]
+    assert scheduler.in_flight == 3
+
+    big_import.release.set()
+    single_play.release.set()
+    await asyncio.sleep(0.01)
+    scheduler.notify(big_import)
+
+    assert log[3:] == [("a", "a3")]
+
+
+@pytest.mark.asyncio
+async def test_freed_slots_are_handed_out_round_robin(scheduler):
+    scheduler.max_concurrent = 1
+    log = []
+    big_import = FakeDownloader("a", ["a1", "a2", "a3"], log)
+    single_play = FakeDownloader("b", ["b1"], log)
+    big_import.release.set()
+    single_play.release.set()
+
+    scheduler.notify(big_import)
+    scheduler.notify(single_play)
+    for _ in range(4):
+        await asyncio.sleep(0.01)
+
+    # "b" waits for at most one more of a's downloads, not the whole import.
+    assert log == [("a", "a1"), ("a", "a2"), ("b", "b1"), ("a", "a3")]
+    assert scheduler.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_lookahead_caps_downloads_per_guild(scheduler):
+    scheduler.lookahead = 1
+    log = []
+    downloader = FakeDownloader("a", ["a1", "a2"], log)
+
+    scheduler.notify(downloader)
+
+    assert log == [("a", "a1")]
+    downloader.release.set()
+    await asyncio.sleep(0.01)
+    # Nothing re-notified the scheduler about room in the window, but the
+    # finished task itself triggers another dispatch.
+    scheduler.notify(downloader)
+    assert log == [("a", "a1"), ("a", "a2")]
+
+
+@pytest.mark.asyncio
+async def test_forget_drops_a_waiting_guild(scheduler):
+    scheduler.max_concurrent = 0
+    downloader = FakeDownloader("a", ["a1"], [])
+
+    scheduler.notify(downloader)
+    scheduler.forget(downloader)
+    scheduler.max_concurrent = 2
+    scheduler._dispatch()
+
+    assert downloader.queue == ["a1"]
+
+
+@pytest.mark.asyncio
+async def test_notify_is_a_noop_without_queued_work(scheduler):
+    downloader = FakeDownloader("a", [], [])
+
+    scheduler.notify(downloader)
+
+    assert scheduler.in_flight == 0
@@ -1,10 +1,11 @@
 import asyncio
-import contextlib
 from unittest.mock import AsyncMock, MagicMock, patch
 
 import pytest
 
+from cogs.utils.music.download_scheduler import DownloadScheduler
 from cogs.utils.music.downloader import Downloader
+from cogs.utils.music.file_registry import FileRegistry
 
 
 @pytest.fixture
@@ -24,83 +25,64 @@ def state(config):
     state.config = config
     state.playlist.songs = []
     state.playlist.max_size = 100
+    state.playlist.shuffle = False
+    state.services.audio_cache.owns.return_value = False
+    state.services.file_registry = FileRegistry("downloads", state.services.audio_cache)
     return state
 
 
 @pytest.fixture
 def downloader(state):
-    d = Downloader(state)
-    yield d
-    task = d.process_queue.get_task()
-    if task is not None:
-        d.process_queue.cancel()
+    return Downloader(state)
 
 
-async def cancel_and_wait(loop_task):
-    task = loop_task.get_task()
-    loop_task.cancel()
-    if task is not None:
-        with contextlib.suppress(asyncio.CancelledError):
-            await task
+def make_message():
+    message = MagicMock()
+    message.reactions = []
+    message.add_reaction = AsyncMock()
+    message.clear_reactions = AsyncMock()
+    message.channel.send = AsyncMock()
+    return message
 
 
 @pytest.mark.asyncio
-async def test_concurrent_enqueue_does_not_double_start_the_loop(downloader):
-    # Regression test: two `play` invocations for the same guild can call
-    # enqueue() concurrently. Before the enqueue()-internal lock, both could
-    # observe process_queue.is_running() as False across the
-    # `await download_next_song()` gap, and the second .start() would raise
-    # RuntimeError ("Task is already launched").
-    release = asyncio.Event()
-
-    async def slow_download_next_song():
-        await release.wait()
-
-    downloader.download_next_song = AsyncMock(side_effect=slow_download_next_song)
-
-    first = asyncio.ensure_future(downloader.enqueue("song one", MagicMock()))
-    second = asyncio.ensure_future(downloader.enqueue("song two", MagicMock()))
-
-    await asyncio.sleep(0)  # let both tasks reach the await inside download_next_song
-    release.set()
+async def test_enqueue_hands_the_queue_to_the_shared_scheduler(downloader, state):
+    message = MagicMock()
+    message.channel.send = AsyncMock()
 
-    await asyncio.gather(first, second)  # must not raise RuntimeError
+    await downloader.enqueue("song one", message)
 
-    assert downloader.process_queue.is_running()
-    await cancel_and_wait(downloader.process_queue)
+    state.services.download_scheduler.notify.assert_called_once_with(downloader)
+    state.state_machine.start.assert_called_once()
 
 
 @pytest.mark.asyncio
-async def test_download_next_song_cleans_up_when_queue_cancelled_mid_download(
+async def test_download_cleans_up_when_queue_cancelled_mid_download(
     downloader, state
 ):
     # Regression test: if the queue is cancelled while a download is in
     # flight, the finished file must not leak on disk and the message must
     # not get a false "success" reaction for a song that will never play.
-    message = MagicMock()
-    message.reactions = []
-    message.add_reaction = AsyncMock()
-    message.clear_reactions = AsyncMock()
-    message.channel.send = AsyncMock()
-
+    message = make_message()
     downloader.queue = [("some song", message, False)]
-    downloader.queue_cancelled = True
 
-    state.bot.loop.run_in_executor = AsyncMock(
-        side_effect=[True, ("downloads/12345.mp3", {"title": "Some Song"})]
-    )
+    async def download_then_clear(*_args):
+        await downloader.clear()
+        return ("downloads/12345.mp3", {"title": "Some Song"})
+
+    state.bot.loop.run_in_executor = AsyncMock(side_effect=download_then_clear)
     state.state_machine.stop = AsyncMock()
     state.cog_success = AsyncMock()
     state.playlist.add = AsyncMock()
     state.playlist.update_message = AsyncMock()
 
-    with patch("cogs.utils.music.downloader.os.remove") as mock_remove:
-        await downloader.download_next_song()
+    with patch("cogs.utils.music.file_registry.os.remove") as mock_remove:
+        await downloader.start_next()
 
     mock_remove.assert_called_once_with("downloads/12345.mp3")
     state.cog_success.assert_not_awaited()
     state.playlist.add.assert_not_awaited()
-    assert downloader.queue_cancelled is False
+    assert downloader.in_flight == []
     # Regression: the requester's message must not be left with a stuck
     # PROCESSING reaction forever with no success/error indicator.
     message.clear_reactions.assert_awaited_once()
@@ -112,7 +94,7 @@ async def test_download_next_song_cleans_up_when_queue_cancelled_mid_download(
 
 
 @pytest.mark.asyncio
-async def test_download_next_song_does_not_react_success_when_playlist_drops_it(
+async def test_download_does_not_react_success_when_playlist_drops_it(
     downloader, state
 ):
     # Regression test: the requester's message used to get a "done" reaction
@@ -126,14 +108,14 @@ async def test_download_next_song_does_not_react_success_when_playlist_drops_it(
     downloader.queue = [("some song", message, False)]
 
     state.bot.loop.run_in_executor = AsyncMock(
-        side_effect=[True, ("downloads/12345.mp3", {"title": "Some Song"})]
+        return_value=("downloads/12345.mp3", {"title": "Some Song"})
     )
     state.cog_success = AsyncMock()
     state.cog_failure = AsyncMock()
     state.playlist.add = AsyncMock(return_value=False)
     state.playlist.update_message = AsyncMock()
 
-    await downloader.download_next_song()
+    await downloader.start_next()
 
     state.playlist.add.assert_awaited_once()
     state.cog_success.assert_not_awaited()
@@ -143,7 +125,7 @@ async def test_download_next_song_does_not_react_success_when_playlist_drops_it(
 
 
 @pytest.mark.asyncio
-async def test_download_next_song_reacts_success_only_after_song_is_queued(
+async def test_download_reacts_success_only_after_song_is_queued(
     downloader, state
 ):
     message = MagicMock()
@@ -154,14 +136,14 @@ async def test_download_next_song_reacts_success_only_after_song_is_queued(
     downloader.queue = [("some song", message, False)]
 
     state.bot.loop.run_in_executor = AsyncMock(
-        side_effect=[True, ("downloads/12345.mp3", {"title": "Some Song"})]
+        return_value=("downloads/12345.mp3", {"title": "Some Song"})
     )
     state.cog_success = AsyncMock()
     state.cog_failure = AsyncMock()
     state.playlist.add = AsyncMock(return_value=True)
     state.playlist.update_message = AsyncMock()
 
-    await downloader.download_next_song()
+    await downloader.start_next()
 
     state.playlist.add.assert_awaited_once()
     state.cog_success.assert_awaited_once_with(message)
@@ -170,45 +152,147 @@ async def test_download_next_song_reacts_success_only_after_song_is_queued(
 
 
 @pytest.mark.asyncio
-async def test_download_next_song_reserves_path_while_fetching_lyrics(downloader, state):
-    # Regression test: for a Spotify-sourced request, download_next_song()
-    # awaits genius.fetch_lyrics() *after* the file is on disk but *before*
-    # playlist.add() appends it to this guild's playlist - a yield point
-    # another guild's cleanup_files() could run in. The path must be reserved
-    # in the shared cog-level set for that whole window, and released once
-    # add() resolves either way.
-    message = MagicMock()
-    message.reactions = []
-    message.add_reaction = AsyncMock()
-    message.channel.send = AsyncMock()
-
+async def test_spotify_lyrics_do_not_hold_up_queueing_the_song(downloader, state):
+    # Lyrics used to be awaited between the download finishing and
+    # playlist.add(), so a slow Genius response delayed playback. They're now
+    # fetched alongside the download and attached to the Song once ready.
+    message = make_message()
     downloader.queue = [("some song", message, True)]  # spotify_req=True
 
     state.bot.loop.run_in_executor = AsyncMock(
-        side_effect=[True, ("downloads/12345.mp3", {"title": "Some Song"})]
+        return_value=("downloads/12345.mp3", {"title": "Some Song"})
     )
-    state.cog.pending_download_paths = set()
     state.cog_success = AsyncMock()
     state.playlist.update_message = AsyncMock()
 
-    path_reserved_during_fetch = None
+    lyrics_ready = asyncio.Event()
 
-    async def fetch_lyrics(_name):
-        nonlocal path_reserved_during_fetch
-        path_reserved_during_fetch = "downloads/12345.mp3" in state.cog.pending_download_paths
+    async def fetch_lyrics(name):
+        assert name == "some song"
+        await lyrics_ready.wait()
         return "some lyrics"
 
-    async def add(*args, **kwargs):
-        assert "downloads/12345.mp3" in state.cog.pending_download_paths
-        return True
+    song = MagicMock(lyrics=None)
+
+    async def add(path, info, message, lyrics, stream_url):
+        # The download holds the file until the Song takes it over.
+        assert downloader.files.tracked(path)
+        assert lyrics is None
+        return song
 
     downloader.genius.fetch_lyrics = fetch_lyrics
     state.playlist.add = add
 
-    await downloader.download_next_song()
+    await asyncio.wait_for(downloader.start_next(), timeout=1)
+
+    assert song.lyrics is None
+    lyrics_ready.set()
+    await asyncio.sleep(0)
+    await asyncio.sleep(0)
+    assert song.lyrics == "some lyrics"
+
+
+@pytest.mark.asyncio
+async def test_lyrics_ready_before_queueing_are_attached_straight_away(downloader, state):
+    message = make_message()
+    downloader.queue = [("some song", message, True)]
+
+    async def download(*_args):
+        await asyncio.sleep(0)  # long enough for the lookup to finish
+        return "downloads/12345.mp3", {"title": "Some Song"}
+
+    state.bot.loop.run_in_executor = download
+    state.cog_success = AsyncMock()
+    state.playlist.update_message = AsyncMock()
+    downloader.genius.fetch_lyrics = AsyncMock(return_value="some lyrics")
+    song = MagicMock(lyrics=None)
+    state.playlist.add = AsyncMock(return_value=song)
+
+    await downloader.start_next()
+
+    assert song.lyrics == "some lyrics"
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("ready_before_queueing", [True, False])
+async def test_failed_lyrics_lookup_does_not_reach_the_download(
+    downloader, state, ready_before_queueing
+):
+    message = make_message()
+    downloader.queue = [("some song", message, True)]
+    lyrics_failed = asyncio.Event()
+
+    async def fetch_lyrics(_name):
+        if not ready_before_queueing:
+            await lyrics_failed.wait()
+        raise RuntimeError("database is locked")
+
+    async def download(*_args):
+        await asyncio.sleep(0)  # long enough for a ready lookup to finish
+        return "downloads/12345.mp3", {"title": "Some Song"}
+
+    state.bot.loop.run_in_executor = download
+    state.cog_success = AsyncMock()
+    state.playlist.update_message = AsyncMock()
+    downloader.genius.fetch_lyrics = fetch_lyrics
+    song = MagicMock(lyrics=None)
+    state.playlist.add = AsyncMock(return_value=song)
+    downloader.logger = MagicMock()
+
+    await downloader.start_next()
+    lyrics_failed.set()
+    await asyncio.gather(*downloader._lyrics_tasks, return_exceptions=True)
+    await asyncio.sleep(0)
+
+    state.cog_success.assert_awaited_once_with(message)
+    state.playlist.update_message.assert_awaited_once()
+    assert song.lyrics is None
+    downloader.logger.error.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_download_releases_cached_file_when_playlist_drops_it(
+    downloader, state
+):
+    # A cached file can be shared with other guilds - a dropped request only
+    # gives up its reference instead of deleting the file.
+    message = MagicMock()
+    message.reactions = []
+    message.add_reaction = AsyncMock()
+    message.channel.send = AsyncMock()
+
+    downloader.queue = [("some song", message, False)]
+    state.bot.loop.run_in_executor = AsyncMock(
+        return_value=("downloads/Youtube-abc.mp3", {"title": "Some Song"})
+    )
+    state.services.audio_cache.owns.return_value = True
+    state.cog_failure = AsyncMock()
+    state.playlist.add = AsyncMock(return_value=False)
+
+    with patch("cogs.utils.music.file_registry.os.remove") as mock_remove:
+        await downloader.start_next()
 
-    assert path_reserved_during_fetch is True
-    assert "downloads/12345.mp3" not in state.cog.pending_download_paths
+    state.services.audio_cache.release.assert_called_once_with("downloads/Youtube-abc.mp3")
+    mock_remove.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_download_is_released_when_queueing_it_fails(downloader, state):
+    # Nothing scans DOWNLOAD_DIR on song start any more, so a download that
+    # never reaches the playlist must give up its file itself.
+    message = make_message()
+    downloader.queue = [("some song", message, False)]
+    state.bot.loop.run_in_executor = AsyncMock(
+        return_value=("downloads/12345.mp3", {"title": "Some Song"})
+    )
+    state.playlist.add = AsyncMock(side_effect=RuntimeError("voice exploded"))
+
+    with patch("cogs.utils.music.file_registry.os.remove") as mock_remove:
+        with pytest.raises(RuntimeError):
+            await downloader.start_next()
+
+    mock_remove.assert_called_once_with("downloads/12345.mp3")
+    assert not downloader.files.tracked("downloads/12345.mp3")
 
 
 @pytest.mark.asyncio
@@ -216,7 +300,6 @@ async def test_enqueue_notifies_when_queue_is_full(downloader, state):
     # Regression test: enqueue() used to silently drop songs that didn't fit
     # under playlist.max_size (e.g. a large Spotify playlist import), with no
     # indication to the requester that anything was left out.
-    downloader.download_next_song = AsyncMock()
     state.playlist.max_size = 1
     downloader.queue = [("already queued song", MagicMock(), False)]
 
@@ -228,12 +311,10 @@ async def test_enqueue_notifies_when_queue_is_full(downloader, state):
     assert ("some new song", message, False) not in downloader.queue
     message.channel.send.assert_awaited_once()
     assert "not added" in message.channel.send.call_args[0][0]
-    await cancel_and_wait(downloader.process_queue)
 
 
 @pytest.mark.asyncio
 async def test_enqueue_does_not_notify_when_song_fits(downloader, state):
-    downloader.download_next_song = AsyncMock()
     message = MagicMock()
     message.channel.send = AsyncMock()
 
@@ -241,48 +322,92 @@ async def test_enqueue_does_not_notify_when_song_fits(downloader, state):
 
     assert ("some new song", message, False) in downloader.queue
     message.channel.send.assert_not_awaited()
-    await cancel_and_wait(downloader.process_queue)
 
 
 @pytest.mark.asyncio
-async def test_enqueue_clears_cancelled_flag_when_song_is_added(downloader, state):
-    # A previous `clear` set queue_cancelled=True; a brand new enqueue() that
-    # actually adds a song must un-cancel the queue so process_queue doesn't
-    # immediately bail out on the next tick.
-    downloader.download_next_song = AsyncMock()
-    downloader.queue_cancelled = True
-    message = MagicMock()
-    message.channel.send = AsyncMock()
+async def test_download_queued_after_clear_is_not_discarded(downloader, state):
+    # Only downloads started before a `clear` are dropped; a song queued
+    # afterwards must still reach the playlist.
+    await downloader.clear()
+    message = make_message()
+    downloader.queue = [("brand new song", message, False)]
+    state.bot.loop.run_in_executor = AsyncMock(
+        return_value=("downloads/12345.mp3", {"title": "Some Song"})
+    )
+    state.cog_success = AsyncMock()
+    state.playlist.add = AsyncMock(return_value=True)
+    state.playlist.update_message = AsyncMock()
+
+    await downloader.start_next()
+
+    state.playlist.add.assert_awaited_once()
+
 
-    await downloader.enqueue("brand new song", message)
+def pages_of(*pages):
+    async def iterate(*_args):
+        for page in pages:
+            yield list(page)
 
-    assert downloader.queue_cancelled is False
-    await cancel_and_wait(downloader.process_queue)
+    return MagicMock(side_effect=iterate)
 
 
 @pytest.mark.asyncio
-async def test_enqueue_expands_spotify_url_via_get_spotify_songs(downloader, state):
-    # enqueue() must route a spotify.com query through get_spotify_songs()
+async def test_enqueue_expands_spotify_url_via_iter_spotify_songs(downloader, state):
+    # enqueue() must route a spotify.com query through iter_spotify_songs()
     # (which can expand one URL into many tracks) instead of queuing the raw
     # URL as a single song.
-    downloader.download_next_song = AsyncMock()
-    downloader.get_spotify_songs = AsyncMock(
-        return_value=[("track one", MagicMock(), True), ("track two", MagicMock(), True)]
-    )
     message = MagicMock()
     message.channel.send = AsyncMock()
+    downloader.iter_spotify_songs = pages_of(
+        [("track one", message, True)], [("track two", message, True)]
+    )
 
     await downloader.enqueue("https://open.spotify.com/playlist/xyz", message)
 
-    downloader.get_spotify_songs.assert_awaited_once_with(
-        "https://open.spotify.com/playlist/xyz", message
+    downloader.iter_spotify_songs.assert_called_once_with(
+        "https://open.spotify.com/playlist/xyz", message, state.playlist.max_size + 1
     )
     assert [song[0] for song in downloader.queue] == ["track one", "track two"]
-    await cancel_and_wait(downloader.process_queue)
 
 
 @pytest.mark.asyncio
-async def test_download_next_song_ignores_clear_reactions_failure_when_cancelled(
+async def test_enqueue_starts_downloading_after_the_first_page(downloader, state):
+    message = MagicMock()
+    message.channel.send = AsyncMock()
+    scheduled_with = []
+    downloader.schedule = lambda: scheduled_with.append(len(downloader.queue))
+    downloader.iter_spotify_songs = pages_of(
+        [("a", message, True), ("b", message, True)], [("c", message, True)]
+    )
+
+    await downloader.enqueue("https://open.spotify.com/playlist/xyz", message)
+
+    assert scheduled_with == [2, 3]
+
+
+@pytest.mark.asyncio
+async def test_enqueue_stops_paging_once_the_queue_is_full(downloader, state):
+    state.playlist.max_size = 2
+    message = MagicMock()
+    message.channel.send = AsyncMock()
+    fetched = []
+
+    async def iterate(*_args):
+        for page in (["a", "b", "c"], ["d"], ["e"]):
+            fetched.append(page)
+            yield [(name, message, True) for name in page]
+
+    downloader.iter_spotify_songs = iterate
+
+    await downloader.enqueue("https://open.spotify.com/playlist/xyz", message)
+
+    assert [song[0] for song in downloader.queue] == ["a", "b"]
+    assert fetched == [["a", "b", "c"]]
+    assert "not added" in message.channel.send.call_args[0][0]
+
+
+@pytest.mark.asyncio
+async def test_download_ignores_clear_reactions_failure_when_cancelled(
     downloader, state
 ):
     # Regression-style test: if the requester's message was already deleted
@@ -295,58 +420,62 @@ async def test_download_next_song_ignores_clear_reactions_failure_when_cancelled
     message.channel.send = AsyncMock()
 
     downloader.queue = [("some song", message, False)]
-    downloader.queue_cancelled = True
 
-    state.bot.loop.run_in_executor = AsyncMock(
-        side_effect=[True, ("downloads/12345.mp3", {"title": "Some Song"})]
-    )
+    async def download_then_clear(*_args):
+        await downloader.clear()
+        return ("downloads/12345.mp3", {"title": "Some Song"})
+
+    state.bot.loop.run_in_executor = AsyncMock(side_effect=download_then_clear)
     state.state_machine.stop = AsyncMock()
     state.playlist.add = AsyncMock()
 
-    with patch("cogs.utils.music.downloader.os.remove"):
-        await downloader.download_next_song()  # must not raise
+    with patch("cogs.utils.music.file_registry.os.remove"):
+        await downloader.start_next()  # must not raise
 
     message.clear_reactions.assert_awaited_once()
-    assert downloader.queue_cancelled is False
+
+
+async def collect(pages):
+    return [item async for page in pages for item in page]
 
 
 @pytest.mark.asyncio
-async def test_get_spotify_songs_playlist_url(downloader):
-    downloader.spotify.get_playlist_songs = AsyncMock(return_value=["song a", "song b"])
+async def test_iter_spotify_songs_playlist_url(downloader):
+    downloader.spotify.iter_playlist_songs = pages_of(["song a"], ["song b"])
     message = MagicMock()
 
-    result = await downloader.get_spotify_songs(
-        "https://open.spotify.com/playlist/xyz", message
+    result = await collect(
+        downloader.iter_spotify_songs("https://open.spotify.com/playlist/xyz", message, 10)
     )
 
-    downloader.spotify.get_playlist_songs.assert_awaited_once_with(
-        "https://open.spotify.com/playlist/xyz"
+    downloader.spotify.iter_playlist_songs.assert_called_once_with(
+        "https://open.spotify.com/playlist/xyz", 10
     )
     assert result == [("song a", message, True), ("song b", message, True)]
 
 
 @pytest.mark.asyncio
-async def test_get_spotify_songs_album_url(downloader):
-    downloader.spotify.get_album_songs = AsyncMock(return_value=["album song"])
+async def test_iter_spotify_songs_album_url(downloader):
+    downloader.spotify.iter_album_songs = pages_of(["album song"])
     message = MagicMock()
 
-    result = await downloader.get_spotify_songs(
-        "https://open.spotify.com/album/xyz", message
+    result = await collect(
+        downloader.iter_spotify_songs("https://open.spotify.com/album/xyz", message)
     )
 
-    downloader.spotify.get_album_songs.assert_awaited_once_with(
-        "https://open.spotify.com/album/xyz"
+    downloader.spotify.iter_album_songs.assert_called_once_with(
+        "https://open.spotify.com/album/xyz", None
     )
     assert result == [("album song", message, True)]
 
 
 @pytest.mark.asyncio
-async def test_get_spotify_songs_track_url(downloader):
+async def test_iter_spotify_songs_track_url(downloader):
     downloader.spotify.get_track_name = AsyncMock(return_value="track name")
     message = MagicMock()
 
-    result = await downloader.get_spotify_songs(
-        "https://open.spotify.com/track/xyz", message
+    result = await collect(
+        downloader.iter_spotify_songs("https://open.spotify.com/track/xyz", message)
     )
 
     downloader.spotify.get_track_name.assert_awaited_once_with(
@@ -356,17 +485,21 @@ async def test_get_spotify_songs_track_url(downloader):
 
 
 @pytest.mark.asyncio
-async def test_download_next_song_returns_immediately_when_queue_empty(downloader, state):
+async def test_schedule_starts_nothing_when_queue_empty(downloader, state):
+    downloader.scheduler = DownloadScheduler(max_concurrent=1)
     downloader.queue = []
     state.bot.loop.run_in_executor = AsyncMock()
 
-    await downloader.download_next_song()
+    downloader.schedule()
 
+    assert downloader.scheduler.in_flight == 0
+    assert downloader.in_flight == []
     state.bot.loop.run_in_executor.assert_not_awaited()
+    downloader.scheduler.shutdown()
 
 
 @pytest.mark.asyncio
-async def test_download_next_song_swallows_reaction_add_failure(downloader, state):
+async def test_download_swallows_reaction_add_failure(downloader, state):
     # A message with no `.reactions` iterable (or a reaction API error) must
     # not abort the download - the reaction is best-effort.
     message = MagicMock()
@@ -376,38 +509,38 @@ async def test_download_next_song_swallows_reaction_add_failure(downloader, stat
 
     downloader.queue = [("some song", message, False)]
     state.bot.loop.run_in_executor = AsyncMock(
-        side_effect=[True, ("downloads/12345.mp3", {"title": "Some Song"})]
+        return_value=("downloads/12345.mp3", {"title": "Some Song"})
     )
-    state.cog.pending_download_paths = set()
     state.cog_success = AsyncMock()
     state.playlist.add = AsyncMock(return_value=True)
     state.playlist.update_message = AsyncMock()
 
-    await downloader.download_next_song()
+    await downloader.start_next()
 
     state.cog_success.assert_awaited_once_with(message)
 
 
 @pytest.mark.asyncio
-async def test_download_next_song_treats_unplayable_as_failure(downloader, state):
+async def test_download_treats_unplayable_as_failure(downloader, state):
     message = MagicMock()
     message.reactions = []
     message.add_reaction = AsyncMock()
     message.channel.send = AsyncMock(return_value="sent")
 
     downloader.queue = [("bad song", message, False)]
-    state.bot.loop.run_in_executor = AsyncMock(return_value=False)
+    # resolve_and_download() returns None when the duration gate rejects it.
+    state.bot.loop.run_in_executor = AsyncMock(return_value=None)
     state.cog_failure = AsyncMock()
 
-    await downloader.download_next_song()
+    await downloader.start_next()
 
     state.cog_failure.assert_awaited_once_with("sent", message)
     assert "too long" in message.channel.send.call_args[0][0]
 
 
 @pytest.mark.asyncio
-async def test_download_next_song_handles_playability_check_exception(downloader, state):
-    # An exception raised while checking playability (e.g. yt-dlp network
+async def test_download_handles_resolve_exception(downloader, state):
+    # An exception raised while resolving the song (e.g. yt-dlp network
     # error) must be treated as "not playable", not crash the download loop.
     message = MagicMock()
     message.reactions = []
@@ -418,69 +551,221 @@ async def test_download_next_song_handles_playability_check_exception(downloader
     state.bot.loop.run_in_executor = AsyncMock(side_effect=Exception("network error"))
     state.cog_failure = AsyncMock()
 
-    await downloader.download_next_song()
+    await downloader.start_next()
 
     state.cog_failure.assert_awaited_once_with("sent", message)
 
 
 @pytest.mark.asyncio
-async def test_download_next_song_handles_download_exception(downloader, state):
+async def test_download_handles_download_exception(downloader, state):
     message = MagicMock()
     message.reactions = []
     message.add_reaction = AsyncMock()
     message.channel.send = AsyncMock(return_value="sent")
 
     downloader.queue = [("some song", message, False)]
-    state.bot.loop.run_in_executor = AsyncMock(
-        side_effect=[True, Exception("disk full")]
-    )
+    state.bot.loop.run_in_executor = AsyncMock(side_effect=Exception("disk full"))
     state.cog_failure = AsyncMock()
 
-    await downloader.download_next_song()
+    await downloader.start_next()
 
     state.cog_failure.assert_awaited_once_with("sent", message)
 
 
 @pytest.mark.asyncio
-async def test_process_queue_stops_when_queue_empty(downloader):
-    downloader.queue = []
-    downloader.download_next_song = AsyncMock()
+async def test_download_resolves_and_downloads_in_one_executor_hop(
+    downloader, state
+):
+    # The playability probe and the download used to be two separate
+    # executor jobs, each running a full yt-dlp extraction.
+    message = MagicMock()
+    message.reactions = []
+    message.add_reaction = AsyncMock()
+    message.channel.send = AsyncMock()
+
+    downloader.queue = [("some song", message, False)]
+    state.bot.loop.run_in_executor = AsyncMock(
+        return_value=("downloads/12345.mp3", {"title": "Some Song"})
+    )
+    state.cog_success = AsyncMock()
+    state.playlist.add = AsyncMock(return_value=True)
+    state.playlist.update_message = AsyncMock()
 
-    await downloader.process_queue.coro(downloader)
+    await downloader.start_next()
 
-    downloader.download_next_song.assert_not_awaited()
+    state.bot.loop.run_in_executor.assert_awaited_once_with(
+        downloader.scheduler.executor,
+        downloader.youtube.resolve_and_download,
+        "some song",
+    )
 
 
 @pytest.mark.asyncio
-async def test_process_queue_logs_and_survives_download_exception(downloader):
+async def test_stop_clears_queue_and_transitions_to_stopped(downloader, state):
+    downloader.queue = [("song", MagicMock(), False)]
+
+    await downloader.stop()
+
+    assert downloader.queue == []
+    state.services.download_scheduler.forget.assert_called_once_with(downloader)
+    state.state_machine.transition_to.assert_called_once()
+
+
+def test_wants_download_only_within_the_lookahead_window(downloader, state):
     downloader.queue = [("song", MagicMock(), False)]
-    downloader.download_next_song = AsyncMock(side_effect=Exception("boom"))
+    state.playlist.songs = [MagicMock()]
+    downloader.in_flight = [("other", MagicMock(), False)]
 
-    # Must not raise - a bare tasks.loop stops for good on the first
-    # unhandled exception, which would silently kill the download queue.
-    await downloader.process_queue.coro(downloader)
+    assert downloader.wants_download(3) is True
+    assert downloader.wants_download(2) is False
 
-    downloader.download_next_song.assert_awaited_once()
+
+def test_busy_while_a_download_is_in_flight(downloader):
+    assert downloader.busy() is False
+    downloader.in_flight = [("song", MagicMock(), False)]
+    assert downloader.busy() is True
 
 
 @pytest.mark.asyncio
-async def test_delete_file_quietly_swallows_os_error(downloader):
-    with patch("cogs.utils.music.downloader.os.remove", side_effect=OSError("gone")):
-        downloader._delete_file_quietly("missing/file.mp3")  # must not raise
+async def test_parallel_downloads_commit_to_playlist_in_queue_order(downloader, state):
+    # With several downloads in flight the second song can finish first; it
+    # must still be added to the playlist after the first one.
+    first, second = make_message(), make_message()
+    downloader.queue = [("first", first, False), ("second", second, False)]
+    finish_first = asyncio.Event()
+
+    async def resolve(_executor, _fn, name):
+        if name == "first":
+            await finish_first.wait()
+        return (f"downloads/{name}.mp3", {"title": name})
+
+    state.bot.loop.run_in_executor = AsyncMock(side_effect=resolve)
+    state.cog_success = AsyncMock()
+    state.playlist.update_message = AsyncMock()
+    added = []
+
+    async def add(path, *_args):
+        added.append(path)
+        return True
+
+    state.playlist.add = add
+
+    first_task = downloader.start_next()
+    second_task = downloader.start_next()
+    await asyncio.sleep(0.01)
+    assert added == []  # "second" is done but waits for "first"
+
+    finish_first.set()
+    await asyncio.gather(first_task, second_task)
+
+    assert added == ["downloads/first.mp3", "downloads/second.mp3"]
+    assert downloader.in_flight == []
 
 
 @pytest.mark.asyncio
-async def test_stop_cancels_running_process_queue_and_transitions_to_stopped(
+async def test_failed_download_does_not_let_later_songs_jump_the_queue(
     downloader, state
 ):
-    downloader.queue = [("song", MagicMock(), False)]
-    downloader.download_next_song = AsyncMock(side_effect=lambda: asyncio.sleep(10))
-    downloader.process_queue.start()
+    # "second" fails while "first" is still downloading: "third" must still
+    # wait for "first" instead of being committed ahead of it.
+    messages = [make_message() for _ in range(3)]
+    downloader.queue = [
+        (name, message, False)
+        for name, message in zip(("first", "second", "third"), messages)
+    ]
+    finish_first = asyncio.Event()
+
+    async def resolve(_executor, _fn, name):
+        if name == "first":
+            await finish_first.wait()
+        if name == "second":
+            raise RuntimeError("download failed")
+        return (f"downloads/{name}.mp3", {"title": name})
+
+    state.bot.loop.run_in_executor = AsyncMock(side_effect=resolve)
+    state.cog_success = AsyncMock()
+    state.cog_failure = AsyncMock()
+    state.playlist.update_message = AsyncMock()
+    added = []
+
+    async def add(path, *_args):
+        added.append(path)
+        return True
+
+    state.playlist.add = add
+
+    tasks = [downloader.start_next() for _ in range(3)]
+    await asyncio.sleep(0.01)
+    assert added == []  # "second" failed, "third" waits for "first"
+
+    finish_first.set()
+    await asyncio.gather(*tasks)
+
+    assert added == ["downloads/first.mp3", "downloads/third.mp3"]
+    assert downloader._next_commit == 3
+    assert downloader._finished == set()
+
+
+@pytest.mark.asyncio
+async def test_clear_skips_the_commit_slots_of_dropped_downloads(downloader, state):
+    downloader.queue = [("old", make_message(), False)]
+    finish_old = asyncio.Event()
+
+    async def resolve(_executor, _fn, name):
+        if name == "old":
+            await finish_old.wait()
+        return (f"downloads/{name}.mp3", {"title": name})
+
+    state.bot.loop.run_in_executor = AsyncMock(side_effect=resolve)
+    state.cog_success = AsyncMock()
+    state.playlist.update_message = AsyncMock()
+    state.playlist.add = AsyncMock(return_value=MagicMock())
+
+    old_task = downloader.start_next()
     await asyncio.sleep(0)
-    assert downloader.process_queue.is_running()
+    await downloader.clear()
+    downloader.queue = [("new", make_message(), False)]
+    await downloader.start_next()
 
-    await downloader.stop()
+    state.playlist.add.assert_awaited_once()
+    finish_old.set()
+    await old_task
 
-    assert downloader.queue == []
-    assert downloader.queue_cancelled is True
-    state.state_machine.transition_to.assert_called_once()
+    state.playlist.add.assert_awaited_once()
+    assert downloader._next_commit == 2
+    assert downloader._finished == set()
+
+
+@pytest.mark.asyncio
+async def test_stream_playback_queues_song_before_its_download_finishes(state):
+    state.config["stream_playback"] = "true"
+    downloader = Downloader(state)
+    message = make_message()
+    downloader.queue = [("some song", message, False)]
+    info = {"title": "Some Song", "url": "https://media.example/audio"}
+    song = MagicMock(path=None, audio_released=False)
+    download_finished = asyncio.Event()
+
+    async def run_in_executor(_executor, fn, *args):
+        if fn == downloader.youtube.resolve_for_streaming:
+            return (None, info)
+        await download_finished.wait()
+        return ("downloads/Youtube-abc.mp3", info)
+
+    state.bot.loop.run_in_executor = AsyncMock(side_effect=run_in_executor)
+    state.cog_success = AsyncMock()
+    state.playlist.add = AsyncMock(return_value=song)
+    state.playlist.update_message = AsyncMock()
+
+    await downloader.start_next()
+
+    state.playlist.add.assert_awaited_once_with(
+        None, info, message, None, "https://media.example/audio"
+    )
+    state.cog_success.assert_awaited_once()
+    assert song.path is None
+
+    download_finished.set()
+    await asyncio.gather(*downloader._background_downloads)
+
+    assert song.path == "downloads/Youtube-abc.mp3"
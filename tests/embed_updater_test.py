@@ -0,0 +1,173 @@
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+
+import discord
+import pytest
+
+from cogs.utils.music.embed_updater import EmbedUpdater
+
+
+def make_message(message_id=1, channel_id=10):
+    message = MagicMock()
+    message.id = message_id
+    message.channel.id = channel_id
+    message.edit = AsyncMock()
+    return message
+
+
+def make_embed(text):
+    return discord.Embed(description=text)
+
+
+async def drain(updater):
+    await asyncio.gather(
+        *(c.task for c in updater._channels.values() if c.task is not None)
+    )
+
+
+@pytest.mark.asyncio
+async def test_submit_sends_the_edit():
+    updater = EmbedUpdater(min_interval=0)
+    message = make_message()
+    embed = make_embed("a")
+
+    updater.submit(message, embed)
+    await drain(updater)
+
+    message.edit.assert_awaited_once_with(embed=embed)
+    assert updater.stats()["sent"] == 1
+
+
+@pytest.mark.asyncio
+async def test_unchanged_content_is_not_sent_again():
+    updater = EmbedUpdater(min_interval=0)
+    message = make_message()
+
+    updater.submit(message, make_embed("a"))
+    await drain(updater)
+    updater.submit(message, make_embed("a"))
+    await drain(updater)
+
+    message.edit.assert_awaited_once()
+    assert updater.stats()["skipped"] == 1
+
+
+@pytest.mark.asyncio
+async def test_edits_waiting_for_the_interval_are_coalesced():
+    updater = EmbedUpdater(min_interval=0.05)
+    message = make_message()
+
+    updater.submit(message, make_embed("first"))
+    await asyncio.sleep(0)  # the first edit goes out immediately
+    updater.submit(message, make_embed("second"))
+    updater.submit(message, make_embed("third"))
+    await drain(updater)
+
+    sent = [c.kwargs["embed"].description for c in message.edit.await_args_list]
+    assert sent == ["first", "third"]
+    assert updater.stats()["coalesced"] == 1
+
+
+@pytest.mark.asyncio
+async def test_idle_channels_are_forgotten_once_their_interval_runs_out():
+    updater = EmbedUpdater(min_interval=0.05)
+    message = make_message()
+
+    updater.submit(message, make_embed("a"))
+    await asyncio.sleep(0.01)
+    # Sent, but the channel is still paced: a new edit must wait its turn.
+    assert updater.stats()["channels"] == 1
+    await drain(updater)
+
+    assert updater.stats()["channels"] == 0
+    updater.submit(message, make_embed("a"))  # unchanged: nothing to pace
+    assert updater.stats()["channels"] == 0
+    updater.submit(message, make_embed("b"))
+    await drain(updater)
+    assert message.edit.await_count == 2
+    assert updater.stats()["channels"] == 0
+
+
+@pytest.mark.asyncio
+async def test_channels_are_paced_independently():
+    updater = EmbedUpdater(min_interval=10)
+    first = make_message(message_id=1, channel_id=10)
+    other = make_message(message_id=2, channel_id=20)
+
+    updater.submit(first, make_embed("a"))
+    updater.submit(other, make_embed("b"))
+    await asyncio.sleep(0.01)
+
+    first.edit.assert_awaited_once()
+    other.edit.assert_awaited_once()
+    updater.close()
+
+
+@pytest.mark.asyncio
+async def test_failed_edit_is_counted_and_does_not_stop_the_channel():
+    updater = EmbedUpdater(min_interval=0)
+    broken = make_message(message_id=1)
+    broken.edit = AsyncMock(side_effect=discord.HTTPException(MagicMock(), "boom"))
+    healthy = make_message(message_id=2)
+
+    updater.submit(broken, make_embed("a"))
+    updater.submit(healthy, make_embed("b"))
+    await drain(updater)
+
+    healthy.edit.assert_awaited_once()
+    assert updater.stats()["failed"] == 1
+
+
+def test_observe_spreads_remaining_edits_over_the_window():
+    updater = EmbedUpdater(min_interval=1, max_interval=30)
+    channel = updater._channels[10] = MagicMock(interval=1, next_at=0)
+
+    updater.observe(
+        "PATCH",
+        "/api/v10/channels/10/messages/99",
+        200,
+        {"X-RateLimit-Remaining": "2", "X-RateLimit-Reset-After": "5"},
+    )
+
+    assert channel.interval == 2.5
+
+
+def test_observe_waits_for_reset_when_bucket_is_empty():
+    updater = EmbedUpdater(min_interval=1, max_interval=30)
+    channel = updater._channels[10] = MagicMock(interval=1, next_at=0)
+
+    updater.observe(
+        "PATCH",
+        "/api/v10/channels/10/messages/99",
+        200,
+        {"X-RateLimit-Remaining": "0", "X-RateLimit-Reset-After": "4"},
+    )
+
+    assert channel.interval == 4
+    assert channel.next_at > 0
+
+
+def test_observe_backs_off_on_429():
+    updater = EmbedUpdater(min_interval=2, max_interval=30)
+    channel = updater._channels[10] = MagicMock(interval=2, next_at=0)
+
+    updater.observe(
+        "PATCH", "/api/v10/channels/10/messages/99", 429, {"Retry-After": "3"}
+    )
+
+    assert channel.interval == 4
+    assert updater.stats()["rate_limited"] == 1
+
+
+def test_observe_ignores_other_routes():
+    updater = EmbedUpdater(min_interval=2)
+    channel = updater._channels[10] = MagicMock(interval=2, next_at=0)
+
+    updater.observe(
+        "POST",
+        "/api/v10/channels/10/messages",
+        200,
+        {"X-RateLimit-Remaining": "0", "X-RateLimit-Reset-After": "9"},
+    )
+
+    assert channel.interval == 2
@@ -0,0 +1,131 @@
+import os
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from cogs.models.song import Song
+from cogs.utils.music.audio_cache import AudioCache
+from cogs.utils.music.file_registry import FileRegistry
+from cogs.utils.music.player import Player
+from cogs.utils.music.playlist import Playlist
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return AudioCache(str(tmp_path))
+
+
+@pytest.fixture
+def registry(tmp_path, cache):
+    return FileRegistry(str(tmp_path), cache)
+
+
+def make_file(tmp_path, name, age=0):
+    path = tmp_path / name
+    path.write_bytes(b"audio")
+    if age:
+        stamp = time.time() - age
+        os.utime(path, (stamp, stamp))
+    return str(path)
+
+
+def test_file_is_deleted_when_its_last_reference_is_released(registry, tmp_path):
+    path = make_file(tmp_path, "123.mp3")
+    registry.track(path)
+    registry.track(path)
+
+    registry.release(path)
+    assert os.path.exists(path)
+    registry.release(path)
+
+    assert not os.path.exists(path)
+    assert registry.stats() == {"tracked": 0, "deleted": 1, "swept": 0}
+
+
+def test_releasing_an_untracked_file_leaves_it_alone(registry, tmp_path):
+    path = make_file(tmp_path, "123.mp3")
+
+    registry.release(path)
+    registry.release(None)
+
+    assert os.path.exists(path)
+
+
+def test_cached_files_are_refcounted_by_the_audio_cache(registry, cache, tmp_path):
+    path = cache.store("Youtube-abc.mp3", make_file(tmp_path, "download"))
+    registry.track(path)  # no-op: the cache already holds the reference
+
+    assert not registry.tracked(path)
+    registry.release(path)
+
+    assert os.path.exists(path)
+    assert cache.stats()["entries"] == 1
+    assert cache._entries["Youtube-abc.mp3"].refs == 0
+
+
+def test_releasing_a_cached_file_lets_the_cache_evict_it(tmp_path):
+    cache = AudioCache(str(tmp_path), max_bytes=1)
+    registry = FileRegistry(str(tmp_path), cache)
+    path = cache.store("Youtube-abc.mp3", make_file(tmp_path, "download"))
+    assert os.path.exists(path)  # referenced, so kept despite the budget
+
+    registry.release(path)
+
+    assert not os.path.exists(path)
+
+
+def test_sweep_deletes_only_old_unreferenced_files(registry, cache, tmp_path):
+    orphan = make_file(tmp_path, "111.mp3", age=7200)
+    partial = make_file(tmp_path, "222.webm.part", age=7200)
+    fresh = make_file(tmp_path, "333.webm.part")
+    tracked = make_file(tmp_path, "444.mp3", age=7200)
+    registry.track(tracked)
+    cached = cache.store("Youtube-abc.mp3", make_file(tmp_path, "download", age=7200))
+    os.utime(cached, (time.time() - 7200,) * 2)
+    os.mkdir(tmp_path / "subdir")
+
+    assert registry.sweep(min_age=3600) == 2
+
+    assert not os.path.exists(orphan)
+    assert not os.path.exists(partial)
+    for path in (fresh, tracked, cached):
+        assert os.path.exists(path)
+    assert registry.stats()["swept"] == 2
+
+
+def test_sweep_of_a_missing_directory_is_a_noop(tmp_path, cache):
+    registry = FileRegistry(str(tmp_path / "missing"), cache)
+
+    assert registry.sweep() == 0
+
+
+@pytest.mark.asyncio
+async def test_clear_while_playing_then_seek_reopens_the_file(registry, tmp_path):
+    # Regression test: `clear` during playback used to drop the playing
+    # song's last reference, deleting the file ffmpeg had open, so a seek
+    # (or loop replay, or voice-drop resume) then had nothing to reopen.
+    path = make_file(tmp_path, "123.mp3")
+    registry.track(path)
+    state = MagicMock()
+    state.release_audio = registry.release
+    state.playlist = Playlist(state)
+    player = Player(state)
+    player.voice_client = MagicMock()
+    song = Song(path, {"title": "Some Song"}, MagicMock())
+    state.playlist.current_song = song
+    state.playlist.last_song = song
+    opened = []
+
+    def ffmpeg(source, **_kwargs):
+        opened.append(os.path.exists(source))
+        return MagicMock()
+
+    with patch("cogs.utils.music.player.discord.FFmpegPCMAudio", ffmpeg):
+        player.play_audio(song.source)
+        await state.playlist.clear()
+        assert player.seek(30) == 30
+
+    assert opened == [True, True]
+    await state.playlist.clear_last()  # the song finished
+    assert not os.path.exists(path)
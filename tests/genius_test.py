@@ -1,8 +1,11 @@
-from unittest.mock import MagicMock, patch
+import sqlite3
+from unittest.mock import AsyncMock, MagicMock, patch
 
 import pytest
 
+from benchmarks.lyrics_parse_bench import legacy_format_lyrics
 from cogs.api.genius import GeniusAPI
+from cogs.utils.music.lyrics_cache import MISSING, LyricsCache
 
 
 class FakeResponse:
@@ -186,11 +189,118 @@ async def test_fetch_lyrics_returns_none_on_missing_result_key(api):
 
 
 def test_format_lyrics_strips_scripts_and_adds_newlines_around_brackets(api):
-    from bs4 import BeautifulSoup
-
-    soup = BeautifulSoup(LYRICS_HTML, "html.parser")
-    result = api.format_lyrics(soup)
+    result = api.format_lyrics(LYRICS_HTML)
 
     assert result is not None
     assert "\n[Verse 1]" in result
     assert "[Chorus]" in result
+    assert "ignore me" not in result
+
+
+GENIUS_LIKE_HTML = """
+<html><head><script>var marker = 'data-lyrics-container';</script></head>
+<body><div class="Nav">Home</div>
+<div data-lyrics-container="true" class="Lyrics__Container">[Intro]<br/>
+<a href="/1"><span class="ReferentFragment">Rock &amp; roll (ooh)</span></a><br>
+<div class="Inner"><i>nested</i> line</div><!-- a comment -->
+<script>console.log("not lyrics")</script><style>.x { color: red }</style>
+Tom &amp;amp; Jerry (<b>yeah</b>)</div>
+<div class="Ad">advert</div>
+<div data-lyrics-container="true">[Outro]<br/>Bye</div>
+<script>window.__STATE__ = "data-lyrics-container=\\"true\\"";</script>
+<footer>unclosed <div>junk
+</body></html>
+"""
+
+
+@pytest.mark.parametrize("page_text", [LYRICS_HTML, GENIUS_LIKE_HTML])
+def test_format_lyrics_matches_the_beautifulsoup_output(api, page_text):
+    assert api.format_lyrics(page_text) == legacy_format_lyrics(page_text)
+
+
+def test_format_lyrics_returns_none_without_lyrics_containers(api):
+    assert api.format_lyrics("<html><body><div>no lyrics</div></body></html>") is None
+
+
+@pytest.mark.asyncio
+async def test_fetch_lyrics_parses_the_page_off_the_event_loop(api):
+    fake_session = MagicMock()
+    fake_session.get = MagicMock(
+        return_value=FakeResponse(
+            200,
+            {"response": {"hits": [{"result": {"url": "https://genius.com/x"}}]}},
+        )
+    )
+    with patch("cogs.api.genius.get_session", return_value=fake_session), patch(
+        "cogs.api.genius.get_text", return_value=LYRICS_HTML
+    ), patch(
+        "cogs.api.genius.asyncio.to_thread", new_callable=AsyncMock, return_value="x"
+    ) as to_thread:
+        result = await api.fetch_lyrics("Some Song")
+
+    to_thread.assert_awaited_once_with(api.format_lyrics, LYRICS_HTML)
+    assert result == "x"
+
+
+@pytest.fixture
+def cached_api(config, tmp_path):
+    cache = LyricsCache(str(tmp_path / "lyrics.db"))
+    yield GeniusAPI(config, cache=cache)
+    cache.close()
+
+
+def search_session(hits):
+    fake_session = MagicMock()
+    fake_session.get = MagicMock(
+        side_effect=lambda *a, **k: FakeResponse(200, {"response": {"hits": hits}})
+    )
+    return fake_session
+
+
+@pytest.mark.asyncio
+async def test_fetch_lyrics_serves_repeat_requests_from_the_cache(cached_api):
+    fake_session = search_session(
+        [{"result": {"url": "https://genius.com/some-song-lyrics"}}]
+    )
+    with patch("cogs.api.genius.get_session", return_value=fake_session), patch(
+        "cogs.api.genius.get_text", return_value=LYRICS_HTML
+    ):
+        first = await cached_api.fetch_lyrics("Some Song")
+        second = await cached_api.fetch_lyrics("some song (Remastered)")
+
+    assert second == first
+    fake_session.get.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_fetch_lyrics_caches_songs_without_lyrics(cached_api):
+    fake_session = search_session([])
+    with patch("cogs.api.genius.get_session", return_value=fake_session):
+        assert await cached_api.fetch_lyrics("Obscure Song") is None
+        assert await cached_api.fetch_lyrics("Obscure Song") is None
+
+    fake_session.get.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_fetch_lyrics_does_not_cache_failed_lookups(cached_api):
+    fake_session = MagicMock()
+    fake_session.get = MagicMock(side_effect=lambda *a, **k: FakeResponse(500))
+    with patch("cogs.api.genius.get_session", return_value=fake_session):
+        await cached_api.fetch_lyrics("Some Song")
+        await cached_api.fetch_lyrics("Some Song")
+
+    assert fake_session.get.call_count == 2
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("failing", ["get", "put"])
+async def test_fetch_lyrics_returns_none_when_the_cache_fails(config, failing):
+    cache = MagicMock()
+    cache.get.return_value = MISSING
+    getattr(cache, failing).side_effect = sqlite3.OperationalError("database is locked")
+    api = GeniusAPI(config, cache=cache)
+    fake_session = search_session([])
+
+    with patch("cogs.api.genius.get_session", return_value=fake_session):
+        assert await api.fetch_lyrics("Some Song") is None  # must not raise
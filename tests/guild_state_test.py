@@ -46,7 +46,7 @@ def guild_state():
         }
     }
     guild = MagicMock()
-    return GuildMusicState(cog, guild)
+    return GuildMusicState(cog, guild, cog.services)
 
 
 @pytest.mark.asyncio
@@ -70,13 +70,12 @@ async def test_cog_failure_proxies_to_cog(guild_state):
     guild_state.cog.cog_failure.assert_awaited_once_with(sent_message, query_message)
 
 
-def test_cleanup_files_proxies_to_cog(guild_state):
-    current_song = MagicMock()
-    queue = [MagicMock()]
+def test_release_audio_goes_through_the_file_registry(guild_state):
+    guild_state.release_audio("downloads/song.mp3")
 
-    guild_state.cleanup_files(current_song, queue)
-
-    guild_state.cog.cleanup_files.assert_called_once_with(current_song, queue)
+    guild_state.services.file_registry.release.assert_called_once_with(
+        "downloads/song.mp3"
+    )
 
 
 @pytest.mark.asyncio
@@ -84,21 +83,21 @@ async def test_teardown_stops_state_machine_and_clears_everything(guild_state):
     guild_state.state_machine.stop = AsyncMock()
     guild_state.downloader.clear = AsyncMock()
     guild_state.player.stop = AsyncMock()
-    guild_state.playlist.clear = AsyncMock()
+    guild_state.playlist.reset = AsyncMock()
 
     await guild_state.teardown()
 
     guild_state.state_machine.stop.assert_awaited_once()
     guild_state.downloader.clear.assert_awaited_once()
     guild_state.player.stop.assert_awaited_once()
-    guild_state.playlist.clear.assert_awaited_once()
+    guild_state.playlist.reset.assert_awaited_once()
     assert guild_state.state_machine.current == State.DISCONNECTED
 
 
 @pytest.mark.asyncio
 async def test_idle_timeout_auto_stop_completes_full_cleanup(guild_state):
     # Regression test: GuildMusicState.stop() used to cancel the state
-    # machine's own `handle_state` loop task *before* running the rest of
+    # machine's own task *before* running the rest of
     # cleanup. That loop task is the one executing this exact code path when
     # stop() is triggered by an idle timeout (or "alone in channel"), so the
     # self-cancellation aborted everything after the next genuine suspension
@@ -113,9 +112,13 @@ async def test_idle_timeout_auto_stop_completes_full_cleanup(guild_state):
     guild_state.playlist.songs = []  # empty() -> True, so the STOPPED tick
     # goes through handle_idle() instead of trying to play a next song.
     guild_state.downloader.queue = [("song", MagicMock(), False)]
+    # A queued song normally holds off the idle countdown; pretend it isn't
+    # there so the timeout fires and we can check the queue gets cleared.
+    guild_state.downloader.busy = lambda: False
 
     guild_state.state_machine.set_state(State.STOPPED)
-    guild_state.state_machine.handle_state.start()
+    guild_state.state_machine.start()
+    task = guild_state.state_machine._task
     try:
         await asyncio.sleep(0.2)
 
@@ -124,8 +127,21 @@ async def test_idle_timeout_auto_stop_completes_full_cleanup(guild_state):
         assert guild_state.downloader.queue == []
         assert guild_state.state_machine.current == State.DISCONNECTED
     finally:
-        task = guild_state.state_machine.handle_state.get_task()
-        guild_state.state_machine.handle_state.cancel()
-        if task is not None:
-            with contextlib.suppress(asyncio.CancelledError):
-                await task
+        await guild_state.state_machine.stop()
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
+
+
+def test_idle_only_when_disconnected_with_nothing_queued(guild_state):
+    assert guild_state.idle()
+
+    guild_state.downloader.queue = [("song", MagicMock(), False)]
+    assert not guild_state.idle()
+    guild_state.downloader.queue = []
+
+    guild_state.player.voice_client = FakeVoiceClient()
+    assert not guild_state.idle()
+    guild_state.player.voice_client = None
+
+    guild_state.state_machine.set_state(State.STOPPED)
+    assert not guild_state.idle()
@@ -1,3 +1,5 @@
+import datetime
+
 import pytest
 from unittest.mock import AsyncMock, MagicMock
 
@@ -31,16 +33,17 @@ def mock_ctx():
 
 def make_db(hours_list):
     db = MagicMock()
-    db.get_all_user_hours = AsyncMock(return_value=hours_list)
+    db.get_top_user_hours = AsyncMock(return_value=hours_list)
     return db
 
 
 @pytest.mark.asyncio
-async def test_leaderboard_excludes_bot_and_sorts_top_five(
+async def test_leaderboard_asks_for_top_five_without_the_bot(
     leaderboard_cog, mock_bot, mock_ctx
 ):
-    hours = [(1, 5.0), (2, 20.0), (999, 999.0), (3, 1.0), (4, 15.0), (5, 3.0), (6, 8.0)]
-    mock_bot.get_cog.return_value = make_db(hours)
+    hours = [(2, 20.0), (4, 15.0), (6, 8.0), (1, 5.0), (5, 3.0)]
+    db = make_db(hours)
+    mock_bot.get_cog.return_value = db
 
     members = {}
     for uid in (2, 4, 6, 1, 5):
@@ -52,12 +55,12 @@ async def test_leaderboard_excludes_bot_and_sorts_top_five(
     await leaderboard_cog.leaderboard.callback(leaderboard_cog, mock_ctx)
 
     mock_bot.get_cog.assert_called_with("Database")
+    db.get_top_user_hours.assert_awaited_once_with(5, exclude_ids=(999,))
     sent_message = mock_ctx.send.await_args.args[0]
 
     assert "#1 user2" in sent_message
+    assert "#5 user5" in sent_message
     assert "20.0 hours" in sent_message
-    assert "999" not in sent_message
-    # Only the top 5 (by hours, bot excluded) should be listed.
     assert sent_message.count("**#") == 5
     mock_ctx.message.add_reaction.assert_awaited_once()
 
@@ -118,7 +121,7 @@ async def test_leaderboard_reports_error_and_reacts_error_when_db_raises(
     # must not leave the before_invoke ACK reaction stuck with no error
     # indicator.
     db = MagicMock()
-    db.get_all_user_hours = AsyncMock(side_effect=RuntimeError("db down"))
+    db.get_top_user_hours = AsyncMock(side_effect=RuntimeError("db down"))
     mock_bot.get_cog.return_value = db
 
     await leaderboard_cog.leaderboard.callback(leaderboard_cog, mock_ctx)
@@ -130,6 +133,65 @@ async def test_leaderboard_reports_error_and_reacts_error_when_db_raises(
     mock_ctx.message.add_reaction.assert_awaited_once_with("❌")
 
 
+@pytest.mark.asyncio
+async def test_leaderboard_week_reads_this_guilds_rollups(
+    leaderboard_cog, mock_bot, mock_ctx
+):
+    db = make_db([])
+    db.get_guild_top_user_hours = AsyncMock(return_value=[(1, 3.0), (2, 1.5)])
+    mock_bot.get_cog.return_value = db
+    mock_bot.get_user.side_effect = lambda uid: MagicMock()
+    mock_ctx.guild.id = 100
+
+    await leaderboard_cog.leaderboard.callback(leaderboard_cog, mock_ctx, "Week")
+
+    today = datetime.datetime.now(datetime.timezone.utc).date()
+    db.get_guild_top_user_hours.assert_awaited_once_with(
+        100, since_day=today - datetime.timedelta(days=6), limit=5
+    )
+    db.get_top_user_hours.assert_not_awaited()
+    sent_message = mock_ctx.send.await_args.args[0]
+    assert "Leaderboard (this server, last 7 days)" in sent_message
+    assert sent_message.count("**#") == 2
+
+
+@pytest.mark.asyncio
+async def test_leaderboard_server_reads_all_time_guild_totals(
+    leaderboard_cog, mock_bot, mock_ctx
+):
+    db = make_db([])
+    db.get_guild_top_user_hours = AsyncMock(return_value=[(1, 30.0)])
+    mock_bot.get_cog.return_value = db
+    mock_ctx.guild.id = 100
+
+    await leaderboard_cog.leaderboard.callback(leaderboard_cog, mock_ctx, "server")
+
+    db.get_guild_top_user_hours.assert_awaited_once_with(100, since_day=None, limit=5)
+
+
+@pytest.mark.asyncio
+async def test_leaderboard_guild_periods_need_a_server(
+    leaderboard_cog, mock_bot, mock_ctx
+):
+    mock_ctx.guild = None
+
+    await leaderboard_cog.leaderboard.callback(leaderboard_cog, mock_ctx, "week")
+
+    mock_ctx.send.assert_awaited_once_with(
+        "That leaderboard is only available in a server."
+    )
+    mock_bot.get_cog.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_leaderboard_rejects_unknown_period(leaderboard_cog, mock_bot, mock_ctx):
+    await leaderboard_cog.leaderboard.callback(leaderboard_cog, mock_ctx, "decade")
+
+    mock_ctx.send.assert_awaited_once_with(
+        "Unknown period. Use `all`, `server` or `week`."
+    )
+
+
 @pytest.mark.asyncio
 async def test_cog_setup():
     bot = MagicMock(spec=commands.Bot)
@@ -0,0 +1,79 @@
+import pytest
+
+from cogs.utils.music import sqlite_cache
+from cogs.utils.music.lyrics_cache import MISSING, LyricsCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = LyricsCache(
+        str(tmp_path / "lyrics.db"),
+        ttl_seconds=60,
+        negative_ttl_seconds=10,
+        max_entries=2,
+    )
+    yield cache
+    cache.close()
+
+
+def test_put_then_get_ignores_case_and_whitespace(cache):
+    cache.put("Daft Punk - One More Time", "one more time")
+
+    assert cache.get("  daft punk -  one more time ") == "one more time"
+    assert cache.stats() == {"hits": 1, "misses": 0}
+
+
+def test_get_miss_returns_missing(cache):
+    assert cache.get("never looked up") is MISSING
+    assert cache.stats()["misses"] == 1
+
+
+def test_no_lyrics_is_cached_as_none(cache):
+    cache.put("instrumental", None)
+
+    assert cache.get("instrumental") is None
+
+
+def test_no_lyrics_expires_sooner_than_lyrics(cache, monkeypatch):
+    now = 1_000_000.0
+    monkeypatch.setattr(sqlite_cache.time, "time", lambda: now)
+    cache.put("instrumental", None)
+    cache.put("song", "la la")
+
+    now += 11
+
+    assert cache.get("instrumental") is MISSING
+    assert cache.get("song") == "la la"
+
+    now += 50
+
+    assert cache.get("song") is MISSING
+
+
+def test_size_cap_evicts_least_recently_used(cache, monkeypatch):
+    now = 1_000_000.0
+    monkeypatch.setattr(sqlite_cache.time, "time", lambda: now)
+    cache.put("first", "a")
+    now += 1
+    cache.put("second", "b")
+    now += 1
+    cache.get("first")  # "second" is now the least recently used
+    now += 1
+    cache.put("third", "c")
+
+    assert cache.get("second") is MISSING
+    assert cache.get("first") == "a"
+    assert cache.get("third") == "c"
+
+
+def test_cache_persists_across_instances(tmp_path):
+    path = str(tmp_path / "lyrics.db")
+    first = LyricsCache(path)
+    first.put("some song", "la la")
+    first.close()
+
+    second = LyricsCache(path)
+    try:
+        assert second.get("some song") == "la la"
+    finally:
+        second.close()
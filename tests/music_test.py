@@ -1,5 +1,6 @@
 import asyncio
 import os
+import threading
 
 import pytest
 import pytest_asyncio
@@ -8,7 +9,7 @@ from unittest.mock import AsyncMock, MagicMock, patch
 import discord
 from discord.ext import commands
 
-from cogs.music import Music, delete_file, setup
+from cogs.music import Music, parse_timestamp, setup
 from cogs.utils.emojis import DONE, ERROR
 from cogs.utils.music.state_machine import State
 from tests.mocks import mock_ctx
@@ -39,7 +40,10 @@ async def bot(config):
 async def music_cog(bot, config):
     cog = Music(bot, config)
     await bot.add_cog(cog)
-    return cog
+    yield cog
+    cog.evict_idle_states.cancel()
+    cog.sweep_downloads.cancel()
+    await asyncio.sleep(0)
 
 
 def state_for(music_cog, ctx):
@@ -51,6 +55,70 @@ async def call(cmd, cog, ctx, **kwargs):
     await cmd.callback(cog, ctx, **kwargs)
 
 
+@pytest.mark.asyncio
+async def test_guild_states_share_one_set_of_services(music_cog):
+    first = music_cog.get_state(MagicMock(id=1))
+    second = music_cog.get_state(MagicMock(id=2))
+
+    services = music_cog.services
+    assert first.services is second.services is services
+    for state in (first, second):
+        assert state.downloader.youtube is services.youtube
+        assert state.downloader.genius is services.genius
+        assert state.downloader.spotify is services.spotify
+        assert state.downloader.scheduler is services.download_scheduler
+
+
+@pytest.mark.asyncio
+async def test_idle_guild_state_is_evicted_and_rebuilt_on_demand(music_cog, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("cogs.music.time.monotonic", lambda: now[0])
+    guild = MagicMock(id=1)
+    state = music_cog.get_state(guild)
+
+    await music_cog.evict_idle_states()
+    now[0] += music_cog.state_idle_seconds - 1
+    await music_cog.evict_idle_states()
+    assert music_cog.guild_states == {1: state}
+
+    now[0] += 1
+    await music_cog.evict_idle_states()
+    assert music_cog.guild_states == {}
+    assert music_cog.state_stats() == {"live": 0, "created": 1, "evicted": 1}
+
+    assert music_cog.get_state(guild) is not state
+    assert music_cog.state_stats()["live"] == 1
+
+
+@pytest.mark.asyncio
+async def test_guild_state_in_use_is_not_evicted(music_cog, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("cogs.music.time.monotonic", lambda: now[0])
+    state = music_cog.get_state(MagicMock(id=1))
+    state.downloader.queue = [("song", MagicMock(), False)]
+
+    await music_cog.evict_idle_states()
+    now[0] += music_cog.state_idle_seconds
+    await music_cog.evict_idle_states()
+
+    assert music_cog.guild_states == {1: state}
+
+
+@pytest.mark.asyncio
+async def test_using_a_guild_state_restarts_its_idle_clock(music_cog, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("cogs.music.time.monotonic", lambda: now[0])
+    guild = MagicMock(id=1)
+    music_cog.get_state(guild)
+
+    await music_cog.evict_idle_states()
+    now[0] += music_cog.state_idle_seconds
+    music_cog.get_state(guild)
+    await music_cog.evict_idle_states()
+
+    assert 1 in music_cog.guild_states
+
+
 # ---- play ----------------------------------------------------------------
 
 @pytest.mark.asyncio
@@ -205,6 +273,66 @@ async def test_resume_not_paused(music_cog, bot):
         fail.assert_awaited()
 
 
+# ---- seek ----------------------------------------------------------------
+
+@pytest.mark.asyncio
+async def test_seek_jumps_within_current_song(music_cog, bot):
+    ctx = mock_ctx(bot)
+    state = state_for(music_cog, ctx)
+    state.state_machine.get_state = MagicMock(return_value=State.PLAYING)
+    state.player.seek = MagicMock(return_value=90)
+    state.playlist.update_curr_song_message = AsyncMock()
+    with patch.object(music_cog, "cog_success", new_callable=AsyncMock) as ok:
+        await call(music_cog.seek, music_cog, ctx, position="1:30")
+        state.player.seek.assert_called_once_with(90)
+        state.playlist.update_curr_song_message.assert_awaited_once()
+        ok.assert_awaited_with(ctx.message)
+
+
+@pytest.mark.asyncio
+async def test_seek_rejects_malformed_position(music_cog, bot):
+    ctx = mock_ctx(bot)
+    state = state_for(music_cog, ctx)
+    state.player.seek = MagicMock()
+    with patch.object(music_cog, "cog_failure", new_callable=AsyncMock) as fail:
+        await call(music_cog.seek, music_cog, ctx, position="soon")
+        ctx.send.assert_awaited_with("Use a position like **1:30** or **90**.")
+        fail.assert_awaited()
+    state.player.seek.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_seek_not_playing(music_cog, bot):
+    ctx = mock_ctx(bot)
+    state = state_for(music_cog, ctx)
+    state.state_machine.get_state = MagicMock(return_value=State.STOPPED)
+    with patch.object(music_cog, "cog_failure", new_callable=AsyncMock) as fail:
+        await call(music_cog.seek, music_cog, ctx, position="30")
+        ctx.send.assert_awaited_with("DJ Khaled is not playing anything!")
+        fail.assert_awaited()
+
+
+@pytest.mark.asyncio
+async def test_seek_past_the_end(music_cog, bot):
+    ctx = mock_ctx(bot)
+    state = state_for(music_cog, ctx)
+    state.state_machine.get_state = MagicMock(return_value=State.PAUSED)
+    state.player.seek = MagicMock(return_value=None)
+    with patch.object(music_cog, "cog_failure", new_callable=AsyncMock) as fail:
+        await call(music_cog.seek, music_cog, ctx, position="99:00")
+        ctx.send.assert_awaited_with("That's past the end of the song!")
+        fail.assert_awaited()
+
+
+def test_parse_timestamp():
+    assert parse_timestamp("90") == 90
+    assert parse_timestamp("1:30") == 90
+    assert parse_timestamp("1:00:05") == 3605
+    assert parse_timestamp("-5") is None
+    assert parse_timestamp("1:2:3:4") is None
+    assert parse_timestamp("") is None
+
+
 # ---- lyrics --------------------------------------------------------------
 
 @pytest.mark.asyncio
@@ -517,63 +645,26 @@ async def test_states_are_per_guild(music_cog, bot):
 
 
 @pytest.mark.asyncio
-async def test_cleanup_files_does_not_delete_other_guilds_active_song(
-    music_cog, bot, tmp_path
-):
-    # Regression test: DOWNLOAD_DIR is shared by every guild, so cleanup
-    # triggered by guild A must not delete a file that guild B is actively
-    # using (playing or queued), even though guild A's cleanup call only
-    # knows about its own current song/queue.
-    guild_b = MagicMock(spec=discord.Guild)
-    guild_b.id = 2
-    state_b = music_cog.get_state(guild_b)
+async def test_sweep_downloads_runs_the_file_registry_sweep_off_the_event_loop(music_cog):
+    main_thread = threading.current_thread()
+    seen_thread = None
 
-    song_a_path = str(tmp_path / "song_a.mp3")
-    song_b_path = str(tmp_path / "song_b.mp3")
-    stale_path = str(tmp_path / "stale.mp3")
-    for path in (song_a_path, song_b_path, stale_path):
-        open(path, "w").close()
+    def sweep():
+        nonlocal seen_thread
+        seen_thread = threading.current_thread()
 
-    song_a = MagicMock()
-    song_a.path = song_a_path
-    song_b = MagicMock()
-    song_b.path = song_b_path
-    state_b.playlist.current_song = song_b
+    music_cog.services.file_registry.sweep = sweep
 
-    with patch("cogs.music.DOWNLOAD_DIR", str(tmp_path)):
-        music_cog.cleanup_files(song_a, [])
+    await music_cog.sweep_downloads()
 
-    assert os.path.exists(song_a_path)
-    assert os.path.exists(song_b_path)
-    assert not os.path.exists(stale_path)
+    assert seen_thread is not None and seen_thread is not main_thread
 
 
 @pytest.mark.asyncio
-async def test_cleanup_files_does_not_delete_pending_download(music_cog, bot, tmp_path):
-    # Regression test: a file can finish downloading before it's appended to
-    # any guild's playlist (e.g. a Spotify-sourced request still awaiting
-    # lyrics in Downloader.download_next_song()). Another guild's cleanup
-    # triggered in that window must not delete it.
-    song_a = MagicMock()
-    song_a.path = str(tmp_path / "song_a.mp3")
-    pending_path = str(tmp_path / "pending.mp3")
-    for path in (song_a.path, pending_path):
-        open(path, "w").close()
-
-    music_cog.pending_download_paths.add(pending_path)
+async def test_sweep_downloads_survives_a_failed_sweep(music_cog):
+    music_cog.services.file_registry.sweep = MagicMock(side_effect=OSError("disk gone"))
 
-    with patch("cogs.music.DOWNLOAD_DIR", str(tmp_path)):
-        music_cog.cleanup_files(song_a, [])
-
-    assert os.path.exists(pending_path)
-
-
-@pytest.mark.asyncio
-async def test_cleanup_files_noop_when_download_dir_missing(music_cog, tmp_path):
-    missing_dir = str(tmp_path / "does-not-exist")
-    with patch("cogs.music.DOWNLOAD_DIR", missing_dir):
-        # Must not raise even though os.listdir(missing_dir) would.
-        music_cog.cleanup_files(MagicMock(path="x"), [])
+    await music_cog.sweep_downloads()  # must not raise and kill the loop
 
 
 # ---- handle_forced_disconnect ---------------------------------------------
@@ -620,6 +711,22 @@ async def test_handle_forced_disconnect_skips_teardown_when_already_reconnected(
     state.teardown.assert_not_awaited()
 
 
+@pytest.mark.asyncio
+async def test_handle_voice_state_update_wakes_that_guilds_state_machine(music_cog):
+    guild = MagicMock(spec=discord.Guild)
+    guild.id = 42
+    state = music_cog.get_state(guild)
+    state.state_machine.notify = MagicMock()
+
+    music_cog.handle_voice_state_update(guild)
+    other = MagicMock(spec=discord.Guild)
+    other.id = 43
+    music_cog.handle_voice_state_update(other)
+
+    state.state_machine.notify.assert_called_once()
+    assert other.id not in music_cog.guild_states
+
+
 # ---- cog_success / cog_failure (real behavior, not mocked) ----------------
 
 @pytest.mark.asyncio
@@ -824,31 +931,14 @@ async def test_playlist_deletes_request_message_even_if_sent_message_delete_fail
     old_req.delete.assert_awaited_once()
 
 
-# ---- delete_file / setup module-level helpers ------------------------------
-
-def test_delete_file_removes_existing_file(tmp_path):
-    logger = MagicMock()
-    path = tmp_path / "song.mp3"
-    path.write_text("data")
-
-    delete_file(str(path), logger)
-
-    assert not path.exists()
-    logger.info.assert_called_once()
-
-
-def test_delete_file_logs_error_when_removal_fails(tmp_path):
-    logger = MagicMock()
-    missing_path = str(tmp_path / "does-not-exist.mp3")
-
-    delete_file(missing_path, logger)  # must not raise
-
-    logger.info.assert_called_once()
-    assert "Error deleting file" in logger.info.call_args.args[0]
-
+# ---- setup ----------------------------------------------------------------
 
 @pytest.mark.asyncio
 async def test_setup_adds_music_cog(bot):
     with patch("cogs.music.load_config", return_value={"prefix": "!", "secrets": {}}):
         await setup(bot)
-    assert bot.get_cog("Music") is not None
+    cog = bot.get_cog("Music")
+    assert cog is not None
+    await bot.remove_cog("Music")
+    await asyncio.sleep(0)
+    assert not cog.sweep_downloads.is_running()
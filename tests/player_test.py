@@ -1,4 +1,4 @@
-import threading
+from operator import attrgetter, itemgetter
 
 import pytest
 from unittest.mock import AsyncMock, MagicMock, patch
@@ -6,7 +6,8 @@ from unittest.mock import AsyncMock, MagicMock, patch
 import discord
 
 from cogs.models.song import Song
-from cogs.utils.music.player import Player
+from cogs.utils.music.player import STREAM_BEFORE_OPTIONS, Player
+from cogs.utils.music.song_queue import SongQueue
 from cogs.utils.music.state_machine import State
 
 
@@ -20,10 +21,10 @@ def make_song(path="song.mp3", message=None):
 def state():
     state = MagicMock()
     state.state_machine.get_state.return_value = State.STOPPED
-    state.playlist.songs = []
+    state.playlist.songs = SongQueue(message_of=attrgetter("message"))
     state.playlist.update_message = AsyncMock()
     state.playlist.send_song_embed = AsyncMock(return_value=MagicMock())
-    state.downloader.queue = []
+    state.downloader.queue = SongQueue(message_of=itemgetter(1))
     state.bot.get_cog.return_value = None
     return state
 
@@ -40,41 +41,28 @@ def player(state):
 async def test_play_starts_playback_and_saves_stats(player, state):
     song = make_song()
     db = MagicMock()
-    db.save_song = AsyncMock()
     state.bot.get_cog.return_value = db
 
     with patch.object(player, "play_audio") as play_audio:
         await player.play(song)
 
-    play_audio.assert_called_once_with(song.path)
+    play_audio.assert_called_once_with(song.path, 0.0)
     state.playlist.set_current_song.assert_called_once_with(song)
-    db.save_song.assert_awaited_once_with(song.info, song.message.author.id)
-    state.cleanup_files.assert_called_once_with(song, state.playlist.songs)
+    db.record_song_play.assert_called_once_with(song.info, song.message.author.id)
     assert song.messages_to_delete.count(song.message) == 1
 
 
 @pytest.mark.asyncio
-async def test_play_offloads_cleanup_files_off_the_event_loop_thread(player, state):
-    # Regression test: cleanup_files() does a directory scan plus per-file
-    # os.remove() - it must run via asyncio.to_thread (like every other
-    # blocking filesystem/DB call in this codebase), not directly on the
-    # event loop thread, or it stalls all guilds' commands/voice heartbeats
-    # on every song start.
+async def test_play_resumed_part_way_is_not_counted_again(player, state):
     song = make_song()
-    main_thread = threading.current_thread()
-    seen_thread = None
-
-    def fake_cleanup_files(current_song, queue):
-        nonlocal seen_thread
-        seen_thread = threading.current_thread()
-
-    state.cleanup_files = fake_cleanup_files
+    db = MagicMock()
+    state.bot.get_cog.return_value = db
 
-    with patch.object(player, "play_audio"):
-        await player.play(song)
+    with patch.object(player, "play_audio") as play_audio:
+        await player.play(song, 42.0)
 
-    assert seen_thread is not None
-    assert seen_thread is not main_thread
+    play_audio.assert_called_once_with(song.path, 42.0)
+    db.record_song_play.assert_not_called()
 
 
 @pytest.mark.asyncio
@@ -97,7 +85,7 @@ async def test_play_resets_stale_end_timestamp(player, state):
 async def test_play_does_not_log_stats_saved_when_database_unavailable(player, state):
     # Regression test: the "Song statistics saved" log line used to fire
     # unconditionally even when the Database cog wasn't loaded (get_cog
-    # returns None) and save_song was never called - falsely claiming the
+    # returns None) and the play was never recorded - falsely claiming the
     # stats were persisted.
     song = make_song()
     state.bot.get_cog.return_value = None
@@ -106,7 +94,7 @@ async def test_play_does_not_log_stats_saved_when_database_unavailable(player, s
         await player.play(song)
 
     assert not any(
-        "statistics saved" in call.args[0] for call in logger.info.call_args_list
+        "recorded" in call.args[0] for call in logger.info.call_args_list
     )
 
 
@@ -143,7 +131,7 @@ async def test_play_looped_song_does_not_duplicate_message_in_cleanup_list(
 @pytest.mark.asyncio
 async def test_play_does_not_mark_message_pending_download(player, state):
     song = make_song()
-    state.downloader.queue = [("other query", song.message, False)]
+    state.downloader.queue.append(("other query", song.message, False))
 
     with patch.object(player, "play_audio"):
         await player.play(song)
@@ -156,7 +144,7 @@ async def test_play_does_not_mark_message_pending_in_playlist(player, state):
     song = make_song()
     other = MagicMock()
     other.message = song.message
-    state.playlist.songs = [other]
+    state.playlist.songs.append(other)
 
     with patch.object(player, "play_audio"):
         await player.play(song)
@@ -167,6 +155,12 @@ async def test_play_does_not_mark_message_pending_in_playlist(player, state):
 # ---- play_audio --------------------------------------------------------
 
 
+def assert_plays(vc, player, source):
+    vc.play.assert_called_once()
+    assert vc.play.call_args.args[0].source is source
+    assert vc.play.call_args.kwargs == {"after": player._on_playback_end}
+
+
 def test_play_audio_starts_ffmpeg_playback(player):
     vc = MagicMock()
     player.voice_client = vc
@@ -174,10 +168,132 @@ def test_play_audio_starts_ffmpeg_playback(player):
         player.play_audio("path.mp3")
 
     ffmpeg.assert_called_once_with("path.mp3")
-    vc.play.assert_called_once_with(ffmpeg.return_value)
+    assert_plays(vc, player, ffmpeg.return_value)
     assert player.audio_source is ffmpeg.return_value
 
 
+def test_play_audio_passes_opus_files_through_without_transcoding(player):
+    vc = MagicMock()
+    player.voice_client = vc
+    with patch("cogs.utils.music.player.discord.FFmpegOpusAudio") as opus, patch(
+        "cogs.utils.music.player.discord.FFmpegPCMAudio"
+    ) as pcm:
+        player.play_audio("path.opus")
+
+    opus.assert_called_once_with("path.opus", codec="copy")
+    pcm.assert_not_called()
+    assert_plays(vc, player, opus.return_value)
+
+
+def test_play_audio_streams_urls_with_reconnect_options(player):
+    vc = MagicMock()
+    player.voice_client = vc
+    with patch("cogs.utils.music.player.discord.FFmpegPCMAudio") as ffmpeg:
+        player.play_audio("https://media.example/audio")
+
+    ffmpeg.assert_called_once_with(
+        "https://media.example/audio", before_options=STREAM_BEFORE_OPTIONS
+    )
+    assert_plays(vc, player, ffmpeg.return_value)
+
+
+def test_position_counts_frames_actually_read(player):
+    player.voice_client = MagicMock()
+    with patch("cogs.utils.music.player.discord.FFmpegPCMAudio") as ffmpeg:
+        ffmpeg.return_value.read.side_effect = [b"frame"] * 150 + [b""]
+        player.play_audio("path.mp3")
+    counted = player.voice_client.play.call_args.args[0]
+
+    assert player.position == 0
+    for _ in range(151):
+        counted.read()
+
+    assert player.position == pytest.approx(3.0)
+
+
+def test_position_is_zero_without_a_song(player):
+    assert player.position == 0
+
+
+def test_play_audio_at_an_offset_seeks_before_the_input(player):
+    player.voice_client = MagicMock()
+    with patch("cogs.utils.music.player.discord.FFmpegPCMAudio") as ffmpeg:
+        player.play_audio("path.mp3", 42.5)
+
+    ffmpeg.assert_called_once_with("path.mp3", before_options="-ss 42.500")
+    assert player.position == 42.5
+
+
+def start_song(player, state, duration=200):
+    player.voice_client = MagicMock()
+    song = MagicMock(source="path.mp3", duration_seconds=duration)
+    state.playlist.current_song = song
+    with patch("cogs.utils.music.player.discord.FFmpegPCMAudio"):
+        player.play_audio(song.source)
+    return player.voice_client.play.call_args.args[0]
+
+
+def test_seek_swaps_the_source_without_restarting_playback(player, state):
+    counted = start_song(player, state)
+    old_source = counted.source
+    with patch("cogs.utils.music.player.discord.FFmpegPCMAudio") as ffmpeg:
+        assert player.seek(60) == 60
+
+    ffmpeg.assert_called_once_with("path.mp3", before_options="-ss 60.000")
+    assert counted.source is ffmpeg.return_value
+    old_source.cleanup.assert_called_once()
+    player.voice_client.play.assert_called_once()
+    assert player.position == 60
+
+
+def test_seek_rejects_positions_past_the_end(player, state):
+    start_song(player, state, duration=200)
+
+    assert player.seek(200) is None
+
+
+def test_seek_noop_without_a_song(player, state):
+    state.playlist.current_song = None
+
+    assert player.seek(10) is None
+
+
+def test_voice_drop_counts_as_interrupted_but_song_end_does_not(player, state):
+    counted = start_song(player, state)
+    counted.source.read.side_effect = [b"frame", b""]
+
+    counted.read()
+    assert player.interrupted() is True
+
+    counted.read()
+    assert player.interrupted() is False
+
+
+@pytest.mark.asyncio
+async def test_skip_is_not_mistaken_for_an_interruption(player, state):
+    start_song(player, state)
+    player.voice_client.is_playing.return_value = True
+
+    await player.skip(MagicMock(delete=AsyncMock()))
+
+    assert player.interrupted() is False
+
+
+def test_resume_interrupted_restarts_current_song_at_last_position(player, state):
+    counted = start_song(player, state)
+    counted.frames = 500  # 10 seconds in
+    with patch.object(player, "play_audio") as play_audio:
+        assert player.resume_interrupted() is True
+
+    play_audio.assert_called_once_with("path.mp3", pytest.approx(10.0))
+
+
+def test_playback_end_wakes_the_state_machine_from_the_audio_thread(player, state):
+    player._on_playback_end(None)
+
+    state.state_machine.notify_threadsafe.assert_called_once()
+
+
 # ---- idle / handle_idle --------------------------------------------------
 
 
@@ -274,7 +390,7 @@ async def test_stop_disconnects_and_resets_state(player, state):
     vc.is_paused.return_value = False
     vc.disconnect = AsyncMock()
     player.voice_client = vc
-    state.playlist.clear = AsyncMock()
+    state.playlist.reset = AsyncMock()
 
     await player.stop()
 
@@ -282,7 +398,7 @@ async def test_stop_disconnects_and_resets_state(player, state):
     vc.disconnect.assert_awaited_once()
     assert player.voice_client is None
     state.state_machine.set_state.assert_called_once_with(State.DISCONNECTED)
-    state.playlist.clear.assert_awaited_once()
+    state.playlist.reset.assert_awaited_once()
     assert player.end_timestamp is None
     assert player.audio_source is None
 
@@ -301,7 +417,7 @@ async def test_stop_continues_if_disconnect_raises(player, state):
     vc.is_paused.return_value = False
     vc.disconnect = AsyncMock(side_effect=discord.DiscordException("boom"))
     player.voice_client = vc
-    state.playlist.clear = AsyncMock()
+    state.playlist.reset = AsyncMock()
 
     await player.stop()
 
@@ -1,6 +1,7 @@
 import pytest
 from unittest.mock import AsyncMock, MagicMock
 
+from cogs.utils.music.file_registry import FileRegistry
 from cogs.utils.music.playlist import Playlist
 from cogs.models.song import Song
 
@@ -103,7 +104,7 @@ async def test_add_appends_song_and_joins_voice_channel(playlist, state):
     state.player.join_voice_channel.assert_awaited_once_with(message)
     assert len(playlist.songs) == 1
     assert playlist.songs[0].title == "new song"
-    assert result is True
+    assert result is playlist.songs[0]
 
 
 @pytest.mark.asyncio
@@ -111,7 +112,7 @@ async def test_add_drops_song_when_join_voice_channel_fails(playlist, state):
     # Regression test: if the bot couldn't join voice (requester left, missing
     # permission, etc.), the song must not be queued - otherwise the state
     # machine later crashes trying to play with no voice client. The caller
-    # (downloader.download_next_song) relies on this return value to decide
+    # (the downloader's commit step) relies on this return value to decide
     # whether to react success or send a failure instead.
     state.player.join_voice_channel = AsyncMock(return_value=None)
     message = MagicMock()
@@ -119,20 +120,85 @@ async def test_add_drops_song_when_join_voice_channel_fails(playlist, state):
     result = await playlist.add("path", {"title": "new song"}, message)
 
     assert playlist.songs == []
-    assert result is False
+    assert result is None
 
 
 @pytest.mark.asyncio
-async def test_clear_resets_songs_and_current_state(playlist):
-    playlist.songs = [make_song()]
-    playlist.current_song = make_song()
-    playlist.last_song = make_song()
+async def test_clear_drops_the_queue_but_not_the_song_playing(playlist, state):
+    queued = make_song("queued")
+    playing = make_song("playing")
+    playlist.songs = [queued]
+    playlist.current_song = playing
+    playlist.last_song = playing
 
     await playlist.clear()
 
+    assert playlist.songs == []
+    assert playlist.current_song is playing
+    assert playlist.last_song is playing
+    state.release_audio.assert_called_once_with(queued.path)
+    assert not playing.audio_released
+
+
+@pytest.mark.asyncio
+async def test_clear_while_playing_keeps_the_file_until_the_song_ends(tmp_path):
+    # Regression test: `clear` used to release the playing song's file, so
+    # it could be deleted (or evicted) while ffmpeg still had it open.
+    path = tmp_path / "playing.mp3"
+    path.write_bytes(b"audio")
+    cache = MagicMock()
+    cache.owns.return_value = False
+    registry = FileRegistry(str(tmp_path), cache)
+    registry.track(str(path))
+    state = MagicMock()
+    state.release_audio = registry.release
+    playlist = Playlist(state)
+    playing = Song(str(path), {"title": "playing"}, MagicMock())
+    playlist.current_song = playing
+    playlist.last_song = playing
+
+    await playlist.clear()
+    assert path.exists()
+
+    await playlist.clear_last()  # the song finished
+    assert not path.exists()
+
+
+@pytest.mark.asyncio
+async def test_looped_song_keeps_its_file_between_plays(playlist, state):
+    song = make_song()
+    playlist.loop = True
+    playlist.current_song = song
+    playlist.last_song = song
+
+    await playlist.clear_last()
+    assert await playlist.get_next() is song
+    state.release_audio.assert_not_called()
+
+    playlist.loop = False
+    await playlist.get_next()
+    state.release_audio.assert_called_once_with(song.path)
+
+
+@pytest.mark.asyncio
+async def test_reset_releases_each_songs_audio_reference_once(playlist, state):
+    queued = make_song("queued")
+    playing = make_song("playing")
+    playlist.songs = [queued]
+    playlist.current_song = playing
+    playlist.last_song = playing
+
+    await playlist.reset()
+    # A second reset (e.g. stop after an idle clear_last) must not release
+    # the same songs again and drive another guild's reference to zero.
+    playlist.songs = [queued]
+    playlist.current_song = playing
+    await playlist.reset()
+
     assert playlist.songs == []
     assert playlist.current_song is None
     assert playlist.last_song is None
+    assert state.release_audio.call_count == 2
 
 
 def test_get_embed_when_empty(playlist):
@@ -208,22 +274,30 @@ async def test_send_song_embed_returns_none_and_logs_on_send_failure(playlist):
     assert song.embed_message is None
 
 
-def test_handle_index_shuffle_picks_within_range(playlist, monkeypatch):
+@pytest.mark.asyncio
+async def test_get_next_with_shuffle_picks_a_random_song(playlist, monkeypatch):
     playlist.shuffle = True
     playlist.songs = [make_song("a"), make_song("b"), make_song("c")]
-    monkeypatch.setattr("cogs.utils.music.playlist.random.randint", lambda a, b: 2)
+    monkeypatch.setattr(
+        "cogs.utils.music.song_queue.random.randrange", lambda n: n - 1
+    )
 
-    assert playlist._handle_index() == 2
+    next_song = await playlist.get_next()
 
+    assert next_song.title == "c"
+    assert [s.title for s in playlist.songs] == ["a", "b"]
 
-def test_handle_index_no_shuffle_or_empty_returns_zero(playlist):
-    playlist.shuffle = False
-    playlist.songs = [make_song("a")]
-    assert playlist._handle_index() == 0
 
+@pytest.mark.asyncio
+async def test_get_next_with_shuffle_plays_every_song_once(playlist):
     playlist.shuffle = True
-    playlist.songs = []
-    assert playlist._handle_index() == 0
+    songs = [make_song(str(i)) for i in range(10)]
+    playlist.songs = songs
+
+    played = [await playlist.get_next() for _ in songs]
+
+    assert sorted(played, key=id) == sorted(songs, key=id)
+    assert len(playlist.songs) == 0
 
 
 def test_set_last_song(playlist):
@@ -274,14 +348,15 @@ async def test_update_curr_song_message_noop_without_embed_message(playlist):
     song.current_seconds = 0
     song.embed_message = None
     playlist.current_song = song
+    playlist.state.player.position = 12.98
 
     await playlist.update_curr_song_message()
 
-    assert song.current_seconds > 0
+    assert song.current_seconds == 12
 
 
 @pytest.mark.asyncio
-async def test_update_curr_song_message_edits_existing_embed(playlist):
+async def test_update_curr_song_message_hands_the_edit_to_the_embed_updater(playlist):
     song = make_song()
     song.current_seconds = 0
     song.embed_message = MagicMock()
@@ -290,18 +365,10 @@ async def test_update_curr_song_message_edits_existing_embed(playlist):
 
     await playlist.update_curr_song_message()
 
-    song.embed_message.edit.assert_awaited_once()
-    assert "embed" in song.embed_message.edit.call_args.kwargs
-
-
-@pytest.mark.asyncio
-async def test_update_curr_song_message_swallows_edit_failure(playlist):
-    song = make_song()
-    song.embed_message = MagicMock()
-    song.embed_message.edit = AsyncMock(side_effect=Exception("message gone"))
-    playlist.current_song = song
-
-    await playlist.update_curr_song_message()  # must not raise
+    message, embed = playlist.state.update_embed.call_args.args
+    assert message is song.embed_message
+    assert embed.title == song.title
+    song.embed_message.edit.assert_not_awaited()
 
 
 @pytest.mark.asyncio
@@ -311,21 +378,12 @@ async def test_update_message_noop_without_sent_message(playlist):
 
 
 @pytest.mark.asyncio
-async def test_update_message_edits_sent_message_with_current_embed(playlist):
+async def test_update_message_hands_current_embed_to_the_embed_updater(playlist):
     playlist.sent_message = MagicMock()
-    playlist.sent_message.edit = AsyncMock()
     playlist.songs = [make_song("Queued")]
 
     await playlist.update_message()
 
-    playlist.sent_message.edit.assert_awaited_once()
-    embed = playlist.sent_message.edit.call_args.kwargs["embed"]
+    message, embed = playlist.state.update_embed.call_args.args
+    assert message is playlist.sent_message
     assert "Queued" in embed.description
-
-
-@pytest.mark.asyncio
-async def test_update_message_swallows_edit_failure(playlist):
-    playlist.sent_message = MagicMock()
-    playlist.sent_message.edit = AsyncMock(side_effect=Exception("message gone"))
-
-    await playlist.update_message()  # must not raise
@@ -0,0 +1,89 @@
+import pytest
+
+from cogs.utils.music import sqlite_cache
+from cogs.utils.music.resolve_cache import ResolveCache
+from cogs.utils.music.sqlite_cache import normalize_query
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = ResolveCache(str(tmp_path / "resolve.db"), ttl_seconds=60, max_entries=2)
+    yield cache
+    cache.close()
+
+
+def make_info(video_id):
+    return {
+        "id": video_id,
+        "extractor_key": "Youtube",
+        "webpage_url": f"https://www.youtube.com/watch?v={video_id}",
+        "title": f"title {video_id}",
+        "duration": 200,
+        "formats": [{"url": "https://example.com/stream"}],
+    }
+
+
+def test_normalize_query_ignores_case_and_whitespace():
+    assert normalize_query("  Daft Punk -   One More TIME ") == "daft punk - one more time"
+
+
+def test_put_then_get_round_trips_core_metadata(cache):
+    cache.put("Daft Punk - One More Time", make_info("abc"))
+
+    info = cache.get("daft punk - one more time")
+
+    assert info["id"] == "abc"
+    assert info["title"] == "title abc"
+    assert info["duration"] == 200
+    # The format list is large and short-lived; it's never persisted.
+    assert "formats" not in info
+    assert cache.stats() == {"hits": 1, "misses": 0}
+
+
+def test_get_miss_is_counted(cache):
+    assert cache.get("never searched") is None
+    assert cache.stats()["misses"] == 1
+
+
+def test_put_ignores_infos_without_a_video_url(cache):
+    cache.put("some query", {"title": "no id"})
+    assert cache.get("some query") is None
+
+
+def test_expired_entries_are_not_returned(cache, monkeypatch):
+    now = 1_000_000.0
+    monkeypatch.setattr(sqlite_cache.time, "time", lambda: now)
+    cache.put("some query", make_info("abc"))
+
+    now += 61
+
+    assert cache.get("some query") is None
+
+
+def test_size_cap_evicts_least_recently_used(cache, monkeypatch):
+    now = 1_000_000.0
+    monkeypatch.setattr(sqlite_cache.time, "time", lambda: now)
+    cache.put("first", make_info("a"))
+    now += 1
+    cache.put("second", make_info("b"))
+    now += 1
+    cache.get("first")  # "second" is now the least recently used
+    now += 1
+    cache.put("third", make_info("c"))
+
+    assert cache.get("second") is None
+    assert cache.get("first")["id"] == "a"
+    assert cache.get("third")["id"] == "c"
+
+
+def test_cache_persists_across_instances(tmp_path):
+    path = str(tmp_path / "resolve.db")
+    first = ResolveCache(path)
+    first.put("some query", make_info("abc"))
+    first.close()
+
+    second = ResolveCache(path)
+    try:
+        assert second.get("some query")["id"] == "abc"
+    finally:
+        second.close()
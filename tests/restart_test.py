@@ -33,7 +33,7 @@ async def test_restart_success_notifies_db_and_closes_bot(restart_cog, mock_bot)
     ctx = mock_ctx()
     db = MagicMock()
     db.set_startup_notification = AsyncMock()
-    mock_bot.get_cog.return_value = db
+    mock_bot.get_cog.side_effect = lambda name: {"Database": db}.get(name)
     mock_bot.close = AsyncMock()
 
     with patch("cogs.restart.subprocess.Popen") as mock_popen:
@@ -88,7 +88,7 @@ async def test_restart_still_closes_bot_when_db_notification_write_fails(
     ctx = mock_ctx()
     db = MagicMock()
     db.set_startup_notification = AsyncMock(side_effect=Exception("db gone"))
-    mock_bot.get_cog.return_value = db
+    mock_bot.get_cog.side_effect = lambda name: {"Database": db}.get(name)
     mock_bot.close = AsyncMock()
 
     with patch("cogs.restart.subprocess.Popen") as mock_popen:
@@ -107,3 +107,19 @@ async def test_cog_setup():
 
     await restart.setup(bot)
     bot.add_cog.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_restart_saves_music_sessions_before_closing(restart_cog, mock_bot):
+    ctx = mock_ctx()
+    music = MagicMock()
+    music.session_store.flush = AsyncMock()
+    mock_bot.get_cog.side_effect = lambda name: {"Music": music}.get(name)
+    mock_bot.close = AsyncMock()
+
+    with patch("cogs.restart.subprocess.Popen"):
+        await restart_cog.restart.callback(restart_cog, ctx)
+
+    music.session_store.flush.assert_awaited_once()
+    music.session_store.close.assert_called_once()
+    mock_bot.close.assert_awaited_once()
@@ -0,0 +1,44 @@
+from unittest.mock import patch
+
+from cogs.utils.music.services import MusicServices
+
+
+def make_config(**overrides):
+    return {"secrets": {}, **overrides}
+
+
+def test_youtube_client_uses_the_shared_caches(tmp_path):
+    with patch("cogs.utils.music.services.DOWNLOAD_DIR", str(tmp_path)):
+        services = MusicServices(make_config())
+    try:
+        assert services.youtube.cache is services.audio_cache
+        assert services.youtube.resolve_cache is services.resolve_cache
+    finally:
+        services.close()
+
+
+def test_config_sizes_the_shared_caches_and_scheduler(tmp_path):
+    config = make_config(
+        audio_cache_mb="2",
+        resolve_cache_max_entries="7",
+        download_concurrency="3",
+        spotify_cache_ttl_seconds="5",
+    )
+    with patch("cogs.utils.music.services.DOWNLOAD_DIR", str(tmp_path)):
+        services = MusicServices(config)
+    try:
+        assert services.audio_cache.max_bytes == 2 * 1024 * 1024
+        assert services.resolve_cache.max_entries == 7
+        assert services.download_scheduler.max_concurrent == 3
+        assert services.spotify.cache_ttl == 5
+    finally:
+        services.close()
+
+
+def test_close_shuts_down_the_download_executor(tmp_path):
+    with patch("cogs.utils.music.services.DOWNLOAD_DIR", str(tmp_path)):
+        services = MusicServices(make_config())
+
+    services.close()
+
+    assert services.download_scheduler.executor._shutdown
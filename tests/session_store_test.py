@@ -0,0 +1,288 @@
+import json
+from unittest.mock import AsyncMock, MagicMock
+
+import discord
+import pytest
+
+from cogs.models.song import Song
+from cogs.utils.music.audio_cache import AudioCache
+from cogs.utils.music.file_registry import FileRegistry
+from cogs.utils.music.guild_state import GuildMusicState
+from cogs.utils.music.session_store import SessionStore, restore, snapshot
+from cogs.utils.music.state_machine import State
+
+VOICE_CHANNEL_ID = 5
+TEXT_CHANNEL_ID = 10
+
+
+@pytest.fixture
+def cog(tmp_path):
+    cog = MagicMock()
+    cog.bot.wait_until_ready = AsyncMock()
+    cog.config = {
+        "secrets": {
+            "spotifyClientId": "x",
+            "spotifyClientSecret": "x",
+            "geniusApiKey": "x",
+        }
+    }
+    cog.services.audio_cache = AudioCache(str(tmp_path))
+    cog.services.file_registry = FileRegistry(str(tmp_path), cog.services.audio_cache)
+    cog.guild_states = {}
+    return cog
+
+
+def make_guild(voice_members, messages):
+    text_channel = MagicMock()
+    text_channel.id = TEXT_CHANNEL_ID
+
+    async def fetch_message(message_id):
+        if message_id not in messages:
+            raise discord.NotFound(MagicMock(status=404), "gone")
+        return messages[message_id]
+
+    text_channel.fetch_message = AsyncMock(side_effect=fetch_message)
+    voice_channel = MagicMock()
+    voice_channel.id = VOICE_CHANNEL_ID
+    voice_channel.members = voice_members
+    guild = MagicMock()
+    guild.id = 1
+    guild.get_channel.side_effect = {
+        VOICE_CHANNEL_ID: voice_channel,
+        TEXT_CHANNEL_ID: text_channel,
+    }.get
+    return guild, text_channel
+
+
+def make_message(message_id, channel):
+    message = MagicMock()
+    message.id = message_id
+    message.channel = channel
+    return message
+
+
+def make_state(cog, guild):
+    state = GuildMusicState(cog, guild, cog.services)
+    cog.guild_states[guild.id] = state
+    return state
+
+
+def cached_file(cog, tmp_path, key):
+    download = tmp_path / f"download-{key}"
+    download.write_bytes(b"audio")
+    return cog.services.audio_cache.store(key, str(download))
+
+
+def info(video_id):
+    return {
+        "id": video_id,
+        "extractor_key": "Youtube",
+        "title": f"Song {video_id}",
+        "original_url": f"https://youtu.be/{video_id}",
+        "duration": 200,
+        "formats": [{"url": "https://expiring.example"}],
+    }
+
+
+def connect(state):
+    voice_client = MagicMock()
+    voice_client.channel.id = VOICE_CHANNEL_ID
+    state.player.voice_client = voice_client
+    state.state_machine.set_state(State.PLAYING)
+
+
+def test_snapshot_is_none_without_a_voice_connection(cog):
+    guild, _ = make_guild([], {})
+    state = make_state(cog, guild)
+
+    assert snapshot(state) is None
+
+
+def test_snapshot_is_none_with_nothing_queued(cog):
+    guild, _ = make_guild([], {})
+    state = make_state(cog, guild)
+    connect(state)
+
+    assert snapshot(state) is None
+
+
+@pytest.mark.asyncio
+async def test_snapshot_records_queue_flags_and_position(cog, tmp_path):
+    guild, text_channel = make_guild([], {})
+    state = make_state(cog, guild)
+    connect(state)
+    message = make_message(100, text_channel)
+    path = cached_file(cog, tmp_path, "Youtube-a.mp3")
+    state.playlist.current_song = Song(path, info("a"), message, lyrics="la la")
+    state.playlist.songs = [Song(None, info("b"), message, stream_url="https://x")]
+    state.downloader.queue = [("next song", message, True)]
+    state.playlist.loop = True
+    state.player._frame_counter = MagicMock(start=30.0, frames=50)
+
+    record = snapshot(state)
+
+    assert record["voice_channel_id"] == VOICE_CHANNEL_ID
+    assert record["loop"] is True
+    assert record["position"] == 31.0
+    assert record["current"]["cache_key"] == "Youtube-a.mp3"
+    assert record["current"]["lyrics"] == "la la"
+    assert "formats" not in record["current"]["info"]
+    # Still streaming: there's no cached file to resume from.
+    assert record["songs"][0]["cache_key"] is None
+    assert record["queue"] == [
+        {
+            "query": "next song",
+            "channel_id": TEXT_CHANNEL_ID,
+            "message_id": 100,
+            "spotify": True,
+        }
+    ]
+
+
+@pytest.mark.asyncio
+async def test_flush_only_writes_what_changed(cog, tmp_path):
+    db = MagicMock()
+    db.save_music_session = AsyncMock()
+    db.save_music_session_position = AsyncMock()
+    db.delete_music_session = AsyncMock()
+    cog.bot.get_cog.return_value = db
+    guild, text_channel = make_guild([], {})
+    state = make_state(cog, guild)
+    connect(state)
+    path = cached_file(cog, tmp_path, "Youtube-a.mp3")
+    state.playlist.current_song = Song(path, info("a"), make_message(100, text_channel))
+    state.player._frame_counter = MagicMock(start=0.0, frames=0)
+    store = SessionStore(cog)
+
+    await store.flush()
+    await store.flush()
+    db.save_music_session.assert_awaited_once()
+    db.save_music_session_position.assert_not_awaited()
+
+    state.player._frame_counter.frames = 500
+    await store.flush()
+    db.save_music_session.assert_awaited_once()
+    db.save_music_session_position.assert_awaited_once_with(guild.id, 10.0)
+
+    state.player.voice_client = None
+    await store.flush()
+    await store.flush()
+    db.delete_music_session.assert_awaited_once_with(guild.id)
+
+
+@pytest.mark.asyncio
+async def test_restore_resumes_cached_songs_and_requeues_the_rest(cog, tmp_path):
+    messages = {}
+    guild, text_channel = make_guild([MagicMock(bot=False)], messages)
+    messages[100] = make_message(100, text_channel)
+    messages[101] = make_message(101, text_channel)
+    old = make_state(cog, guild)
+    connect(old)
+    current = Song(
+        cached_file(cog, tmp_path, "Youtube-a.mp3"), info("a"), messages[100]
+    )
+    current.embed_message = make_message(900, text_channel)
+    old.playlist.current_song = current
+    old.playlist.songs = [
+        Song(cached_file(cog, tmp_path, "Youtube-b.mp3"), info("b"), messages[100]),
+        Song(None, info("c"), messages[101], stream_url="https://x"),
+    ]
+    old.playlist.shuffle = True
+    old.downloader.queue = [("next song", messages[101], True)]
+    old.player._frame_counter = MagicMock(start=42.0, frames=0)
+    record = json.loads(json.dumps(snapshot(old)))
+
+    state = GuildMusicState(cog, guild, cog.services)
+
+    async def fake_connect(voice_channel):
+        connect(state)
+        state.state_machine.set_state(State.STOPPED)
+        return state.player.voice_client
+
+    state.player.connect = AsyncMock(side_effect=fake_connect)
+    state.player.play = AsyncMock()
+    state.downloader.schedule = MagicMock()
+    state.state_machine.start = MagicMock()
+
+    assert await restore(state, record) is True
+
+    song, offset = state.player.play.await_args.args
+    assert song.path == current.path and offset == 42.0
+    text_channel.get_partial_message.assert_called_once_with(900)
+    assert song.embed_message is text_channel.get_partial_message.return_value
+    assert [s.title for s in state.playlist.songs] == ["Song b"]
+    assert state.playlist.shuffle is True
+    assert state.downloader.queue == [
+        ("https://youtu.be/c", messages[101], False),
+        ("next song", messages[101], True),
+    ]
+    assert state.state_machine.get_state() == State.PLAYING
+    state.state_machine.start.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_restore_skips_a_channel_nobody_is_listening_in(cog, tmp_path):
+    guild, text_channel = make_guild([MagicMock(bot=True)], {})
+    state = make_state(cog, guild)
+    state.player.connect = AsyncMock()
+    record = {
+        "voice_channel_id": VOICE_CHANNEL_ID,
+        "current": None,
+        "songs": [],
+        "queue": [
+            {
+                "query": "q",
+                "channel_id": TEXT_CHANNEL_ID,
+                "message_id": 1,
+                "spotify": False,
+            }
+        ],
+    }
+
+    assert await restore(state, record) is False
+    state.player.connect.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_restore_releases_cache_references_when_voice_fails(cog, tmp_path):
+    messages = {}
+    guild, text_channel = make_guild([MagicMock(bot=False)], messages)
+    messages[100] = make_message(100, text_channel)
+    path = cached_file(cog, tmp_path, "Youtube-a.mp3")
+    cog.services.audio_cache.release(path)
+    state = make_state(cog, guild)
+    state.player.connect = AsyncMock(return_value=None)
+    song_record = {
+        "info": info("a"),
+        "cache_key": "Youtube-a.mp3",
+        "lyrics": None,
+        "channel_id": TEXT_CHANNEL_ID,
+        "message_id": 100,
+        "embed_message_id": None,
+    }
+    record = {
+        "voice_channel_id": VOICE_CHANNEL_ID,
+        "current": None,
+        "songs": [song_record],
+        "queue": [],
+    }
+
+    assert await restore(state, record) is False
+    assert cog.services.audio_cache._entries["Youtube-a.mp3"].refs == 0
+
+
+@pytest.mark.asyncio
+async def test_store_restore_deletes_sessions_it_cannot_resume(cog):
+    db = MagicMock()
+    db.get_music_sessions = AsyncMock(return_value=[(1, "{}", 0.0)])
+    db.delete_music_session = AsyncMock()
+    cog.bot.get_cog.return_value = db
+    cog.bot.get_guild.return_value = None
+    store = SessionStore(cog, interval=3600)
+
+    await store.restore()
+    await store.restore()
+
+    db.get_music_sessions.assert_awaited_once()
+    db.delete_music_session.assert_awaited_once_with(1)
+    store.close()
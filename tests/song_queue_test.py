@@ -0,0 +1,108 @@
+from operator import itemgetter
+
+import pytest
+
+from cogs.utils.music.song_queue import SongQueue
+
+
+def test_pop_is_fifo():
+    queue = SongQueue(["a", "b", "c"])
+
+    assert [queue.pop(), queue.pop(), queue.pop()] == ["a", "b", "c"]
+    assert not queue
+
+
+def test_pop_from_empty_queue_raises():
+    with pytest.raises(IndexError):
+        SongQueue().pop()
+    with pytest.raises(IndexError):
+        SongQueue().pop(shuffle=True)
+
+
+def test_shuffled_pops_take_every_item_exactly_once():
+    items = list(range(200))
+    queue = SongQueue(items)
+
+    popped = [queue.pop(shuffle=True) for _ in items]
+
+    assert sorted(popped) == items
+    assert len(queue) == 0
+
+
+def test_fifo_order_survives_shuffled_pops(monkeypatch):
+    queue = SongQueue(["a", "b", "c", "d"])
+    # The bag starts in insertion order; take "b" out of the middle.
+    monkeypatch.setattr("cogs.utils.music.song_queue.random.randrange", lambda n: 1)
+
+    assert queue.pop(shuffle=True) == "b"
+    assert list(queue) == ["a", "c", "d"]
+    assert queue[0] == "a"
+    assert queue.pop() == "a"
+    assert queue.peek() == "c"
+
+
+def test_items_queued_mid_shuffle_join_the_draw():
+    queue = SongQueue(["a"])
+    queue.pop(shuffle=True)
+    queue.append("b")
+    queue.append("c")
+
+    assert sorted([queue.pop(shuffle=True), queue.pop(shuffle=True)]) == ["b", "c"]
+
+
+def test_membership_tracks_duplicates():
+    queue = SongQueue(["a", "a"])
+
+    queue.pop()
+    assert "a" in queue
+    queue.pop()
+    assert "a" not in queue
+
+
+def test_has_message_counts_items_per_request_message():
+    message, other = object(), object()
+    queue = SongQueue(message_of=itemgetter(1))
+    queue.extend([("song 1", message), ("song 2", message)])
+
+    assert queue.has_message(message)
+    assert not queue.has_message(other)
+    queue.pop()
+    assert queue.has_message(message)
+    queue.pop(shuffle=True)
+    assert not queue.has_message(message)
+
+
+def test_first_and_indexing():
+    queue = SongQueue("abcde")
+
+    assert queue.first(3) == ["a", "b", "c"]
+    assert queue[2] == "c"
+    assert queue[-1] == "e"
+    with pytest.raises(IndexError):
+        queue[5]
+
+
+def test_compares_equal_to_a_list_of_its_items():
+    assert SongQueue(["a", "b"]) == ["a", "b"]
+    assert SongQueue() == []
+
+
+def test_clear_empties_every_index():
+    message = object()
+    queue = SongQueue([("song", message)], message_of=itemgetter(1))
+
+    queue.clear()
+
+    assert len(queue) == 0
+    assert ("song", message) not in queue
+    assert not queue.has_message(message)
+
+
+def test_fifo_order_is_compacted_after_many_shuffled_pops():
+    queue = SongQueue(range(1000))
+
+    for _ in range(900):
+        queue.pop(shuffle=True)
+
+    assert len(queue._order) <= 2 * len(queue) + 64
+    assert list(queue) == sorted(queue)
@@ -152,6 +152,14 @@ def test_time_since_upload_years_ago():
     assert song.time_since_upload == "2 years ago"
 
 
+def test_source_prefers_downloaded_file_over_stream_url():
+    song = Song(None, {}, MagicMock(), stream_url="https://media.example/audio")
+    assert song.source == "https://media.example/audio"
+
+    song.path = "downloads/Youtube-abc.mp3"
+    assert song.source == "downloads/Youtube-abc.mp3"
+
+
 def test_lyrics_defaults_to_none_and_reflects_constructor_arg():
     song = make_song()
     assert song.lyrics is None
@@ -159,6 +167,12 @@ def test_lyrics_defaults_to_none_and_reflects_constructor_arg():
     assert song.lyrics == "la la la"
 
 
+def test_lyrics_can_be_attached_after_construction():
+    song = make_song()
+    song.lyrics = "la la la"
+    assert song.lyrics == "la la la"
+
+
 def test_get_progress_bar_without_duration_shows_progress_only():
     song = make_song()
     song.current_seconds = 30
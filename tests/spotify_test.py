@@ -1,36 +1,72 @@
+import asyncio
+
 import pytest
-from unittest.mock import MagicMock, patch
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from cogs.api import spotify as spotify_module
+from cogs.api.spotify import SpotifyAPI, SpotifyError
+
+
+class FakeResponse:
+    def __init__(self, status=200, json_data=None, headers=None):
+        self.status = status
+        self._json = json_data
+        self.headers = headers or {}
+
+    def raise_for_status(self):
+        if self.status >= 400:
+            raise Exception(f"HTTP {self.status}")
+
+    async def json(self):
+        return self._json
+
+    async def __aenter__(self):
+        return self
 
-from cogs.api.spotify import SpotifyAPI
+    async def __aexit__(self, *args):
+        return False
+
+
+def token_response(token="tok", expires_in=3600):
+    return FakeResponse(json_data={"access_token": token, "expires_in": expires_in})
+
+
+@pytest.fixture
+def session():
+    session = MagicMock()
+    session.post = MagicMock(side_effect=lambda *a, **k: token_response())
+    with patch("cogs.api.spotify.get_session", return_value=session):
+        yield session
 
 
 @pytest.fixture
 def api():
-    with patch("cogs.api.spotify.SpotifyClientCredentials"), patch(
-        "cogs.api.spotify.spotipy.Spotify"
-    ):
-        return SpotifyAPI({"secrets": {"spotifyClientId": "id", "spotifyClientSecret": "secret"}})
+    return SpotifyAPI({"secrets": {"spotifyClientId": "id", "spotifyClientSecret": "secret"}})
+
+
+TRACK = {"artists": [{"name": "Daft Punk"}], "name": "One More Time"}
 
 
 @pytest.mark.asyncio
-async def test_get_track_name_strips_query_string(api):
-    api.spotify.track = MagicMock(
-        return_value={"artists": [{"name": "Daft Punk"}], "name": "One More Time"}
-    )
+async def test_get_track_name_strips_query_string(api, session):
+    session.get = MagicMock(return_value=FakeResponse(json_data=TRACK))
 
     result = await api.get_track_name("https://open.spotify.com/track/abc123?si=xyz")
 
-    api.spotify.track.assert_called_once_with("abc123")
+    assert session.get.call_args.args[0].endswith("/tracks/abc123")
+    assert session.get.call_args.kwargs["headers"] == {"Authorization": "Bearer tok"}
     assert result == "Daft Punk - One More Time"
 
 
 @pytest.mark.asyncio
-async def test_get_track_name_uses_first_artist_only(api):
-    api.spotify.track = MagicMock(
-        return_value={
-            "artists": [{"name": "First"}, {"name": "Second"}],
-            "name": "Collab Song",
-        }
+async def test_get_track_name_uses_first_artist_only(api, session):
+    session.get = MagicMock(
+        return_value=FakeResponse(
+            json_data={
+                "artists": [{"name": "First"}, {"name": "Second"}],
+                "name": "Collab Song",
+            }
+        )
     )
 
     result = await api.get_track_name("https://open.spotify.com/track/xyz")
@@ -39,12 +75,12 @@ async def test_get_track_name_uses_first_artist_only(api):
 
 
 @pytest.mark.asyncio
-async def test_get_track_name_falls_back_when_artists_empty(api):
+async def test_get_track_name_falls_back_when_artists_empty(api, session):
     # Regression test: a local file embedded in a playlist/album can report
     # an empty "artists" list - a direct [0] index would raise IndexError
     # and (for playlist/album imports) abort the entire batch on one track.
-    api.spotify.track = MagicMock(
-        return_value={"artists": [], "name": "Untitled Local File"}
+    session.get = MagicMock(
+        return_value=FakeResponse(json_data={"artists": [], "name": "Untitled Local File"})
     )
 
     result = await api.get_track_name("https://open.spotify.com/track/abc123")
@@ -52,89 +88,260 @@ async def test_get_track_name_falls_back_when_artists_empty(api):
     assert result == "Unknown Artist - Untitled Local File"
 
 
+# ---- token -------------------------------------------------------------
+
+
 @pytest.mark.asyncio
-async def test_get_playlist_songs_follows_pagination(api):
-    page1 = {
-        "items": [{"track": {"artists": [{"name": "A"}], "name": "Song A"}}],
-        "next": "page2",
+async def test_token_is_fetched_once_and_reused(api, session):
+    session.get = MagicMock(side_effect=lambda *a, **k: FakeResponse(json_data=TRACK))
+
+    await api.get_track_name("https://open.spotify.com/track/a")
+    await api.get_track_name("https://open.spotify.com/track/b")
+
+    session.post.assert_called_once()
+    assert session.post.call_args.kwargs["data"] == {"grant_type": "client_credentials"}
+    assert session.post.call_args.kwargs["headers"] == {
+        "Authorization": "Basic aWQ6c2VjcmV0"
     }
-    page2 = {
-        "items": [{"track": {"artists": [{"name": "B"}], "name": "Song B"}}],
-        "next": None,
+    assert api.token_refreshes == 1
+
+
+@pytest.mark.asyncio
+async def test_token_is_refreshed_ahead_of_expiry(api, session, monkeypatch):
+    session.get = MagicMock(side_effect=lambda *a, **k: FakeResponse(json_data=TRACK))
+    now = [1000.0]
+    monkeypatch.setattr(spotify_module.time, "monotonic", lambda: now[0])
+
+    await api.get_track_name("https://open.spotify.com/track/a")
+    now[0] += 3600 - spotify_module.TOKEN_REFRESH_MARGIN
+    await api.get_track_name("https://open.spotify.com/track/b")
+
+    assert session.post.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_concurrent_requests_share_one_token_fetch(api, session):
+    session.get = MagicMock(side_effect=lambda *a, **k: FakeResponse(json_data=TRACK))
+
+    await asyncio.gather(
+        *(api.get_track_name(f"https://open.spotify.com/track/{i}") for i in range(5))
+    )
+
+    session.post.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_revoked_token_is_replaced_and_the_request_retried(api, session):
+    session.get = MagicMock(
+        side_effect=[FakeResponse(status=401), FakeResponse(json_data=TRACK)]
+    )
+
+    result = await api.get_track_name("https://open.spotify.com/track/a")
+
+    assert result == "Daft Punk - One More Time"
+    assert session.post.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_rate_limited_request_waits_and_retries(api, session):
+    session.get = MagicMock(
+        side_effect=[
+            FakeResponse(status=429, headers={"Retry-After": "2"}),
+            FakeResponse(json_data=TRACK),
+        ]
+    )
+
+    with patch("cogs.api.spotify.asyncio.sleep", new_callable=AsyncMock) as sleep:
+        result = await api.get_track_name("https://open.spotify.com/track/a")
+
+    sleep.assert_awaited_once_with(2.0)
+    assert result == "Daft Punk - One More Time"
+
+
+@pytest.mark.asyncio
+async def test_missing_credentials_raise_a_spotify_error(session):
+    # Spotify is optional: a deployment without credentials still constructs
+    # the client (the Music cog always does) and only fails Spotify requests.
+    api = SpotifyAPI({"secrets": {}})
+
+    with pytest.raises(SpotifyError):
+        await api.get_track_name("https://open.spotify.com/track/a")
+    session.post.assert_not_called()
+
+
+# ---- response cache ----------------------------------------------------
+
+
+@pytest.mark.asyncio
+async def test_responses_are_cached(api, session):
+    session.get = MagicMock(side_effect=lambda *a, **k: FakeResponse(json_data=TRACK))
+
+    await api.get_track_name("https://open.spotify.com/track/a")
+    await api.get_track_name("https://open.spotify.com/track/a?si=other")
+
+    session.get.assert_called_once()
+    assert api.cache_hits == 1
+
+
+@pytest.mark.asyncio
+async def test_cached_responses_expire(session, monkeypatch):
+    api = SpotifyAPI(
+        {"secrets": {"spotifyClientId": "id", "spotifyClientSecret": "secret"}},
+        cache_ttl=10,
+    )
+    session.get = MagicMock(side_effect=lambda *a, **k: FakeResponse(json_data=TRACK))
+    now = [1000.0]
+    monkeypatch.setattr(spotify_module.time, "monotonic", lambda: now[0])
+
+    await api.get_track_name("https://open.spotify.com/track/a")
+    now[0] += 11
+    await api.get_track_name("https://open.spotify.com/track/a")
+
+    assert session.get.call_count == 2
+
+
+# ---- pagination --------------------------------------------------------
+
+
+def paged(pages):
+    """A fake ``_get`` serving one-track ``pages`` by offset."""
+
+    async def get(path, limit, offset, **params):
+        return pages[offset]
+
+    return AsyncMock(side_effect=get)
+
+
+async def collect(pages):
+    return [song async for page in pages for song in page]
+
+
+def playlist_page(*names, total):
+    return {
+        "items": [{"track": {"artists": [{"name": "A"}], "name": n}} for n in names],
+        "total": total,
     }
-    api.spotify.playlist_tracks = MagicMock(return_value=page1)
-    api.spotify.next = MagicMock(return_value=page2)
 
-    songs = await api.get_playlist_songs("https://open.spotify.com/playlist/plid?si=1")
 
-    api.spotify.playlist_tracks.assert_called_once_with("plid")
-    api.spotify.next.assert_called_once_with(page1)
-    assert songs == ["A - Song A", "B - Song B"]
+@pytest.mark.asyncio
+async def test_iter_playlist_songs_fetches_every_page(api, monkeypatch):
+    monkeypatch.setattr("cogs.api.spotify.PLAYLIST_PAGE_SIZE", 1)
+    api._get = paged([playlist_page("Song A", total=2), playlist_page("Song B", total=2)])
+
+    songs = await collect(
+        api.iter_playlist_songs("https://open.spotify.com/playlist/plid?si=1")
+    )
+
+    assert api._get.call_args_list[0].args == ("/playlists/plid/tracks",)
+    assert songs == ["A - Song A", "A - Song B"]
+
+
+@pytest.mark.asyncio
+async def test_iter_playlist_songs_yields_pages_in_order(api, monkeypatch):
+    monkeypatch.setattr("cogs.api.spotify.PLAYLIST_PAGE_SIZE", 1)
+    names = [f"Song {i}" for i in range(10)]
+    api._get = paged([playlist_page(n, total=10) for n in names])
+
+    pages = [page async for page in api.iter_playlist_songs("https://x/playlist/p")]
+
+    assert pages == [[f"A - {n}"] for n in names]
+
+
+@pytest.mark.asyncio
+async def test_iter_playlist_songs_does_not_fetch_past_the_limit(api, monkeypatch):
+    monkeypatch.setattr("cogs.api.spotify.PLAYLIST_PAGE_SIZE", 1)
+    api._get = paged([playlist_page(f"Song {i}", total=10) for i in range(10)])
+
+    songs = await collect(api.iter_playlist_songs("https://x/playlist/p", 3))
+
+    assert songs == ["A - Song 0", "A - Song 1", "A - Song 2"]
+    offsets = [c.kwargs["offset"] for c in api._get.call_args_list]
+    assert offsets == [0, 1, 2]
 
 
 @pytest.mark.asyncio
-async def test_get_playlist_songs_skips_removed_tracks(api):
+async def test_iter_playlist_songs_stops_requesting_when_closed_early(api, monkeypatch):
+    monkeypatch.setattr("cogs.api.spotify.PLAYLIST_PAGE_SIZE", 1)
+    monkeypatch.setattr("cogs.api.spotify.PAGE_CONCURRENCY", 2)
+    api._get = paged([playlist_page(f"Song {i}", total=50) for i in range(50)])
+
+    songs = api.iter_playlist_songs("https://x/playlist/p")
+    assert await songs.__anext__() == ["A - Song 0"]
+    assert await songs.__anext__() == ["A - Song 1"]
+    await songs.aclose()
+
+    # The first page, plus at most the fan-out window behind each page read.
+    assert api._get.call_count <= 4
+
+
+@pytest.mark.asyncio
+async def test_iter_playlist_songs_skips_removed_tracks(api):
     # Spotify represents a removed/unavailable playlist track as {"track": None}.
     page = {
         "items": [
             {"track": None},
             {"track": {"artists": [{"name": "A"}], "name": "Song A"}},
         ],
-        "next": None,
+        "total": 2,
     }
-    api.spotify.playlist_tracks = MagicMock(return_value=page)
+    api._get = AsyncMock(return_value=page)
 
-    songs = await api.get_playlist_songs("https://open.spotify.com/playlist/plid")
+    songs = await collect(
+        api.iter_playlist_songs("https://open.spotify.com/playlist/plid")
+    )
 
     assert songs == ["A - Song A"]
 
 
 @pytest.mark.asyncio
-async def test_get_playlist_songs_falls_back_when_track_artists_empty(api):
+async def test_iter_playlist_songs_falls_back_when_track_artists_empty(api):
     page = {
         "items": [{"track": {"artists": [], "name": "Local Track"}}],
-        "next": None,
+        "total": 1,
     }
-    api.spotify.playlist_tracks = MagicMock(return_value=page)
+    api._get = AsyncMock(return_value=page)
 
-    songs = await api.get_playlist_songs("https://open.spotify.com/playlist/plid")
+    songs = await collect(
+        api.iter_playlist_songs("https://open.spotify.com/playlist/plid")
+    )
 
     assert songs == ["Unknown Artist - Local Track"]
 
 
 @pytest.mark.asyncio
-async def test_get_album_songs_falls_back_when_artists_empty(api):
-    page = {"items": [{"artists": [], "name": "Local Track"}], "next": None}
-    api.spotify.album_tracks = MagicMock(return_value=page)
+async def test_iter_album_songs_falls_back_when_artists_empty(api):
+    page = {"items": [{"artists": [], "name": "Local Track"}], "total": 1}
+    api._get = AsyncMock(return_value=page)
 
-    songs = await api.get_album_songs("https://open.spotify.com/album/alid")
+    songs = await collect(api.iter_album_songs("https://open.spotify.com/album/alid"))
 
     assert songs == ["Unknown Artist - Local Track"]
 
 
-def test_init_does_not_raise_when_secrets_missing():
-    # Regression test: Spotify/Genius integration is optional. Downloader
-    # unconditionally constructs SpotifyAPI for every guild, so a direct
-    # `config["secrets"]["spotifyClientId"]` index (raising KeyError when the
-    # deployment skips the optional Spotify integration) used to break every
-    # music command, not just Spotify ones - matching every sibling API-key
-    # cog (football/formula1/ufc/steam/weather), this must use `.get(...)`.
-    with patch("cogs.api.spotify.SpotifyClientCredentials") as mock_creds, patch(
-        "cogs.api.spotify.spotipy.Spotify"
-    ):
-        SpotifyAPI({"secrets": {}})
+@pytest.mark.asyncio
+async def test_iter_album_songs_fetches_every_page(api, monkeypatch):
+    monkeypatch.setattr("cogs.api.spotify.ALBUM_PAGE_SIZE", 1)
+    api._get = paged(
+        [
+            {"items": [{"artists": [{"name": "A"}], "name": "Track 1"}], "total": 2},
+            {"items": [{"artists": [{"name": "A"}], "name": "Track 2"}], "total": 2},
+        ]
+    )
 
-    mock_creds.assert_called_once_with(client_id=None, client_secret=None)
+    songs = await collect(
+        api.iter_album_songs("https://open.spotify.com/album/alid?si=1")
+    )
 
+    assert api._get.call_args_list[0].args == ("/albums/alid/tracks",)
+    assert songs == ["A - Track 1", "A - Track 2"]
 
-@pytest.mark.asyncio
-async def test_get_album_songs_follows_pagination(api):
-    page1 = {"items": [{"artists": [{"name": "A"}], "name": "Track 1"}], "next": "page2"}
-    page2 = {"items": [{"artists": [{"name": "A"}], "name": "Track 2"}], "next": None}
-    api.spotify.album_tracks = MagicMock(return_value=page1)
-    api.spotify.next = MagicMock(return_value=page2)
 
-    songs = await api.get_album_songs("https://open.spotify.com/album/alid?si=1")
+def test_init_does_not_raise_when_secrets_missing():
+    # Regression test: Spotify/Genius integration is optional, and the Music
+    # cog constructs SpotifyAPI unconditionally - a direct
+    # `config["secrets"]["spotifyClientId"]` index (raising KeyError when the
+    # deployment skips the optional Spotify integration) used to break every
+    # music command, not just Spotify ones.
+    api = SpotifyAPI({"secrets": {}})
 
-    api.spotify.album_tracks.assert_called_once_with("alid")
-    assert songs == ["A - Track 1", "A - Track 2"]
+    assert api.client_id is None and api.client_secret is None
@@ -1,7 +1,15 @@
+import asyncio
+import contextlib
+import time
+
 import pytest
 from unittest.mock import AsyncMock, MagicMock
 
-from cogs.utils.music.state_machine import State, StateMachine
+from cogs.utils.music.state_machine import (
+    RECONNECT_GRACE_SECONDS,
+    State,
+    StateMachine,
+)
 
 
 def make_state_machine():
@@ -14,25 +22,20 @@ def make_state_machine():
     state.playlist.update_curr_song_message = AsyncMock()
     state.playlist.clear_last = AsyncMock()
     state.playlist.clear = AsyncMock()
+    state.playlist.reset = AsyncMock()
     state.playlist.get_next = AsyncMock(return_value=None)
 
     state.player.play = AsyncMock()
     state.player.handle_idle = AsyncMock()
+    state.player.end_timestamp = None
+    state.player.idle_timeout = 300
+    state.player.interrupted.return_value = False
+    state.bot.wait_until_ready = AsyncMock()
 
     sm = StateMachine(state)
     return sm, state
 
 
-@pytest.mark.asyncio
-async def test_before_handle_state_waits_until_bot_ready():
-    sm, state = make_state_machine()
-    state.bot.wait_until_ready = AsyncMock()
-
-    await sm.before_handle_state()
-
-    state.bot.wait_until_ready.assert_awaited_once()
-
-
 def test_get_state_returns_current_state():
     sm, _ = make_state_machine()
     sm.set_state(State.PAUSED)
@@ -59,62 +62,149 @@ def test_transition_to_rejects_invalid_transition():
     assert sm.current == State.DISCONNECTED
 
 
-def test_start_does_not_restart_running_loop():
+@contextlib.asynccontextmanager
+async def running(sm):
+    sm.start()
+    try:
+        yield
+    finally:
+        task = sm._task
+        await sm.stop()
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
+
+
+@pytest.mark.asyncio
+async def test_run_waits_until_bot_ready():
+    sm, state = make_state_machine()
+    ready = asyncio.Event()
+    state.bot.wait_until_ready = AsyncMock(side_effect=ready.wait)
+    sm._tick = AsyncMock()
+
+    async with running(sm):
+        await asyncio.sleep(0.01)
+        sm._tick.assert_not_awaited()
+
+        ready.set()
+        await asyncio.sleep(0.01)
+        sm._tick.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_start_does_not_start_a_second_task():
     sm, _ = make_state_machine()
-    sm.handle_state.is_running = MagicMock(return_value=True)
-    sm.handle_state.start = MagicMock()
+    sm._tick = AsyncMock()
+
+    async with running(sm):
+        task = sm._task
+        sm.start()
+
+        assert sm._task is task
 
+
+@pytest.mark.asyncio
+async def test_stop_cancels_running_task():
+    sm, _ = make_state_machine()
+    sm._tick = AsyncMock()
     sm.start()
+    task = sm._task
 
-    sm.handle_state.start.assert_not_called()
+    await sm.stop()
+    with contextlib.suppress(asyncio.CancelledError):
+        await task
+
+    assert task.cancelled()
+    assert sm._task is None
 
 
-def test_start_starts_stopped_loop():
+@pytest.mark.asyncio
+async def test_sleeps_until_notified_instead_of_polling():
     sm, _ = make_state_machine()
-    sm.handle_state.is_running = MagicMock(return_value=False)
-    sm.handle_state.start = MagicMock()
+    sm._tick = AsyncMock()
 
-    sm.start()
+    async with running(sm):
+        await asyncio.sleep(0.05)
+        assert sm.wakeups == 1
 
-    sm.handle_state.start.assert_called_once()
+        sm.notify()
+        await asyncio.sleep(0.01)
+        assert sm.wakeups == 2
 
 
 @pytest.mark.asyncio
-async def test_stop_cancels_running_loop():
+async def test_transition_wakes_the_state_machine():
     sm, _ = make_state_machine()
-    sm.handle_state.is_running = MagicMock(return_value=True)
-    sm.handle_state.cancel = MagicMock()
+    sm.set_state(State.PLAYING)
+    sm._tick = AsyncMock()
 
-    await sm.stop()
+    async with running(sm):
+        await asyncio.sleep(0.01)
+        wakeups = sm.wakeups
 
-    sm.handle_state.cancel.assert_called_once()
+        sm.transition_to(State.PAUSED)
+        await asyncio.sleep(0.01)
+
+        assert sm.wakeups == wakeups + 1
 
 
 @pytest.mark.asyncio
-async def test_tick_disconnected_state_is_a_no_op():
-    """The `case _` default branch: DISCONNECTED has nothing to advance."""
+async def test_idle_timeout_fires_from_its_deadline_without_events():
     sm, state = make_state_machine()
-    sm.set_state(State.DISCONNECTED)
+    sm.set_state(State.STOPPED)
     state.player.voice_client = None
+    state.playlist.empty.return_value = True
+    state.downloader.busy.return_value = False
+    state.player.idle.return_value = True
+    state.player.idle_timeout = 0.05
 
-    await sm._tick()
+    async def handle_idle():
+        if state.player.end_timestamp is None:
+            state.player.end_timestamp = time.time()
+        elif time.time() - state.player.end_timestamp >= state.player.idle_timeout:
+            await state.stop()
 
-    assert sm.current == State.DISCONNECTED
-    state.playlist.get_next.assert_not_awaited()
-    state.player.handle_idle.assert_not_awaited()
+    state.player.handle_idle = AsyncMock(side_effect=handle_idle)
+
+    async def stop():
+        state.player.end_timestamp = None
+        sm.set_state(State.DISCONNECTED)
+
+    state.stop = AsyncMock(side_effect=stop)
+
+    async with running(sm):
+        await asyncio.sleep(0.2)
+
+    state.stop.assert_awaited_once()
+    # Starting (begins the countdown), the deadline, then DISCONNECTED.
+    assert sm.wakeups == 3
 
 
 @pytest.mark.asyncio
-async def test_handle_state_loop_survives_a_tick_exception():
-    """A bare tasks.loop stops for good on the first unhandled exception -
-    handle_state's try/except must swallow it and log instead."""
+async def test_run_survives_a_tick_exception():
     sm, _ = make_state_machine()
     sm._tick = AsyncMock(side_effect=RuntimeError("boom"))
     sm.logger = MagicMock()
 
-    await sm.handle_state.coro(sm)
+    async with running(sm):
+        await asyncio.sleep(0.01)
+        sm.notify()
+        await asyncio.sleep(0.01)
 
-    sm.logger.exception.assert_called_once()
+    assert sm.logger.exception.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_tick_disconnected_state_is_a_no_op():
+    """The `case _` default branch: DISCONNECTED has nothing to advance."""
+    sm, state = make_state_machine()
+    sm.set_state(State.DISCONNECTED)
+    state.player.voice_client = None
+
+    await sm._tick()
+
+    assert sm.current == State.DISCONNECTED
+    state.playlist.get_next.assert_not_awaited()
+    state.player.handle_idle.assert_not_awaited()
 
 
 @pytest.mark.asyncio
@@ -126,19 +216,48 @@ async def test_tick_resets_to_disconnected_when_voice_client_lost():
     await sm._tick()
 
     assert sm.current == State.DISCONNECTED
-    state.playlist.clear.assert_awaited_once()
+    state.playlist.reset.assert_awaited_once()
 
 
 @pytest.mark.asyncio
-async def test_tick_resets_to_disconnected_when_voice_client_disconnected():
+async def test_tick_resets_to_disconnected_when_voice_client_stays_disconnected():
     sm, state = make_state_machine()
     sm.set_state(State.PAUSED)
     state.player.voice_client = MagicMock()
     state.player.voice_client.is_connected.return_value = False
 
+    # discord.py reconnects on its own; give it the grace period first.
+    await sm._tick()
+    assert sm.current == State.PAUSED
+    state.playlist.reset.assert_not_awaited()
+    assert 0 < sm._next_timeout() <= RECONNECT_GRACE_SECONDS
+
+    sm._reconnect_due = time.monotonic()
     await sm._tick()
 
     assert sm.current == State.DISCONNECTED
+    state.playlist.reset.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_tick_resumes_song_cut_off_by_a_voice_drop_once_reconnected():
+    sm, state = make_state_machine()
+    sm.set_state(State.PLAYING)
+    state.player.voice_client = MagicMock()
+    state.player.voice_client.is_connected.return_value = False
+    state.player.voice_client.channel = None
+    await sm._tick()
+
+    state.player.voice_client.is_connected.return_value = True
+    state.player.idle.return_value = True
+    state.player.interrupted.return_value = True
+    state.player.resume_interrupted.return_value = True
+    await sm._tick()
+
+    state.player.resume_interrupted.assert_called_once()
+    state.playlist.clear_last.assert_not_awaited()
+    assert sm.current == State.PLAYING
+    assert sm._reconnect_due is None
 
 
 @pytest.mark.asyncio
@@ -152,11 +271,28 @@ async def test_tick_playing_transitions_to_stopped_when_idle():
 
     await sm._tick()
 
-    state.playlist.update_curr_song_message.assert_awaited_once()
     state.playlist.clear_last.assert_awaited_once()
     assert sm.current == State.STOPPED
 
 
+@pytest.mark.asyncio
+async def test_tick_playing_refreshes_progress_only_when_due():
+    sm, state = make_state_machine()
+    sm.set_state(State.PLAYING)
+    state.player.voice_client = MagicMock()
+    state.player.voice_client.is_connected.return_value = True
+    state.player.voice_client.channel = None
+    state.player.idle.return_value = False
+
+    # An event (e.g. a song being queued) right after the song started.
+    await sm._tick()
+    state.playlist.update_curr_song_message.assert_not_awaited()
+
+    sm._progress_due = time.monotonic()
+    await sm._tick()
+    state.playlist.update_curr_song_message.assert_awaited_once()
+
+
 @pytest.mark.asyncio
 async def test_tick_playing_stays_playing_when_not_idle():
     sm, state = make_state_machine()
@@ -178,7 +314,7 @@ async def test_tick_stopped_counts_idle_when_playlist_empty_and_no_download_in_f
     sm.set_state(State.STOPPED)
     state.player.voice_client = None
     state.playlist.empty.return_value = True
-    state.downloader.process_queue.is_running.return_value = False
+    state.downloader.busy.return_value = False
 
     await sm._tick()
 
@@ -194,7 +330,7 @@ async def test_tick_stopped_skips_idle_countdown_while_download_in_flight():
     sm.set_state(State.STOPPED)
     state.player.voice_client = None
     state.playlist.empty.return_value = True
-    state.downloader.process_queue.is_running.return_value = True
+    state.downloader.busy.return_value = True
 
     await sm._tick()
 
@@ -12,6 +12,13 @@ def youtube_api(tmp_path, monkeypatch):
     return youtube_module.YouTubeAPI({"max_duration": "1200"})
 
 
+@pytest.fixture
+def passthrough_api(youtube_api):
+    import cogs.api.youtube as youtube_module
+
+    return youtube_module.YouTubeAPI({"max_duration": "1200", "audio_mode": "passthrough"})
+
+
 def make_ydl(extract_info_return):
     ydl = MagicMock()
     ydl.__enter__.return_value = ydl
@@ -20,47 +27,38 @@ def make_ydl(extract_info_return):
     return ydl
 
 
-@patch("cogs.api.youtube.yt_dlp.YoutubeDL")
-def test_is_video_playable_true_for_normal_video(mock_youtube_dl, youtube_api):
-    mock_youtube_dl.return_value = make_ydl({"duration": 200})
+def test_is_info_playable_true_for_normal_video(youtube_api):
+    assert youtube_api.is_info_playable({"duration": 200}) is True
 
-    assert youtube_api.is_video_playable("https://youtu.be/abc123") is True
 
-
-@patch("cogs.api.youtube.yt_dlp.YoutubeDL")
-def test_is_video_playable_false_when_too_long(mock_youtube_dl, youtube_api):
-    mock_youtube_dl.return_value = make_ydl({"duration": 5000})
-
-    assert youtube_api.is_video_playable("https://youtu.be/abc123") is False
+def test_is_info_playable_false_when_too_long(youtube_api):
+    assert youtube_api.is_info_playable({"duration": 5000}) is False
 
 
-@patch("cogs.api.youtube.yt_dlp.YoutubeDL")
-def test_is_video_playable_true_for_livestream_with_no_duration(
-    mock_youtube_dl, youtube_api
-):
+def test_is_info_playable_true_for_livestream_with_no_duration(youtube_api):
     # Livestreams report duration=None; that must not be treated as "too long".
-    mock_youtube_dl.return_value = make_ydl({"duration": None})
-
-    assert youtube_api.is_video_playable("https://youtu.be/live123") is True
+    assert youtube_api.is_info_playable({"duration": None}) is True
 
 
 @patch("cogs.api.youtube.yt_dlp.YoutubeDL")
-def test_is_video_playable_search_query_uses_first_entry(mock_youtube_dl, youtube_api):
+def test_resolve_search_query_uses_first_entry(mock_youtube_dl, youtube_api):
     mock_ydl = make_ydl({"entries": [{"duration": 100}, {"duration": 9999}]})
     mock_youtube_dl.return_value = mock_ydl
 
-    assert youtube_api.is_video_playable("some search text") is True
-    called_url = mock_ydl.extract_info.call_args.args[0]
-    assert called_url == "ytsearch:some search text"
+    assert youtube_api.resolve("some search text") == {"duration": 100}
+    mock_ydl.extract_info.assert_called_once_with(
+        "ytsearch:some search text", download=False
+    )
 
 
 @patch("cogs.api.youtube.yt_dlp.YoutubeDL")
-def test_is_video_playable_search_with_no_results_is_not_playable(
+def test_resolve_search_with_no_results_raises_lookup_error(
     mock_youtube_dl, youtube_api
 ):
     mock_youtube_dl.return_value = make_ydl({"entries": []})
 
-    assert youtube_api.is_video_playable("no results for this query") is False
+    with pytest.raises(LookupError):
+        youtube_api.resolve("no results for this query")
 
 
 @patch("cogs.api.youtube.yt_dlp.YoutubeDL")
@@ -111,7 +109,186 @@ def test_download_non_youtube_url_is_not_turned_into_a_search(
 
 
 @patch("cogs.api.youtube.yt_dlp.YoutubeDL")
-def test_download_resets_downloading_flag_on_exception(mock_youtube_dl, youtube_api):
+def test_resolve_and_download_extracts_metadata_only_once(mock_youtube_dl, youtube_api):
+    mock_ydl = make_ydl({"entries": [{"title": "first result", "duration": 100}]})
+    mock_ydl.process_ie_result.side_effect = lambda info, download: info
+    mock_youtube_dl.return_value = mock_ydl
+
+    file_path, info = youtube_api.resolve_and_download("some search text")
+
+    # The search round trip happens once; the download reuses its result.
+    mock_ydl.extract_info.assert_called_once_with(
+        "ytsearch:some search text", download=False
+    )
+    mock_ydl.process_ie_result.assert_called_once_with(
+        {"title": "first result", "duration": 100}, download=True
+    )
+    assert file_path.endswith(".mp3")
+    assert info["title"] == "first result"
+
+
+@patch("cogs.api.youtube.yt_dlp.YoutubeDL")
+def test_resolve_and_download_skips_download_when_too_long(
+    mock_youtube_dl, youtube_api
+):
+    mock_ydl = make_ydl({"entries": [{"title": "a long mix", "duration": 5000}]})
+    mock_youtube_dl.return_value = mock_ydl
+
+    assert youtube_api.resolve_and_download("some long mix") is None
+    mock_ydl.process_ie_result.assert_not_called()
+
+
+@patch("cogs.api.youtube.yt_dlp.YoutubeDL")
+def test_resolve_and_download_raises_lookup_error_for_no_results(
+    mock_youtube_dl, youtube_api
+):
+    mock_youtube_dl.return_value = make_ydl({"entries": []})
+
+    with pytest.raises(LookupError):
+        youtube_api.resolve_and_download("no results for this query")
+
+
+@patch("cogs.api.youtube.yt_dlp.YoutubeDL")
+def test_resolve_and_download_serves_cache_hit_without_downloading(
+    mock_youtube_dl, youtube_api
+):
+    mock_ydl = make_ydl(
+        {"entries": [{"id": "abc", "extractor_key": "Youtube", "duration": 100}]}
+    )
+    mock_youtube_dl.return_value = mock_ydl
+    youtube_api.cache = MagicMock()
+    youtube_api.cache.lookup.return_value = "downloads/Youtube-abc.mp3"
+
+    file_path, _ = youtube_api.resolve_and_download("some search text")
+
+    youtube_api.cache.lookup.assert_called_once_with("Youtube-abc.mp3")
+    assert file_path == "downloads/Youtube-abc.mp3"
+    mock_ydl.process_ie_result.assert_not_called()
+
+
+@patch("cogs.api.youtube.yt_dlp.YoutubeDL")
+def test_resolve_and_download_stores_cache_miss(mock_youtube_dl, youtube_api):
+    info = {"id": "abc", "extractor_key": "Youtube", "duration": 100}
+    mock_ydl = make_ydl({"entries": [info]})
+    mock_ydl.process_ie_result.side_effect = lambda info, download: info
+    mock_youtube_dl.return_value = mock_ydl
+    youtube_api.cache = MagicMock()
+    youtube_api.cache.lookup.return_value = None
+    youtube_api.cache.store.return_value = "downloads/Youtube-abc.mp3"
+
+    file_path, _ = youtube_api.resolve_and_download("some search text")
+
+    mock_ydl.process_ie_result.assert_called_once()
+    assert youtube_api.cache.store.call_args.args[0] == "Youtube-abc.mp3"
+    assert file_path == "downloads/Youtube-abc.mp3"
+
+
+@patch("cogs.api.youtube.yt_dlp.YoutubeDL")
+def test_resolve_and_download_skips_search_on_resolve_cache_hit(
+    mock_youtube_dl, youtube_api
+):
+    mock_ydl = make_ydl({"title": "fresh info", "duration": 100})
+    mock_youtube_dl.return_value = mock_ydl
+    youtube_api.resolve_cache = MagicMock()
+    youtube_api.resolve_cache.get.return_value = {
+        "id": "abc",
+        "webpage_url": "https://www.youtube.com/watch?v=abc",
+        "duration": 100,
+    }
+
+    with patch("cogs.api.youtube._reject_internal_urls"):
+        _, info = youtube_api.resolve_and_download("Artist - Title")
+
+    mock_ydl.extract_info.assert_called_once_with(
+        "https://www.youtube.com/watch?v=abc", download=True
+    )
+    assert info["title"] == "fresh info"
+    youtube_api.resolve_cache.put.assert_not_called()
+
+
+@patch("cogs.api.youtube.yt_dlp.YoutubeDL")
+def test_resolve_and_download_remembers_search_resolution(mock_youtube_dl, youtube_api):
+    resolved = {"id": "abc", "title": "first result", "duration": 100}
+    mock_ydl = make_ydl({"entries": [resolved]})
+    mock_ydl.process_ie_result.side_effect = lambda info, download: info
+    mock_youtube_dl.return_value = mock_ydl
+    youtube_api.resolve_cache = MagicMock()
+    youtube_api.resolve_cache.get.return_value = None
+
+    youtube_api.resolve_and_download("Artist - Title")
+
+    youtube_api.resolve_cache.put.assert_called_once_with("Artist - Title", resolved)
+
+
+@patch("cogs.api.youtube.yt_dlp.YoutubeDL")
+def test_resolve_and_download_never_caches_direct_urls(mock_youtube_dl, youtube_api):
+    mock_ydl = make_ydl({"id": "abc", "title": "a song", "duration": 100})
+    mock_ydl.process_ie_result.side_effect = lambda info, download: info
+    mock_youtube_dl.return_value = mock_ydl
+    youtube_api.resolve_cache = MagicMock()
+
+    with patch("cogs.api.youtube._reject_internal_urls"):
+        youtube_api.resolve_and_download("https://youtu.be/abc")
+
+    youtube_api.resolve_cache.get.assert_not_called()
+    youtube_api.resolve_cache.put.assert_not_called()
+
+
+@patch("cogs.api.youtube.yt_dlp.YoutubeDL")
+def test_resolve_for_streaming_returns_media_url_without_downloading(
+    mock_youtube_dl, youtube_api
+):
+    info = {"id": "abc", "duration": 100, "url": "https://media.example/audio"}
+    mock_ydl = make_ydl({"entries": [info]})
+    mock_youtube_dl.return_value = mock_ydl
+
+    file_path, resolved = youtube_api.resolve_for_streaming("some search text")
+
+    assert file_path is None
+    assert resolved["url"] == "https://media.example/audio"
+    mock_ydl.extract_info.assert_called_once_with(
+        "ytsearch:some search text", download=False
+    )
+    mock_ydl.process_ie_result.assert_not_called()
+
+
+@patch("cogs.api.youtube.yt_dlp.YoutubeDL")
+def test_resolve_for_streaming_re_extracts_resolve_cache_hits(
+    mock_youtube_dl, youtube_api
+):
+    # Cached resolutions carry no format list, so no media URL to stream.
+    mock_ydl = make_ydl({"id": "abc", "url": "https://media.example/audio"})
+    mock_youtube_dl.return_value = mock_ydl
+    youtube_api.resolve_cache = MagicMock()
+    youtube_api.resolve_cache.get.return_value = {
+        "id": "abc",
+        "webpage_url": "https://www.youtube.com/watch?v=abc",
+        "duration": 100,
+    }
+
+    with patch("cogs.api.youtube._reject_internal_urls"):
+        _, info = youtube_api.resolve_for_streaming("Artist - Title")
+
+    mock_ydl.extract_info.assert_called_once_with(
+        "https://www.youtube.com/watch?v=abc", download=False
+    )
+    assert info["url"] == "https://media.example/audio"
+
+
+@patch("cogs.api.youtube.yt_dlp.YoutubeDL")
+def test_passthrough_mode_keeps_native_opus(mock_youtube_dl, passthrough_api):
+    mock_youtube_dl.return_value = make_ydl({"entries": [{"title": "a song"}]})
+
+    file_path, _ = passthrough_api.download("some search text")
+
+    opts = mock_youtube_dl.call_args.args[0]
+    assert opts["format"].startswith("bestaudio[acodec=opus]")
+    assert opts["postprocessors"][0]["preferredcodec"] == "opus"
+    assert file_path.endswith(".opus")
+
+
+@patch("cogs.api.youtube.yt_dlp.YoutubeDL")
+def test_download_propagates_extraction_errors(mock_youtube_dl, youtube_api):
     mock_ydl = make_ydl(None)
     mock_ydl.extract_info.side_effect = Exception("network error")
     mock_youtube_dl.return_value = mock_ydl
@@ -119,15 +296,12 @@ def test_download_resets_downloading_flag_on_exception(mock_youtube_dl, youtube_
     with pytest.raises(Exception):
         youtube_api.download("https://youtu.be/abc123")
 
-    assert youtube_api.downloading is False
-
 
 @patch("cogs.api.youtube.yt_dlp.YoutubeDL")
 def test_download_rejects_url_resolving_to_private_ip(mock_youtube_dl, youtube_api, monkeypatch):
     # Regression test (SSRF): a URL that resolves to an internal/private
     # address (e.g. cloud metadata, LAN services) must be rejected before
-    # yt-dlp's generic extractor is allowed to fetch it, and the "downloading"
-    # guard flag must still be reset.
+    # yt-dlp's generic extractor is allowed to fetch it.
     import cogs.api.youtube as youtube_module
 
     monkeypatch.setattr(
@@ -140,12 +314,11 @@ def test_download_rejects_url_resolving_to_private_ip(mock_youtube_dl, youtube_a
     with pytest.raises(ValueError):
         youtube_api.download("https://metadata.internal/latest/meta-data/")
 
-    assert youtube_api.downloading is False
     mock_youtube_dl.return_value.extract_info.assert_not_called()
 
 
 @patch("cogs.api.youtube.yt_dlp.YoutubeDL")
-def test_is_video_playable_rejects_url_resolving_to_private_ip(
+def test_resolve_rejects_url_resolving_to_private_ip(
     mock_youtube_dl, youtube_api, monkeypatch
 ):
     import cogs.api.youtube as youtube_module
@@ -158,9 +331,8 @@ def test_is_video_playable_rejects_url_resolving_to_private_ip(
     mock_youtube_dl.return_value = make_ydl({"duration": 200})
 
     with pytest.raises(ValueError):
-        youtube_api.is_video_playable("https://localhost.example/secret")
+        youtube_api.resolve("https://localhost.example/secret")
 
-    assert youtube_api.downloading is False
     mock_youtube_dl.return_value.extract_info.assert_not_called()
 
 